@@ -1,16 +1,29 @@
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List
+import json
 import requests
 import time
 from api.models import AccountCreate, ProxySettings, ProxyTestResult
-from modules.uploader import test_instagram_connection, cleanup_session
+from modules.database import get_database_connection
+from modules.uploader import test_instagram_connection, cleanup_session, get_sessions_info
+from modules.rate_limiter import rate_limiter, RateLimitExceeded, get_proxy_key
 from services.proxy_monitoring_service import ProxyMonitoringService
 from core import account_exists, get_account_by_username
 
 router = APIRouter()
 
 
+def login_rate_limited(e: RateLimitExceeded) -> HTTPException:
+    """429 telling the client when the account may try to log in again"""
+    retry_after = int(e.retry_after) + 1
+    return HTTPException(
+        status_code=429,
+        detail=f"Login rate limit for @{e.username}, try again in {retry_after}s",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
 @router.get("/")
 async def get_accounts():
     """Get all Instagram accounts with proxy info - returns JSON directly"""
@@ -37,6 +50,9 @@ async def get_accounts():
             accounts = []
             rows = cursor.fetchall()
 
+            # Session health for every account from the session store's index
+            sessions = get_sessions_info([row[0] for row in rows])
+
             if rows:
                 for row in rows:
                     try:
@@ -68,7 +84,8 @@ async def get_accounts():
                             "proxy_host": proxy_host,
                             "proxy_port": proxy_port,
                             "proxy_status": proxy_status,
-                            "proxy_active": bool(proxy_active)
+                            "proxy_active": bool(proxy_active),
+                            "session": sessions.get(username)
                         }
                         accounts.append(account_dict)
                     except Exception as row_error:
@@ -100,11 +117,14 @@ async def create_account(account: AccountCreate):
             print(f"🧪 Testing Instagram login for @{account.username}")
 
             # Test connection and create session
-            login_success = test_instagram_connection(
-                username=account.username,
-                password=account.password,
-                two_fa_key=account.two_fa_key
-            )
+            try:
+                login_success = test_instagram_connection(
+                    username=account.username,
+                    password=account.password,
+                    two_fa_key=account.two_fa_key
+                )
+            except RateLimitExceeded as e:
+                raise login_rate_limited(e)
 
             if not login_success:
                 print(f"❌ Login verification failed for @{account.username}")
@@ -162,18 +182,20 @@ async def verify_account(username: str):
 
             print(f"🧪 Verifying Instagram login for @{username}")
 
-            # Clean up existing session first
-            cleanup_session(username)
-
-            # Test connection and create fresh session
-            login_success = test_instagram_connection(
-                username=account_username,
-                password=password,
-                two_fa_key=two_fa_key
-            )
+            # Log in with a fresh client; a successful login replaces the saved session
+            try:
+                login_success = test_instagram_connection(
+                    username=account_username,
+                    password=password,
+                    two_fa_key=two_fa_key
+                )
+            except RateLimitExceeded as e:
+                # Keep the current session; nothing was tried yet
+                raise login_rate_limited(e)
 
             if not login_success:
                 print(f"❌ Login verification failed for @{username}")
+                cleanup_session(username)
 
                 # Update account status to error
                 cursor.execute('''
@@ -403,6 +425,21 @@ async def get_account_proxy(username: str):
         raise HTTPException(status_code=500, detail=f"Failed to get proxy settings: {str(e)}")
 
 
+@router.get("/{username}/rate-limits")
+async def get_account_rate_limits(username: str):
+    """Get remaining upload/login budget for an account and its proxy"""
+    try:
+        if not account_exists(username):
+            raise HTTPException(status_code=404, detail="Account not found")
+
+        return rate_limiter.status(username, get_proxy_key(username))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get rate limits: {str(e)}")
+
+
 @router.post("/proxy/check-all")
 async def check_all_proxies():
     """Check health of all configured proxies"""
@@ -424,6 +461,16 @@ async def check_all_proxies():
         raise HTTPException(status_code=500, detail=f"Failed to check proxies: {str(e)}")
 
 
+@router.post("/proxy/check-all/stream")
+async def stream_proxy_checks():
+    """Check all proxies, streaming one JSON line per account as results arrive"""
+    async def results():
+        async for result in ProxyMonitoringService.iter_proxy_checks():
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 @router.get("/proxy/statistics")
 async def get_proxy_statistics():
     """Get proxy usage and performance statistics"""
@@ -435,4 +482,18 @@ async def get_proxy_statistics():
         raise HTTPException(status_code=500, detail=f"Failed to get proxy statistics: {str(e)}")
 
 
+@router.post("/proxy/auto-disable")
+async def auto_disable_failed_proxies(failure_threshold: int = None):
+    """Disable proxies that keep failing their health checks"""
+    try:
+        disabled = await ProxyMonitoringService.auto_disable_failed_proxies(failure_threshold)
+        return {
+            "message": f"Disabled proxies for {len(disabled)} accounts",
+            "disabled_accounts": disabled
+        }
+    except Exception as e:
+        print(f"Error auto-disabling proxies: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to auto-disable proxies: {str(e)}")
+
+
 # Remove duplicate proxy test function - use the one from proxy_utils instead
\ No newline at end of file
@@ -7,10 +7,11 @@ import uuid
 
 from api.models import FetchRequest, UploadRequest
 from modules.database import get_database_connection
-from modules.tasks import process_video_with_progress
-from modules.fetcher import fetch_videos_for_theme_from_accounts
+from modules.tasks import process_video_with_progress, fetch_videos_task
 from services.task_service import TaskService
+from services.cancellation_service import cancellation_service
 from core import safe_datetime_to_string
+from config.settings import settings
 
 router = APIRouter()
 
@@ -45,57 +46,26 @@ async def fetch_videos(request: FetchRequest):
             total_items=len(request.source_usernames)
         )
 
-        # Run fetch in background
+        # Run fetch in background; the worker reports progress under this task ID
         try:
-            new_videos = await fetch_videos_for_theme_from_accounts(
-                theme=request.theme,
-                fan_accounts=request.source_usernames,
-                videos_per_account=request.videos_per_account
+            fetch_videos_task.apply_async(
+                args=[request.theme, request.source_usernames, request.videos_per_account],
+                task_id=task_id
             )
-
-            # Save new videos to database
-            with get_database_connection() as conn:
-                cursor = conn.cursor()
-                inserted_count = 0
-
-                for video_link in new_videos:
-                    try:
-                        cursor.execute(
-                            "INSERT OR IGNORE INTO videos (link, theme, status) VALUES (?, ?, 'pending')",
-                            (video_link, request.theme)
-                        )
-                        if cursor.rowcount > 0:
-                            inserted_count += 1
-                    except Exception as e:
-                        print(f"Error inserting video {video_link}: {e}")
-                        continue
-
-                conn.commit()
-
-            await TaskService.log_task(
-                task_id=task_id,
-                task_type="fetch",
-                status="success",
-                message=f"Fetched {inserted_count} new videos for {request.theme}",
-                progress=100,
-                total_items=len(request.source_usernames)
-            )
-
-            return {
-                "success": True,
-                "task_id": task_id,
-                "message": f"Fetched {inserted_count} new videos",
-                "videos_count": inserted_count
-            }
-
         except Exception as e:
-            await TaskService.log_task(
+            await TaskService.update_task_status(
                 task_id=task_id,
-                task_type="fetch",
                 status="failed",
-                message=str(e)
+                message=f"Could not queue fetch task: {str(e)}"
             )
-            raise HTTPException(status_code=500, detail=f"Fetch failed: {str(e)}")
+            raise
+
+        return {
+            "success": True,
+            "task_id": task_id,
+            "message": f"Fetch task started for {len(request.source_usernames)} accounts",
+            "total_accounts": len(request.source_usernames)
+        }
 
     except HTTPException:
         raise
@@ -172,6 +142,28 @@ async def upload_videos(request: UploadRequest):
         raise HTTPException(status_code=500, detail=f"Failed to start upload task: {str(e)}")
 
 
+@router.get("/scheduler")
+async def get_scheduler_plan():
+    """Preview what the upload scheduler would start for each active account"""
+    try:
+        from services.scheduler_service import upload_scheduler
+        result = await upload_scheduler.run_once(dry_run=True)
+        result["enabled"] = settings.scheduler_enabled
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build scheduler plan: {str(e)}")
+
+
+@router.post("/scheduler/run")
+async def run_scheduler():
+    """Run one upload scheduler pass now"""
+    try:
+        from services.scheduler_service import upload_scheduler
+        return await upload_scheduler.run_once()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Scheduler run failed: {str(e)}")
+
+
 @router.get("/")
 async def get_tasks(status: Optional[str] = None, limit: int = 50):
     """Get task logs - returning plain JSON to avoid Pydantic validation"""
@@ -306,6 +298,10 @@ async def cancel_task(task_id: str):
         if task.status != "running":
             return {"message": f"Task {task_id} is not running (status: {task.status})"}
 
+        # Running workers are told through Redis; don't report a cancel that wasn't delivered
+        if not cancellation_service.publish(task_id):
+            raise HTTPException(status_code=503, detail="Could not deliver the cancellation, try again")
+
         await TaskService.update_task_status(
             task_id=task_id,
             status="cancelled",
@@ -3,6 +3,7 @@ from fastapi.responses import JSONResponse
 from typing import List, Optional
 from datetime import datetime
 from core import safe_datetime_to_string, get_videos_by_theme, video_exists, count_records
+from modules.database import get_upload_queue, QUEUE_SCORES
 
 router = APIRouter()
 
@@ -43,6 +44,27 @@ async def get_videos(theme: Optional[str] = None, limit: int = 100):
         return JSONResponse(content=[])
 
 
+@router.get("/queue")
+async def get_upload_queue_for_theme(theme: str, limit: int = 10, score: Optional[str] = None,
+                                     account: Optional[str] = None):
+    """Get the best pending videos for a theme, ranked by views, likes, recency or trending"""
+    from core.security import validate_theme, validate_username
+    if not validate_theme(theme):
+        raise HTTPException(status_code=400, detail="Invalid theme name")
+
+    if account and not validate_username(account):
+        raise HTTPException(status_code=400, detail="Invalid account username")
+
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="Limit must be between 1 and 1000")
+
+    if score and score not in QUEUE_SCORES:
+        raise HTTPException(status_code=400, detail=f"Invalid score. Must be one of: {list(QUEUE_SCORES)}")
+
+    videos = get_upload_queue(theme, k=limit, score=score, username=account)
+    return JSONResponse(content=videos)
+
+
 @router.delete("/{video_link:path}")
 async def delete_video(video_link: str):
     """Delete a specific video by link"""
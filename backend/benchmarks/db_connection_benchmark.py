@@ -0,0 +1,78 @@
+"""
+Benchmark: per-call SQLite connect vs. pooled get_database_connection().
+
+Runs the same small progress-style UPDATE through both code paths and prints
+connections (checkouts) per second for each.
+
+Usage:
+    python benchmarks/db_connection_benchmark.py [iterations]
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DB_FILE = os.path.join(tempfile.mkdtemp(prefix="db_bench_"), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+os.environ.setdefault("TELEGRAM_TOKEN", "benchmark")
+os.environ.setdefault("TELEGRAM_CHAT_ID", "benchmark")
+
+import core  # noqa: E402,F401  (core must be imported before modules.database)
+from modules.database import init_database, get_database_connection, get_connection_pool  # noqa: E402
+
+
+@contextmanager
+def legacy_connection():
+    """The previous get_database_connection(): new connection and PRAGMAs per call."""
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def run(connection_factory, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        with connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE task_logs SET progress = ?, current_item = ? WHERE id = ?",
+                (i, f"Video {i}", "bench-task")
+            )
+            conn.commit()
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    init_database()
+    with get_database_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO task_logs (id, task_type, status) VALUES ('bench-task', 'upload', 'running')"
+        )
+        conn.commit()
+
+    legacy_rate = run(legacy_connection, iterations)
+    pooled_rate = run(get_database_connection, iterations)
+
+    print(f"Iterations:           {iterations}")
+    print(f"Per-call connect:     {legacy_rate:10.0f} connections/s")
+    print(f"Pooled connection:    {pooled_rate:10.0f} connections/s")
+    print(f"Speedup:              {pooled_rate / legacy_rate:10.1f}x")
+    print(f"Pool stats:           {get_connection_pool().stats}")
+
+
+if __name__ == "__main__":
+    main()
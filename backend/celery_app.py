@@ -20,7 +20,13 @@ app.conf.update(
     timezone='UTC',
     enable_utc=True,
     task_acks_late=False,
-    broker_connection_retry_on_startup=True
+    broker_connection_retry_on_startup=True,
+    beat_schedule={
+        'schedule-uploads': {
+            'task': 'modules.tasks.schedule_uploads',
+            'schedule': settings.scheduler_interval
+        }
+    }
 )
 
 app.autodiscover_tasks(['modules.tasks'])
\ No newline at end of file
@@ -15,6 +15,8 @@ class Settings(BaseSettings):
 
     # Database
     database_url: str = "sqlite:///./instagram_bot.db"
+    db_statement_cache_size: int = 256
+    db_health_check_interval: float = 30.0
 
     # Redis
     redis_url: str = "redis://localhost:6379/0"
@@ -22,6 +24,9 @@ class Settings(BaseSettings):
     # External APIs
     telegram_token: str
     telegram_chat_id: str
+    telegram_digest_interval: float = 30.0  # Per-account updates are merged into one message this often
+    telegram_chat_interval: float = 3.0  # Telegram allows about 20 messages per minute per chat
+    telegram_queue_size: int = 1000
     ms_tokens: str = ""
 
     # Security
@@ -33,16 +38,76 @@ class Settings(BaseSettings):
 
     # File paths
     videos_dir: str = "./videos"
+    video_store_max_mb: int = 5120
     sessions_dir: str = "./sessions"
+    session_store: str = "file"  # Instagram sessions: "file" (sessions_dir) or "sqlite"
     logs_dir: str = "./logs"
 
     # Selenium settings - исправляем парсинг
     chrome_options: str = "--headless,--no-sandbox,--disable-dev-shm-usage,--disable-gpu,--disable-software-rasterizer"
+    browser_pool_size: int = 2
+    browser_max_uses: int = 50
+    browser_debug_port_base: int = 9222
+    snaptik_wait_timeout: int = 20
+    download_link_cache_ttl: int = 1800  # Resolved CDN links expire; keep well inside that
+    download_link_cache_size: int = 1024
+    download_attempts: int = 3  # Tries per download; each resumes where the last one stopped
+    download_pool_size: int = 16  # Pooled connections per host for video downloads
+
+    # Route downloads and SnapTik browsers through the healthy account proxies
+    download_proxy_routing: bool = True
+    download_proxy_include_direct: bool = True  # The host IP takes a share too
+    download_proxy_refresh_interval: int = 60
+    download_proxy_failure_cooldown: int = 300
 
     # Celery settings
     celery_broker_url: Optional[str] = None
     celery_result_backend: Optional[str] = None
 
+    # Task progress
+    progress_flush_interval: float = 2.0
+
+    # Upload pipeline: download the next videos of a job while the current one uploads and cools down
+    upload_prefetch_depth: int = 1  # 0 turns prefetching off
+    upload_prefetch_workers: int = 2
+
+    # Upload queue ranking: views, likes, recency or trending (views with age decay)
+    upload_queue_score: str = "views"
+    upload_queue_half_life_hours: float = 48.0
+
+    # Logged-in instagrapi clients kept per worker
+    instagram_client_cache_size: int = 32
+    instagram_client_idle_ttl: int = 1800
+    instagram_client_validate_after: int = 600  # Re-check the session only after this much quiet
+
+    # Instagram rate limits (token buckets in Redis): burst size and refill per hour
+    rate_limit_upload_burst: float = 1
+    rate_limit_upload_per_hour: float = 4
+    rate_limit_login_burst: float = 2
+    rate_limit_login_per_hour: float = 3
+    rate_limit_proxy_burst: float = 10
+    rate_limit_proxy_per_hour: float = 40  # Shared by every account behind one proxy
+    rate_limit_max_wait: int = 60  # Longest a worker blocks for a token before rescheduling
+
+    # Upload scheduler (runs from Celery beat)
+    scheduler_enabled: bool = False
+    scheduler_interval: int = 60
+    scheduler_daily_cap: int = 5
+    scheduler_account_cooldown: int = 1800  # Minimum gap between one account's jobs
+    scheduler_batch_size: int = 3
+    scheduler_stale_job_after: int = 7200  # A running job quiet this long (past any cooldown) no longer blocks its account
+
+    # Proxy health checks
+    proxy_check_concurrency: int = 50  # Distinct proxies tested at once
+    proxy_check_timeout: float = 5.0  # Per request through the proxy
+    proxy_health_window: int = 50  # Recent checks per proxy used for percentiles and success rate
+    proxy_health_min_samples: int = 5  # Checks needed before the success rate counts
+    proxy_health_max_age: int = 60  # Seconds a cached window is used before it is re-read from proxy_checks
+    proxy_min_success_rate: float = 0.5
+    proxy_failure_threshold: int = 3  # Consecutive failed checks before a proxy is disabled
+    proxy_auto_disable: bool = False  # Disable failing proxies after every full sweep
+    proxy_checks_retention_days: int = 14
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
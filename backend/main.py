@@ -18,7 +18,7 @@ from api.stats import router as stats_router
 from api.tiktok_sources import router as tiktok_sources_router
 
 # Import existing modules for initialization
-from modules.database import init_database
+from modules.database import init_database, close_database_connections
 
 # Setup logging first
 setup_logging()
@@ -236,6 +236,7 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down Instagram Bot API")
+    close_database_connections()
 
 # Применяем lifespan к приложению
 app.router.lifespan_context = lifespan
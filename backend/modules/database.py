@@ -1,4 +1,8 @@
+import heapq
 import sqlite3
+import threading
+import time
+import weakref
 from contextlib import contextmanager
 from config.settings import settings
 from core.logging import get_logger
@@ -6,14 +10,45 @@ from core.logging import get_logger
 logger = get_logger("database")
 
 
-@contextmanager
-def get_database_connection():
-    """Get SQLite database connection context manager with better error handling."""
-    conn = None
-    try:
-        # SQLite connection
-        db_path = settings.database_url.replace('sqlite:///', '')
-        conn = sqlite3.connect(db_path)
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection that carries the bookkeeping needed by the pool."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+        self.depth = 0
+
+
+class SQLiteConnectionPool:
+    """Pool of long-lived SQLite connections, one per thread (or greenlet under gevent).
+
+    PRAGMAs are applied once when a connection is opened instead of on every
+    checkout, and the per-connection statement cache is kept warm because the
+    connection survives between calls. Connections idle for longer than
+    ``health_check_interval`` seconds are validated with ``SELECT 1`` and
+    transparently reopened if the check fails.
+    """
+
+    def __init__(self, db_path: str, statement_cache_size: int = 256, health_check_interval: float = 30.0):
+        self.db_path = db_path
+        self.statement_cache_size = statement_cache_size
+        self.health_check_interval = health_check_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = weakref.WeakSet()
+        self.stats = {
+            "opened": 0,
+            "reused": 0,
+            "health_check_failures": 0
+        }
+
+    def _open(self) -> PooledConnection:
+        conn = sqlite3.connect(
+            self.db_path,
+            factory=PooledConnection,
+            cached_statements=self.statement_cache_size,
+            check_same_thread=False  # Ownership is enforced by the thread-local slot
+        )
         conn.row_factory = sqlite3.Row
         # Enable foreign key constraints
         conn.execute("PRAGMA foreign_keys = ON")
@@ -22,21 +57,124 @@ def get_database_connection():
         # Set synchronous mode for better performance/safety balance
         conn.execute("PRAGMA synchronous = NORMAL")
 
+        with self._lock:
+            self._connections.add(conn)
+            self.stats["opened"] += 1
+        return conn
+
+    def _is_healthy(self, conn: PooledConnection) -> bool:
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            logger.warning("Pooled connection failed health check", error=str(e))
+            with self._lock:
+                self.stats["health_check_failures"] += 1
+            return False
+
+    def acquire(self) -> PooledConnection:
+        """Get the connection bound to the current thread, opening it if needed."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and conn.depth == 0 and not self._is_healthy(conn):
+            self.discard(conn)
+            conn = None
+
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        else:
+            with self._lock:
+                self.stats["reused"] += 1
+
+        conn.depth += 1
+        return conn
+
+    def release(self, conn: PooledConnection):
+        """Return the connection to the current thread's slot."""
+        conn.depth -= 1
+        if conn.depth > 0:
+            return
+        # Match the old close() semantics: uncommitted work is not kept around
+        if conn.in_transaction:
+            conn.rollback()
+        conn.last_used = time.monotonic()
+
+    def discard(self, conn: PooledConnection):
+        """Close a connection and forget it so the next acquire reopens."""
+        if getattr(self._local, "conn", None) is conn:
+            self._local.conn = None
+        with self._lock:
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Close every connection opened by this pool."""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> SQLiteConnectionPool:
+    """Get the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SQLiteConnectionPool(
+                    db_path=settings.database_url.replace('sqlite:///', ''),
+                    statement_cache_size=settings.db_statement_cache_size,
+                    health_check_interval=settings.db_health_check_interval
+                )
+    return _pool
+
+
+def close_database_connections():
+    """Close all pooled connections (used on shutdown)."""
+    if _pool is not None:
+        _pool.close_all()
+
+
+@contextmanager
+def get_database_connection():
+    """Get pooled SQLite database connection context manager with better error handling."""
+    pool = get_connection_pool()
+    conn = None
+    try:
+        conn = pool.acquire()
         yield conn
     except Exception as e:
         logger.error("Database connection error", error=str(e))
-        if conn:
+        if conn is not None and conn.depth == 1:
             try:
                 conn.rollback()
-            except:
-                pass
+            except Exception:
+                # Connection is unusable, drop it from the pool
+                conn.depth = 0
+                pool.discard(conn)
+                conn = None
         raise
     finally:
-        if conn:
+        if conn is not None:
             try:
-                conn.close()
-            except:
-                pass
+                pool.release(conn)
+            except Exception:
+                conn.depth = 0
+                pool.discard(conn)
 
 
 def safe_fetchone(cursor, default=None):
@@ -63,6 +201,14 @@ def safe_fetchall(cursor, default=None):
         return default or []
 
 
+def ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table if it is missing (lightweight migration)."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info("Added missing column", table=table, column=column)
+
+
 def init_database():
     """Initialize SQLite database with all required tables."""
     logger.info("Initializing SQLite database")
@@ -101,6 +247,11 @@ def init_database():
                     link TEXT NOT NULL,
                     theme TEXT NOT NULL,
                     status TEXT DEFAULT 'pending',
+                    title TEXT,
+                    author TEXT,
+                    views INTEGER DEFAULT 0,
+                    likes INTEGER DEFAULT 0,
+                    posted_at INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     PRIMARY KEY (link, theme)
                 )
@@ -125,11 +276,22 @@ def init_database():
                     active BOOLEAN DEFAULT 1,
                     last_fetch TIMESTAMP,
                     videos_count INTEGER DEFAULT 0,
+                    last_video_id TEXT,
+                    last_video_created_at INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE (theme, tiktok_username)
                 )
             ''')
 
+            # Columns added after the first release
+            ensure_column(cursor, 'tiktok_sources', 'last_video_id', 'TEXT')
+            ensure_column(cursor, 'tiktok_sources', 'last_video_created_at', 'INTEGER')
+            ensure_column(cursor, 'videos', 'title', 'TEXT')
+            ensure_column(cursor, 'videos', 'author', 'TEXT')
+            ensure_column(cursor, 'videos', 'views', 'INTEGER DEFAULT 0')
+            ensure_column(cursor, 'videos', 'likes', 'INTEGER DEFAULT 0')
+            ensure_column(cursor, 'videos', 'posted_at', 'INTEGER')
+
             # Create task logs table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS task_logs (
@@ -147,10 +309,48 @@ def init_database():
                 )
             ''')
 
+            # Create shared video store table (downloaded clips reused across accounts)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS video_store (
+                    link_hash TEXT PRIMARY KEY,
+                    video_link TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size_bytes INTEGER DEFAULT 0,
+                    ref_count INTEGER DEFAULT 0,
+                    last_access REAL
+                )
+            ''')
+
+            # Create Instagram session table (used when SESSION_STORE=sqlite)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS instagram_sessions (
+                    username TEXT PRIMARY KEY,
+                    settings TEXT NOT NULL,
+                    size_bytes INTEGER DEFAULT 0,
+                    updated_at REAL
+                )
+            ''')
+
+            # Create proxy health history (one row per check of a host:port)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS proxy_checks (
+                    proxy_key TEXT NOT NULL,
+                    checked_at REAL NOT NULL,
+                    ok INTEGER NOT NULL,
+                    latency_ms INTEGER
+                )
+            ''')
+
             # Create indexes for performance
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_theme ON videos(theme)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_status ON videos(status)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_created_at ON videos(created_at)')
+            # Covering index for next_videos_for_account; the publicationhistory side of the
+            # anti-join is covered by its (account_username, video_link) primary key
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_theme_created_at ON videos(theme, created_at, link)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_theme_views ON videos(theme, views DESC)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_theme_likes ON videos(theme, likes DESC)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_theme_posted_at ON videos(theme, posted_at DESC)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_publications_username ON publicationhistory(account_username)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_publications_created_at ON publicationhistory(created_at)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_tiktok_sources_theme ON tiktok_sources(theme)')
@@ -158,6 +358,9 @@ def init_database():
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_logs_status ON task_logs(status)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_logs_created_at ON task_logs(created_at)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_accounts_proxy_active ON accounts(proxy_active)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_video_store_last_access ON video_store(last_access)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_proxy_checks_key_time ON proxy_checks(proxy_key, checked_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_proxy_checks_checked_at ON proxy_checks(checked_at)')
 
             conn.commit()
             logger.info("SQLite database initialized successfully")
@@ -168,39 +371,33 @@ def init_database():
 
 
 # PostgreSQL-compatible functions with better error handling
-def load_accounts_and_videos():
-    """Load accounts and videos (compatibility function)."""
+def next_videos_for_account(username, n=10):
+    """Get up to n videos from an account's theme that it hasn't published yet, oldest first.
+
+    Uses an anti-join against publicationhistory so only the returned rows are
+    read, instead of loading every video and the whole history into Python.
+    """
     try:
         with get_database_connection() as conn:
             cursor = conn.cursor()
 
-            # Get accounts with safe fetching
-            cursor.execute('SELECT username, password, theme, "2FAKey" FROM accounts')
-            accounts = safe_fetchall(cursor, [])
-
-            # Get all videos with safe fetching
-            cursor.execute("SELECT link, theme FROM videos")
-            all_videos = safe_fetchall(cursor, [])
-
-            # Get published videos with safe fetching
-            cursor.execute("SELECT account_username, video_link FROM publicationhistory")
-            published = safe_fetchall(cursor, [])
-            published_set = set(published) if published else set()
-
-            # Group videos by theme
-            account_to_videos = {}
-            for video_row in all_videos:
-                if len(video_row) >= 2:
-                    link, theme = video_row[0], video_row[1]
-                    if theme not in account_to_videos:
-                        account_to_videos[theme] = []
-                    account_to_videos[theme].append(link)
-
-            return accounts, account_to_videos, published_set
-
+            cursor.execute('''
+                SELECT v.link
+                FROM accounts a
+                JOIN videos v ON v.theme = a.theme
+                LEFT JOIN publicationhistory p
+                       ON p.account_username = a.username
+                      AND p.video_link = v.link
+                WHERE a.username = ?
+                  AND p.video_link IS NULL
+                ORDER BY v.created_at, v.link
+                LIMIT ?
+            ''', (username, n))
+
+            return [row[0] for row in safe_fetchall(cursor, [])]
     except Exception as e:
-        logger.error("Error loading accounts and videos", error=str(e))
-        return [], {}, set()
+        logger.error("Failed to get next videos for account", username=username, error=str(e))
+        return []
 
 
 def record_publication(username, video_link):
@@ -224,21 +421,84 @@ def record_publication(username, video_link):
 def record_video(video_link, theme):
     """Record video with better error handling."""
     try:
-        with get_database_connection() as conn:
-            cursor = conn.cursor()
-
-            # SQLite INSERT OR IGNORE (equivalent to ON CONFLICT DO NOTHING)
-            cursor.execute('''
-                INSERT OR IGNORE INTO videos (link, theme)
-                VALUES (?, ?)
-            ''', (video_link, theme))
-
-            conn.commit()
+        if ingest_videos([(video_link, theme, None)]):
             logger.info("Video recorded", theme=theme, video_link=video_link[:50] + "...")
     except Exception as e:
         logger.error("Failed to record video", error=str(e))
 
 
+# Optional per-video fields accepted in ingest_videos() metadata, with defaults
+VIDEO_METADATA_DEFAULTS = {
+    "status": "pending",
+    "title": None,
+    "author": None,
+    "views": 0,
+    "likes": 0,
+    "posted_at": None,
+}
+
+
+def ingest_videos(videos):
+    """Bulk insert (link, theme, metadata) tuples; returns the (link, theme) pairs that were new.
+
+    Rows are staged in a temp table with one executemany and moved into videos
+    in the same transaction, so the new set comes from a single anti-join
+    instead of a rowcount check per link. metadata may be None or a dict with
+    keys from VIDEO_METADATA_DEFAULTS; unknown keys are ignored. Database
+    errors are raised so callers don't mistake a failed batch for "nothing new".
+    """
+    columns = list(VIDEO_METADATA_DEFAULTS)
+    rows = []
+    for link, theme, metadata in videos:
+        metadata = metadata or {}
+        rows.append((link, theme) + tuple(metadata.get(c, VIDEO_METADATA_DEFAULTS[c]) for c in columns))
+
+    if not rows:
+        return set()
+
+    column_list = ", ".join(["link", "theme"] + columns)
+    placeholders = ", ".join("?" * (len(columns) + 2))
+    with get_database_connection() as conn:
+        cursor = conn.cursor()
+
+        # Temp tables live per connection, and pooled connections are per thread
+        cursor.execute(f'''
+            CREATE TEMP TABLE IF NOT EXISTS video_ingest (
+                {column_list},
+                PRIMARY KEY (link, theme)
+            )
+        ''')
+        cursor.execute("DELETE FROM video_ingest")
+
+        cursor.executemany(
+            f"INSERT OR IGNORE INTO video_ingest ({column_list}) VALUES ({placeholders})",
+            rows
+        )
+
+        # Keep only rows that aren't in videos yet; what's left is the new set
+        cursor.execute('''
+            DELETE FROM video_ingest
+            WHERE EXISTS (
+                SELECT 1 FROM videos v
+                WHERE v.link = video_ingest.link
+                  AND v.theme = video_ingest.theme
+            )
+        ''')
+
+        cursor.execute("SELECT link, theme FROM video_ingest")
+        inserted = {(row[0], row[1]) for row in safe_fetchall(cursor, [])}
+
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO videos ({column_list})
+            SELECT {column_list} FROM video_ingest
+        ''')
+        cursor.execute("DELETE FROM video_ingest")
+
+        conn.commit()
+        logger.info("Videos ingested", submitted=len(rows), inserted=len(inserted))
+        return inserted
+
+
 def get_existing_video_links_for_theme(theme):
     """Get existing video links for theme with better error handling."""
     try:
@@ -255,6 +515,81 @@ def get_existing_video_links_for_theme(theme):
         return set()
 
 
+# Upload queue scores: plain columns are ranked by SQLite through the
+# (theme, column DESC) indexes; trending goes through a bounded heap.
+QUEUE_SCORE_COLUMNS = {
+    "views": "views",
+    "likes": "likes",
+    "recency": "posted_at",
+}
+QUEUE_SCORES = tuple(QUEUE_SCORE_COLUMNS) + ("trending",)
+
+
+def _trending_score(row, now, half_life_hours):
+    """Views decayed by age: a clip loses half its score every half_life_hours."""
+    if not row["posted_at"]:
+        return 0.0
+    age_hours = max(0.0, (now - row["posted_at"]) / 3600)
+    return (row["views"] or 0) * 0.5 ** (age_hours / half_life_hours)
+
+
+def get_upload_queue(theme, k=10, score=None, username=None):
+    """Get the top-k pending videos for a theme ranked by score.
+
+    score is one of QUEUE_SCORES (defaults to settings.upload_queue_score).
+    When username is given, videos that account already published are skipped.
+    Returns a list of dicts with the video fields and its score.
+    """
+    score = score or settings.upload_queue_score
+    if score not in QUEUE_SCORES:
+        raise ValueError(f"Unknown queue score '{score}', expected one of {QUEUE_SCORES}")
+
+    query = '''
+        SELECT link, theme, title, author, views, likes, posted_at
+        FROM videos v
+        WHERE theme = ?
+          AND COALESCE(status, 'pending') = 'pending'
+    '''
+    params = [theme]
+    if username:
+        query += '''
+          AND NOT EXISTS (
+              SELECT 1 FROM publicationhistory p
+              WHERE p.account_username = ?
+                AND p.video_link = v.link
+          )
+        '''
+        params.append(username)
+
+    try:
+        with get_database_connection() as conn:
+            cursor = conn.cursor()
+
+            if score in QUEUE_SCORE_COLUMNS:
+                column = QUEUE_SCORE_COLUMNS[score]
+                cursor.execute(query + f" ORDER BY {column} DESC LIMIT ?", params + [k])
+                return [dict(row, score=row[column] or 0) for row in safe_fetchall(cursor, [])]
+
+            # Decay never raises a score above views, so walk the views index and keep a
+            # k-sized min-heap; once views drop below the k-th best score nothing later can win
+            now = time.time()
+            half_life = settings.upload_queue_half_life_hours
+            cursor.execute(query + " ORDER BY views DESC", params)
+            top = []
+            for position, row in enumerate(cursor):
+                if len(top) == k and (row["views"] or 0) <= top[0][0]:
+                    break
+                item = (_trending_score(row, now, half_life), position, row)
+                if len(top) < k:
+                    heapq.heappush(top, item)
+                else:
+                    heapq.heappushpop(top, item)
+            return [dict(row, score=value) for value, _, row in sorted(top, key=lambda item: -item[0])]
+    except Exception as e:
+        logger.error("Failed to build upload queue", theme=theme, error=str(e))
+        return []
+
+
 def is_video_published(username, video_link):
     """Check if video was published by user with better error handling."""
     try:
@@ -273,4 +608,76 @@ def is_video_published(username, video_link):
             return exists
     except Exception as e:
         logger.error("Failed to check video publication", error=str(e))
-        return False
\ No newline at end of file
+        return False
+
+
+# Stay well under SQLite's bound-parameter limit (999 on older builds)
+PUBLISHED_SUBSET_CHUNK = 500
+
+
+def published_subset(username, video_links):
+    """Return the subset of video_links that username has already published."""
+    links = list(dict.fromkeys(video_links))
+    published = set()
+    try:
+        with get_database_connection() as conn:
+            cursor = conn.cursor()
+
+            for start in range(0, len(links), PUBLISHED_SUBSET_CHUNK):
+                chunk = links[start:start + PUBLISHED_SUBSET_CHUNK]
+                cursor.execute(f'''
+                    SELECT video_link
+                    FROM publicationhistory
+                    WHERE account_username = ?
+                      AND video_link IN ({", ".join("?" * len(chunk))})
+                ''', [username] + chunk)
+                published.update(row[0] for row in safe_fetchall(cursor, []))
+
+            return published
+    except Exception as e:
+        logger.error("Failed to check video publications", error=str(e))
+        return published
+
+
+def get_source_high_water_marks(theme):
+    """Get newest seen TikTok createTime per source username for a theme."""
+    try:
+        with get_database_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT tiktok_username, last_video_created_at
+                FROM tiktok_sources
+                WHERE theme = ?
+                  AND last_video_created_at IS NOT NULL
+            ''', (theme,))
+
+            return {row[0]: row[1] for row in safe_fetchall(cursor, [])}
+    except Exception as e:
+        logger.error("Failed to get source high-water marks", error=str(e))
+        return {}
+
+
+def update_source_fetch_state(theme, username, newest_created_at, newest_video_id, videos_fetched):
+    """Record a completed fetch for a source and advance its high-water mark."""
+    try:
+        with get_database_connection() as conn:
+            cursor = conn.cursor()
+
+            # SET expressions see the old row, so the id check uses the previous mark
+            cursor.execute('''
+                UPDATE tiktok_sources
+                SET last_fetch = CURRENT_TIMESTAMP,
+                    videos_count = COALESCE(videos_count, 0) + ?,
+                    last_video_id = CASE
+                        WHEN ? > COALESCE(last_video_created_at, 0) THEN ?
+                        ELSE last_video_id
+                    END,
+                    last_video_created_at = MAX(COALESCE(last_video_created_at, 0), COALESCE(?, 0))
+                WHERE theme = ?
+                  AND tiktok_username = ?
+            ''', (videos_fetched, newest_created_at or 0, newest_video_id, newest_created_at, theme, username))
+
+            conn.commit()
+    except Exception as e:
+        logger.error("Failed to update source fetch state", error=str(e))
\ No newline at end of file
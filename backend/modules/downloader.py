@@ -1,16 +1,35 @@
+import atexit
+import fcntl
+import hashlib
+import queue
+import threading
 import time
+from collections import OrderedDict
 import requests
+import requests.adapters
 import os
+from contextlib import contextmanager
 from selenium import webdriver
+from selenium.common.exceptions import (
+    NoSuchElementException, StaleElementReferenceException, TimeoutException, WebDriverException
+)
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 from config.settings import settings
+from modules.proxy_router import proxy_router, route_key
+from modules.proxy_utils import build_proxy_url, get_proxy_dict
+from modules.redis_client import get_redis_client
 
+SNAPTIK_URL = "https://snaptik.app/en2"
+DOWNLOAD_LINK_XPATH = '//a[contains(@class, "button download-file")]'
 
-def get_download_link(tiktok_url):
-    """Get download link for TikTok video using Selenium."""
+
+def create_chrome_driver(debug_port: int, proxy=None):
+    """Create a headless Chrome driver listening on its own debugging port (optionally behind a proxy)."""
     options = Options()
 
     # Add Chrome options from settings (исправляем использование)
@@ -24,7 +43,10 @@ def get_download_link(tiktok_url):
     options.add_argument("--disable-renderer-backgrounding")
     options.add_argument("--disable-features=TranslateUI")
     options.add_argument("--disable-ipc-flooding-protection")
-    options.add_argument("--remote-debugging-port=9222")
+    options.add_argument(f"--remote-debugging-port={debug_port}")
+    if proxy:
+        # Chrome can't take proxy credentials on the command line; the router only hands out open proxies
+        options.add_argument(f"--proxy-server={build_proxy_url(proxy)}")
 
     # Set Chrome binary location for Docker
     chrome_bin = os.environ.get('CHROME_BIN', '/usr/bin/chromium')
@@ -33,101 +55,479 @@ def get_download_link(tiktok_url):
 
     # Set Chrome driver path
     chrome_driver = os.environ.get('CHROME_DRIVER', '/usr/bin/chromedriver')
+    if os.path.exists(chrome_driver):
+        # Use system Chrome driver (Docker)
+        service = Service(chrome_driver)
+    else:
+        # Use WebDriver Manager (local development)
+        service = Service(ChromeDriverManager().install())
 
-    driver = None
-    try:
-        if os.path.exists(chrome_driver):
-            # Use system Chrome driver (Docker)
-            service = Service(chrome_driver)
-        else:
-            # Use WebDriver Manager (local development)
-            service = Service(ChromeDriverManager().install())
+    driver = webdriver.Chrome(service=service, options=options)
+
+    # Explicit waits only; an implicit wait would stall every missing-element probe
+    driver.set_page_load_timeout(30)
+    driver.implicitly_wait(0)
+    return driver
+
+
+class BrowserSlot:
+    """One pooled browser instance with its own debugging port."""
 
-        driver = webdriver.Chrome(service=service, options=options)
+    def __init__(self, debug_port: int):
+        self.debug_port = debug_port
+        self.driver = None
+        self.proxy = None
+        self.uses = 0
 
-        # Set timeouts
-        driver.set_page_load_timeout(30)
-        driver.implicitly_wait(10)
+    def get_driver(self):
+        """Return a live driver, starting a new browser if needed."""
+        if self.driver is not None:
+            try:
+                self.driver.current_url  # Cheap liveness probe
+            except WebDriverException:
+                print(f"⚠️ Browser on port {self.debug_port} crashed, restarting")
+                self.quit()
 
-        print(f"🌐 Opening SnapTik for URL: {tiktok_url}")
-        driver.get("https://snaptik.app/en2")
+        if self.driver is None:
+            # Each new browser takes a fresh route, so recycling spreads SnapTik traffic
+            self.proxy = proxy_router.choose(require_no_auth=True)
+            self.driver = create_chrome_driver(self.debug_port, self.proxy)
+            self.uses = 0
+            print(f"🌐 Browser on port {self.debug_port} routed via {route_key(self.proxy)}")
+        return self.driver
 
-        # Wait for page load
-        time.sleep(3)
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+        self.driver = None
+        self.uses = 0
 
-        # Handle "Continue" button if present
+
+class BrowserPool:
+    """Bounded pool of warm headless browsers shared by link resolutions.
+
+    Browsers are started lazily, reused across calls and recycled after
+    ``max_uses`` resolutions or as soon as they crash.
+    """
+
+    def __init__(self, size: int, max_uses: int, base_debug_port: int):
+        self.max_uses = max_uses
+        self._slots = [BrowserSlot(base_debug_port + i) for i in range(size)]
+        self._available = queue.Queue()
+        for slot in self._slots:
+            self._available.put(slot)
+
+    @contextmanager
+    def browser(self, timeout: float = None):
+        """Check out a driver for the duration of the block."""
+        slot = self._available.get(timeout=timeout)
+        healthy = True
         try:
-            continue_button = driver.find_element(By.XPATH, '//button[contains(text(), "Continue")]')
-            continue_button.click()
-            time.sleep(2)
-        except:
-            print("ℹ️ No Continue button found, proceeding...")
+            yield slot.get_driver()
+        except TimeoutException:
+            # A slow proxy shows up as page timeouts; move this slot to another route
+            if slot.proxy:
+                proxy_router.report_failure(slot.proxy)
+                healthy = False
+            raise
+        except (NoSuchElementException, StaleElementReferenceException):
+            # Page-level failure; the browser itself is fine
+            raise
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            slot.uses += 1
+            if not healthy or slot.uses >= self.max_uses:
+                slot.quit()
+            self._available.put(slot)
+
+    def close(self):
+        """Quit every pooled browser."""
+        for slot in self._slots:
+            slot.quit()
 
-        # Find and fill input field
-        input_field = driver.find_element(By.ID, "url")
-        input_field.clear()
-        input_field.send_keys(tiktok_url)
 
-        # Click download button
-        download_button = driver.find_element(By.XPATH, '//button[contains(text(), "Download")]')
-        download_button.click()
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
 
-        # Wait for processing
-        time.sleep(5)
 
-        # Get download link
-        download_link = driver.find_element(By.XPATH, '//a[contains(@class, "button download-file")]').get_attribute(
-            "href")
+def get_browser_pool() -> BrowserPool:
+    """Get the process-wide browser pool, creating it on first use."""
+    global _browser_pool
+    if _browser_pool is None:
+        with _browser_pool_lock:
+            if _browser_pool is None:
+                _browser_pool = BrowserPool(
+                    size=settings.browser_pool_size,
+                    max_uses=settings.browser_max_uses,
+                    base_debug_port=settings.browser_debug_port_base
+                )
+                atexit.register(_browser_pool.close)
+    return _browser_pool
 
-        print(f"✅ Download link obtained: {download_link[:50]}...")
-        return download_link
+
+def resolve_download_link(tiktok_url):
+    """Resolve a TikTok URL to a CDN download link using a pooled Selenium browser."""
+    try:
+        with get_browser_pool().browser() as driver:
+            wait = WebDriverWait(driver, settings.snaptik_wait_timeout)
+
+            print(f"🌐 Opening SnapTik for URL: {tiktok_url}")
+            driver.get(SNAPTIK_URL)
+
+            # Wait for the form instead of a fixed sleep
+            input_field = wait.until(EC.presence_of_element_located((By.ID, "url")))
+
+            # Handle "Continue" button if present
+            continue_buttons = driver.find_elements(By.XPATH, '//button[contains(text(), "Continue")]')
+            if continue_buttons:
+                continue_buttons[0].click()
+                input_field = wait.until(EC.element_to_be_clickable((By.ID, "url")))
+            else:
+                print("ℹ️ No Continue button found, proceeding...")
+
+            # Fill input field
+            input_field.clear()
+            input_field.send_keys(tiktok_url)
+
+            # Click download button
+            download_button = wait.until(
+                EC.element_to_be_clickable((By.XPATH, '//button[contains(text(), "Download")]'))
+            )
+            download_button.click()
+
+            # Wait for the result link to be rendered with an href
+            download_link = wait.until(
+                lambda d: next(
+                    (href for href in (a.get_attribute("href")
+                                       for a in d.find_elements(By.XPATH, DOWNLOAD_LINK_XPATH)) if href),
+                    False
+                )
+            )
+
+            print(f"✅ Download link obtained: {download_link[:50]}...")
+            return download_link
 
     except Exception as e:
         print(f"❌ Error retrieving download link: {e}")
         return None
+
+
+class DownloadLinkCache:
+    """TTL cache of resolved download links keyed by TikTok URL.
+
+    A small in-process LRU sits in front of Redis so one SnapTik resolution
+    serves every account (and worker) posting the same video until the CDN
+    link expires. Redis failures degrade to the local cache only.
+    """
+
+    KEY_PREFIX = "download_link:"
+
+    def __init__(self, ttl: int, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._resolve_locks = {}
+
+    def _key(self, tiktok_url: str) -> str:
+        return self.KEY_PREFIX + hashlib.sha1(tiktok_url.encode()).hexdigest()
+
+    def _remember(self, tiktok_url: str, link: str, ttl: float):
+        with self._lock:
+            self._local[tiktok_url] = (link, time.monotonic() + ttl)
+            self._local.move_to_end(tiktok_url)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def get(self, tiktok_url: str):
+        """Return a cached link or None"""
+        with self._lock:
+            entry = self._local.get(tiktok_url)
+            if entry:
+                if entry[1] > time.monotonic():
+                    self._local.move_to_end(tiktok_url)
+                    return entry[0]
+                del self._local[tiktok_url]
+
+        try:
+            pipe = get_redis_client().pipeline()
+            pipe.get(self._key(tiktok_url))
+            pipe.ttl(self._key(tiktok_url))
+            link, ttl = pipe.execute()
+        except Exception as e:
+            print(f"⚠️ Download link cache unavailable: {e}")
+            return None
+
+        if link and ttl and ttl > 0:
+            self._remember(tiktok_url, link, ttl)
+            return link
+        return None
+
+    def set(self, tiktok_url: str, link: str):
+        """Cache a freshly resolved link for the configured TTL"""
+        self._remember(tiktok_url, link, self.ttl)
+        try:
+            get_redis_client().set(self._key(tiktok_url), link, ex=self.ttl)
+        except Exception as e:
+            print(f"⚠️ Could not store download link in Redis: {e}")
+
+    def invalidate(self, tiktok_url: str):
+        """Forget a link, e.g. after the CDN rejected it"""
+        with self._lock:
+            self._local.pop(tiktok_url, None)
+        try:
+            get_redis_client().delete(self._key(tiktok_url))
+        except Exception as e:
+            print(f"⚠️ Could not invalidate download link in Redis: {e}")
+
+    def resolve_lock(self, tiktok_url: str) -> threading.Lock:
+        """Per-URL lock so concurrent callers in this process resolve a link only once"""
+        with self._lock:
+            lock = self._resolve_locks.get(tiktok_url)
+            if lock is None:
+                if len(self._resolve_locks) > self.max_size:
+                    self._resolve_locks = {u: l for u, l in self._resolve_locks.items() if l.locked()}
+                lock = self._resolve_locks[tiktok_url] = threading.Lock()
+            return lock
+
+
+download_link_cache = DownloadLinkCache(
+    ttl=settings.download_link_cache_ttl,
+    max_size=settings.download_link_cache_size
+)
+
+
+def get_download_link(tiktok_url, use_cache=True):
+    """Get download link for TikTok video, reusing a cached resolution when possible."""
+    if not use_cache:
+        # Callers bypass the cache when the cached link was rejected; don't let it be served
+        # again even if this resolution fails
+        download_link_cache.invalidate(tiktok_url)
+        link = resolve_download_link(tiktok_url)
+        if link:
+            download_link_cache.set(tiktok_url, link)
+        return link
+
+    link = download_link_cache.get(tiktok_url)
+    if link:
+        print(f"♻️ Using cached download link for: {tiktok_url}")
+        return link
+
+    with download_link_cache.resolve_lock(tiktok_url):
+        # Another caller may have resolved it while we waited
+        link = download_link_cache.get(tiktok_url)
+        if link:
+            return link
+
+        link = resolve_download_link(tiktok_url)
+        if link:
+            download_link_cache.set(tiktok_url, link)
+        return link
+
+
+DOWNLOAD_MIN_CHUNK = 64 * 1024
+DOWNLOAD_MAX_CHUNK = 1024 * 1024
+
+_download_session = None
+_download_session_lock = threading.Lock()
+
+
+def get_download_session() -> requests.Session:
+    """Process-wide session so CDN (and proxy) connections are reused between downloads."""
+    global _download_session
+    if _download_session is None:
+        with _download_session_lock:
+            if _download_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=settings.download_pool_size,
+                    pool_maxsize=settings.download_pool_size
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _download_session = session
+    return _download_session
+
+
+def _chunk_size_for(total_size):
+    """Bigger reads for bigger files: about 64 reads per file, between 64 KiB and 1 MiB."""
+    if not total_size:
+        return DOWNLOAD_MIN_CHUNK
+    return max(DOWNLOAD_MIN_CHUNK, min(DOWNLOAD_MAX_CHUNK, total_size // 64))
+
+
+def _expected_size(response, offset):
+    """Full file size from Content-Range (206) or Content-Length (200), None if unknown."""
+    content_range = response.headers.get('content-range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('content-length')
+    if length and length.isdigit():
+        return int(length) + (offset if response.status_code == 206 else 0)
+    return None
+
+
+@contextmanager
+def _locked_sidecar(path):
+    """Open ``path`` (creating it) and hold an exclusive lock on it.
+
+    Another worker holding the lock may delete the file, so once we get the
+    lock we make sure it is still the file at ``path`` and start over if not.
+    """
+    while True:
+        f = open(path, "a+")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                break
+        except FileNotFoundError:
+            pass
+        f.close()
+    try:
+        yield f
     finally:
-        if driver:
-            driver.quit()
+        f.close()
 
 
 def download_video(download_url, output_path):
-    """Download video from URL to local file."""
-    try:
-        print(f"📥 Downloading video to: {output_path}")
-
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-        # Download with streaming
-        response = requests.get(download_url, stream=True, timeout=60)
-        response.raise_for_status()
-
-        # Check content type
-        content_type = response.headers.get('content-type', '')
-        if 'video' not in content_type and 'octet-stream' not in content_type:
-            print(f"⚠️ Unexpected content type: {content_type}")
-
-        # Write file
-        with open(output_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-
-        # Verify file was created and has content
-        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-            file_size = os.path.getsize(output_path)
-            print(f"✅ Video downloaded successfully: {file_size} bytes")
-            return True
-        else:
-            print("❌ Downloaded file is empty or missing")
+    """Download video from URL to local file.
+
+    Streams into ``<output_path>.part`` through the shared session and renames
+    it into place only once the size matches what the server announced. When
+    a transfer breaks, the next attempt (over another route when one is
+    available) asks for the rest with a Range request instead of starting over.
+
+    The validator (ETag or Last-Modified) of the partial file is kept in a
+    locked ``<output_path>.part.meta``. If every attempt fails on the network,
+    both files stay, so a later call for the same path (e.g. a task retry)
+    resumes with If-Range. Rejected links and other errors drop them.
+    """
+    print(f"📥 Downloading video to: {output_path}")
+
+    # Create directory if it doesn't exist
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    part_path = f"{output_path}.part"
+    meta_path = f"{part_path}.meta"
+
+    with _locked_sidecar(meta_path) as meta:
+        meta.seek(0)
+        validator = meta.read().strip() or None
+        if os.path.exists(part_path):
+            if validator:
+                print(f"⏩ Found a partial download of {os.path.getsize(part_path)} bytes")
+            else:
+                os.remove(part_path)  # Without a validator we can't tell it is the same file
+
+        keep_part = False
+        try:
+            session = get_download_session()
+            tried = set()
+            pinned = False
+
+            for attempt in range(1, settings.download_attempts + 1):
+                if not pinned:
+                    proxy = proxy_router.choose(exclude=tried)
+                pinned = False
+                route = route_key(proxy)
+                tried.add(route)
+
+                offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                headers = {}
+                if offset:
+                    headers['Range'] = f"bytes={offset}-"
+                    if validator:
+                        # Only resume if the file hasn't changed since the first attempt
+                        headers['If-Range'] = validator
+
+                try:
+                    # Download with streaming
+                    with session.get(
+                        download_url,
+                        headers=headers,
+                        stream=True,
+                        timeout=(10, 30),
+                        proxies=get_proxy_dict(proxy) if proxy else None
+                    ) as response:
+                        if response.status_code == 416:
+                            # The partial file doesn't fit the server's copy; the route is fine,
+                            # so start over from 0 on the same route without benching it
+                            print(f"⚠️ Range not satisfiable via {route}, restarting the download")
+                            os.remove(part_path)
+                            validator = None
+                            pinned = True
+                            continue
+                        if response.status_code == 429 or response.status_code >= 500:
+                            raise requests.exceptions.RequestException(f"HTTP {response.status_code} via {route}")
+                        response.raise_for_status()
+
+                        if offset and response.status_code != 206:
+                            print("⚠️ Server ignored the range request, downloading from the start")
+                            offset = 0
+                        elif offset:
+                            print(f"⏩ Resuming download at {offset} bytes via {route}")
+
+                        if not offset:
+                            validator = response.headers.get('etag') or response.headers.get('last-modified')
+                            meta.seek(0)
+                            meta.truncate()
+                            meta.write(validator or "")
+                            meta.flush()
+                        expected_size = _expected_size(response, offset)
+
+                        # Check content type
+                        content_type = response.headers.get('content-type', '')
+                        if 'video' not in content_type and 'octet-stream' not in content_type:
+                            print(f"⚠️ Unexpected content type: {content_type}")
+
+                        # Write file
+                        with open(part_path, "ab" if offset else "wb") as f:
+                            for chunk in response.iter_content(chunk_size=_chunk_size_for(expected_size)):
+                                if chunk:
+                                    f.write(chunk)
+
+                    size = os.path.getsize(part_path)
+                    if expected_size is not None and size != expected_size:
+                        raise requests.exceptions.RequestException(
+                            f"Transfer cut short via {route}: {size} of {expected_size} bytes"
+                        )
+
+                    # Verify file was created and has content
+                    if size > 0:
+                        os.replace(part_path, output_path)
+                        print(f"✅ Video downloaded successfully via {route}: {size} bytes")
+                        return True
+                    else:
+                        print("❌ Downloaded file is empty or missing")
+                        return False
+
+                except requests.exceptions.HTTPError as e:
+                    # The link itself was rejected (expired, not found); another route won't help
+                    print(f"❌ Download error: {e}")
+                    return False
+                except requests.exceptions.Timeout:
+                    print(f"❌ Download timeout via {route} (attempt {attempt}/{settings.download_attempts})")
+                    proxy_router.report_failure(proxy)
+                except requests.exceptions.RequestException as e:
+                    print(f"❌ Download error via {route} (attempt {attempt}/{settings.download_attempts}): {e}")
+                    proxy_router.report_failure(proxy)
+                except Exception as e:
+                    print(f"❌ Error downloading video: {e}")
+                    return False
+
+            print("❌ Download failed on every attempt")
+            # Keep what arrived for a later call, if it can be checked with If-Range
+            keep_part = bool(validator) and os.path.exists(part_path) and os.path.getsize(part_path) > 0
             return False
 
-    except requests.exceptions.Timeout:
-        print("❌ Download timeout")
-        return False
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Download error: {e}")
-        return False
-    except Exception as e:
-        print(f"❌ Error downloading video: {e}")
-        return False
\ No newline at end of file
+        finally:
+            if not keep_part:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                os.remove(meta_path)
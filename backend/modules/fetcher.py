@@ -5,8 +5,9 @@ import time
 import random
 from concurrent.futures import ThreadPoolExecutor
 from modules.database import get_existing_video_links_for_theme, record_video
-from dataclasses import dataclass
-from typing import List, Optional
+from core.config_utils import ConfigManager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
 
 ms_tokens = os.environ.get("MS_TOKENS", "").split(",") if os.environ.get("MS_TOKENS") else []
 
@@ -21,9 +22,24 @@ class VideoInfo:
     likes: int = 0
 
 
+@dataclass
+class AccountFetchResult:
+    account: str
+    new_videos: List[str]
+    newest_created_at: Optional[int] = None
+    newest_video_id: Optional[str] = None
+    video_infos: List[VideoInfo] = field(default_factory=list)
+
+
 class FanAccountFetcher:
     def __init__(self):
         self.api = None
+        # Per-theme index of links already in the DB, loaded once per fetch run
+        self.known_links: Dict[str, Set[str]] = {}
+        # Newest (createTime, video id) seen per account in this run
+        self.high_water_marks: Dict[str, Tuple[int, str]] = {}
+        # One session per msToken, capped by TIKTOK_MAX_SESSIONS
+        self.num_sessions = max(1, min(len(ms_tokens), ConfigManager.get_tiktok_config()['max_sessions']))
 
     async def initialize_api(self):
         """Initialize TikTok API with anti-detection settings"""
@@ -49,13 +65,13 @@ class FanAccountFetcher:
 
             await self.api.create_sessions(
                 ms_tokens=ms_tokens,
-                num_sessions=1,
+                num_sessions=self.num_sessions,
                 headless=True,  # Дублируем для уверенности
                 sleep_after=random.randint(5, 10),
                 browser='chromium',
                 playwright_options=playwright_options
             )
-            print("✅ TikTok API initialized successfully (headless mode)")
+            print(f"✅ TikTok API initialized successfully with {self.num_sessions} session(s) (headless mode)")
         except Exception as e:
             print(f"❌ Failed to initialize TikTok API: {e}")
             # Пробуем fallback без Playwright
@@ -64,7 +80,7 @@ class FanAccountFetcher:
                 self.api = TikTokApi()
                 await self.api.create_sessions(
                     ms_tokens=ms_tokens,
-                    num_sessions=1,
+                    num_sessions=self.num_sessions,
                     headless=True,
                     sleep_after=random.randint(5, 10)
                 )
@@ -73,8 +89,23 @@ class FanAccountFetcher:
                 print(f"❌ Fallback also failed: {fallback_error}")
                 raise
 
-    async def fetch_videos_from_account(self, username: str, theme: str, count: int = 20) -> List[str]:
-        """Fetch latest videos from a specific TikTok account"""
+    def get_known_links(self, theme: str) -> Set[str]:
+        """Get the link index for a theme, loading it from the DB on first use"""
+        if theme not in self.known_links:
+            self.known_links[theme] = get_existing_video_links_for_theme(theme)
+            print(f"📚 Loaded {len(self.known_links[theme])} known links for theme '{theme}'")
+        return self.known_links[theme]
+
+    async def fetch_videos_from_account(self, username: str, theme: str, count: int = 20,
+                                        session_index: Optional[int] = None,
+                                        since_created_at: Optional[int] = None) -> List[VideoInfo]:
+        """Fetch latest videos from a specific TikTok account, optionally pinned to one session.
+
+        Paging stops at already-known videos or at ``since_created_at`` (the
+        source's high-water mark); the newest video seen is kept in
+        ``self.high_water_marks`` once the fetch succeeds. Returns the new
+        videos with their stats.
+        """
         try:
             await self.initialize_api()
         except Exception as init_error:
@@ -88,18 +119,29 @@ class FanAccountFetcher:
             print(f"⏳ Waiting {delay:.1f} seconds...")
             await asyncio.sleep(delay)
 
+            known_links = self.get_known_links(theme)
             user = self.api.user(username=username)
             videos = []
             video_count = 0
+            newest = None
 
-            async for video in user.videos(count=count):
+            async for video in user.videos(count=count, session_index=session_index):
                 if video_count >= count:
                     break
 
                 # Extract video data safely
+                raw = getattr(video, 'as_dict', None) or {}
+                is_pinned = bool(raw.get('isPinnedItem'))
                 video_id = getattr(video, 'id', '')
-                video_desc = getattr(video, 'desc', '') or ''
-                create_time = getattr(video, 'createTime', int(time.time()))
+                video_desc = getattr(video, 'desc', '') or raw.get('desc', '') or ''
+                create_time = int(raw.get('createTime') or getattr(video, 'createTime', 0) or time.time())
+
+                if not is_pinned:
+                    if newest is None or create_time > newest[0]:
+                        newest = (create_time, str(video_id))
+                    if since_created_at and create_time <= since_created_at:
+                        print(f"⏹️ Reached high-water mark for @{username}, stopping")
+                        break
 
                 # Get stats safely
                 stats = getattr(video, 'stats', {}) or {}
@@ -117,6 +159,14 @@ class FanAccountFetcher:
                                        getattr(video.author, 'uniqueId', username) or username)
 
                 video_url = f"https://www.tiktok.com/@{author_username}/video/{video_id}"
+
+                if video_url in known_links:
+                    # Pinned posts sit above newer ones; anything else known means the rest is old
+                    if is_pinned:
+                        continue
+                    print(f"⏹️ Reached already-known videos for @{username}, stopping")
+                    break
+
                 video_info = VideoInfo(
                     url=video_url,
                     title=video_desc,
@@ -136,12 +186,15 @@ class FanAccountFetcher:
 
             print(f"✅ Successfully fetched {len(videos)} videos from @{username}")
 
-            # Filter new videos
+            # Everything collected is new; index it so other accounts in this run skip it too
             new_videos = []
-            existing_links = []
             for video in videos:
-                if video.url not in existing_links:
-                    new_videos.append(video.url)
+                if video.url not in known_links:
+                    known_links.add(video.url)
+                    new_videos.append(video)
+
+            if newest:
+                self.high_water_marks[username] = newest
 
             print(f"🆕 Found {len(new_videos)} new videos for theme '{theme}'")
             return new_videos
@@ -166,6 +219,71 @@ async def fetch_videos_for_hashtag(hashtag, count=5):
     return []
 
 
+async def stream_videos_for_theme_from_accounts(theme: str, fan_accounts: List[str], videos_per_account: int = 10,
+                                                high_water_marks: Optional[Dict[str, int]] = None) -> \
+AsyncIterator[AccountFetchResult]:
+    """
+    Fetch videos from multiple fan accounts concurrently, yielding results as they arrive
+
+    Accounts are fanned out over one TikTok session per msToken. Each session
+    handles one account at a time and rests for the rate-limit delay before it
+    takes the next one.
+
+    Args:
+        theme: Theme name (e.g., 'ishowspeed')
+        fan_accounts: List of TikTok usernames
+        videos_per_account: How many latest videos to fetch from each account
+        high_water_marks: Newest createTime already fetched per account; paging stops there
+
+    Yields:
+        AccountFetchResult per account in completion order
+    """
+    fetcher = FanAccountFetcher()
+    try:
+        await fetcher.initialize_api()
+    except Exception as e:
+        print(f"❌ Error in theme fetching: {e}")
+        return
+
+    rate_limit_delay = ConfigManager.get_tiktok_config()['rate_limit_delay']
+    sessions = asyncio.Queue()
+    for session_index in range(fetcher.num_sessions):
+        sessions.put_nowait(session_index)
+
+    high_water_marks = high_water_marks or {}
+
+    async def fetch_account(account: str) -> AccountFetchResult:
+        session_index = await sessions.get()
+        try:
+            print(f"\n🎯 Processing account @{account} for theme '{theme}' (session {session_index})")
+            video_infos = await fetcher.fetch_videos_from_account(
+                username=account,
+                theme=theme,
+                count=videos_per_account,
+                session_index=session_index,
+                since_created_at=high_water_marks.get(account)
+            )
+            newest_created_at, newest_video_id = fetcher.high_water_marks.get(account, (None, None))
+            return AccountFetchResult(account, [video.url for video in video_infos],
+                                      newest_created_at, newest_video_id, video_infos)
+        except Exception as e:
+            print(f"❌ Error processing account @{account}: {e}")
+            return AccountFetchResult(account, [])
+        finally:
+            # Per-session rate limit: rest the session before the next account may use it
+            delay = random.uniform(rate_limit_delay, rate_limit_delay + 5)
+            asyncio.get_running_loop().call_later(delay, sessions.put_nowait, session_index)
+
+    pending = [asyncio.ensure_future(fetch_account(account)) for account in fan_accounts]
+    try:
+        for next_result in asyncio.as_completed(pending):
+            yield await next_result
+    finally:
+        for task in pending:
+            task.cancel()
+        await fetcher.close()
+
+
 async def fetch_videos_for_theme_from_accounts(theme: str, fan_accounts: List[str], videos_per_account: int = 10) -> \
 List[str]:
     """
@@ -179,30 +297,11 @@ List[str]:
     Returns:
         List of new video URLs
     """
-    fetcher = FanAccountFetcher()
     all_new_videos = []
 
     try:
-        for account in fan_accounts:
-            try:
-                print(f"\n🎯 Processing account @{account} for theme '{theme}'")
-
-                new_videos = await fetcher.fetch_videos_from_account(
-                    username=account,
-                    theme=theme,
-                    count=videos_per_account
-                )
-
-                all_new_videos.extend(new_videos)
-
-                if account != fan_accounts[-1]:
-                    delay = random.uniform(3, 8)
-                    print(f"⏳ Waiting {delay:.1f} seconds before next account...")
-                    await asyncio.sleep(delay)
-
-            except Exception as e:
-                print(f"❌ Error processing account @{account}: {e}")
-                continue
+        async for result in stream_videos_for_theme_from_accounts(theme, fan_accounts, videos_per_account):
+            all_new_videos.extend(result.new_videos)
 
         print(f"\n🎉 Total new videos found: {len(all_new_videos)}")
         return all_new_videos
@@ -210,8 +309,6 @@ List[str]:
     except Exception as e:
         print(f"❌ Error in theme fetching: {e}")
         return []
-    finally:
-        await fetcher.close()
 
 
 if __name__ == "__main__":
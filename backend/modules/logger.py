@@ -1,9 +1,196 @@
+import atexit
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
 import requests
 
-def telegram_notify(token, chat_id, message):
-    try:
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        params = {"chat_id": chat_id, "text": message}
-        requests.post(url, params=params, timeout=10)  # Таймаут 10 сек
-    except Exception as e:
-        print(f"Telegram error: {e}")
+from config.settings import settings
+
+TELEGRAM_API_URL = "https://api.telegram.org/bot{token}/sendMessage"
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+TELEGRAM_GLOBAL_INTERVAL = 1 / 30  # Bots may send about 30 messages per second overall
+
+
+class TelegramNotifier:
+    """Send Telegram messages from a background thread so callers never wait on the API.
+
+    Messages tagged with an account are collected into one digest per account
+    and sent ``digest_interval`` seconds after the first of them arrived.
+    Each chat gets at most one request every ``chat_interval`` seconds, and
+    queued texts for a chat are packed into as few messages as fit. When
+    Telegram answers 429 the chat is paused for the ``retry_after`` it asks
+    for and the message is sent again. All requests share one HTTP session.
+    """
+
+    def __init__(self, digest_interval: float, chat_interval: float, max_queue: int):
+        self.digest_interval = digest_interval
+        self.chat_interval = chat_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._session = requests.Session()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        # (token, chat_id, account) -> (first message time, texts)
+        self._digests: "OrderedDict[Tuple[str, str, str], Tuple[float, List[str]]]" = OrderedDict()
+        # (token, chat_id) -> texts waiting to be sent, and when the chat may be sent to again
+        self._outbox: Dict[Tuple[str, str], Deque[str]] = {}
+        self._next_send: Dict[Tuple[str, str], float] = {}
+        self._last_send = 0.0
+        self._flush_waiters: List[threading.Event] = []
+
+    def notify(self, token: str, chat_id: str, message: str, account: Optional[str] = None):
+        """Queue a message; never blocks the caller"""
+        if not token or not chat_id:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((str(token), str(chat_id), account, message))
+        except queue.Full:
+            print(f"Telegram queue full, dropping message: {message[:80]}")
+
+    def flush(self, timeout: float = 10) -> bool:
+        """Send everything queued now, ignoring the digest interval; True if it all went out in time"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)  # Wakes the sender and forces digests out
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._step()
+            except Exception as e:
+                print(f"Telegram notifier error: {e}")
+                time.sleep(1)
+
+    def _step(self):
+        try:
+            items = [self._queue.get(timeout=self._next_wakeup(time.monotonic()))]
+        except queue.Empty:
+            items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        force = False
+        for item in items:
+            if isinstance(item, threading.Event):
+                self._flush_waiters.append(item)
+                force = True
+                continue
+
+            token, chat_id, account, message = item
+            if account:
+                key = (token, chat_id, account)
+                if key not in self._digests:
+                    self._digests[key] = (time.monotonic(), [])
+                self._digests[key][1].append(message)
+            else:
+                self._outbox.setdefault((token, chat_id), deque()).append(message)
+
+        self._flush_digests(force)
+        self._send_ready()
+
+        if self._flush_waiters and not self._digests and not any(self._outbox.values()):
+            for waiter in self._flush_waiters:
+                waiter.set()
+            self._flush_waiters = []
+
+    def _next_wakeup(self, now: float) -> float:
+        deadlines = [first + self.digest_interval for first, _ in self._digests.values()]
+        deadlines += [self._next_send.get(chat, 0) for chat, texts in self._outbox.items() if texts]
+        if not deadlines:
+            return 5.0
+        return min(max(min(deadlines) - now, 0.05), 5.0)
+
+    def _flush_digests(self, force: bool):
+        now = time.monotonic()
+        for key in list(self._digests):
+            first, texts = self._digests[key]
+            if not force and now - first < self.digest_interval:
+                continue
+            del self._digests[key]
+            token, chat_id, account = key
+            if len(texts) == 1:
+                digest = texts[0]
+            else:
+                digest = f"📬 @{account} ({len(texts)} updates)\n\n" + "\n\n".join(texts)
+            self._outbox.setdefault((token, chat_id), deque()).append(digest)
+
+    def _send_ready(self):
+        for chat, texts in self._outbox.items():
+            if not texts or self._next_send.get(chat, 0) > time.monotonic():
+                continue
+
+            text = self._pack(texts)
+            wait = max(0.0, self._last_send + TELEGRAM_GLOBAL_INTERVAL - time.monotonic())
+            if wait:
+                time.sleep(wait)
+            self._last_send = time.monotonic()
+
+            retry_after = self._send(chat[0], chat[1], text)
+            if retry_after is not None:
+                # Put it back in front and pause this chat for as long as Telegram asks
+                texts.appendleft(text)
+                self._next_send[chat] = time.monotonic() + retry_after
+                print(f"Telegram rate limit for chat {chat[1]}, retrying in {retry_after}s")
+            else:
+                self._next_send[chat] = time.monotonic() + self.chat_interval
+
+    @staticmethod
+    def _pack(texts: Deque[str]) -> str:
+        """Take as many queued texts as fit into one message"""
+        text = texts.popleft()
+        if len(text) > TELEGRAM_MAX_MESSAGE_LENGTH:
+            texts.appendleft(text[TELEGRAM_MAX_MESSAGE_LENGTH:])
+            return text[:TELEGRAM_MAX_MESSAGE_LENGTH]
+        while texts and len(text) + 2 + len(texts[0]) <= TELEGRAM_MAX_MESSAGE_LENGTH:
+            text += "\n\n" + texts.popleft()
+        return text
+
+    def _send(self, token: str, chat_id: str, text: str) -> Optional[float]:
+        """Post one message; returns Telegram's retry_after on 429, else None"""
+        try:
+            response = self._session.post(
+                TELEGRAM_API_URL.format(token=token),
+                data={"chat_id": chat_id, "text": text},
+                timeout=10
+            )
+            if response.status_code == 429:
+                try:
+                    return float(response.json().get("parameters", {}).get("retry_after", 5))
+                except ValueError:
+                    return 5.0
+            if response.status_code != 200:
+                print(f"Telegram error: HTTP {response.status_code} {response.text[:200]}")
+        except Exception as e:
+            print(f"Telegram error: {e}")
+        return None
+
+
+telegram_notifier = TelegramNotifier(
+    digest_interval=settings.telegram_digest_interval,
+    chat_interval=settings.telegram_chat_interval,
+    max_queue=settings.telegram_queue_size
+)
+atexit.register(telegram_notifier.flush, 5)
+
+
+def telegram_notify(token, chat_id, message, account=None):
+    """Queue a Telegram message; messages for the same account are sent as a digest"""
+    telegram_notifier.notify(token, chat_id, message, account)
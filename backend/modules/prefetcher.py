@@ -0,0 +1,88 @@
+"""
+Background prefetch of upcoming upload clips into the shared video store
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List
+
+from config.settings import settings
+from modules.downloader import get_download_link
+from modules.video_store import video_store
+
+
+class Prefetcher:
+    """Resolve and download the next clips of an upload job while the current one uploads.
+
+    Clips land in the shared video store unpinned, exactly as if another
+    account had downloaded them, so the upload step that reaches them finds
+    them with ``video_store.open``. If that step gets there while the
+    prefetch is still running, the store's per-link lock makes it wait for
+    the download in flight instead of starting a second one. Prefetching only
+    runs while the store is under its size budget, so speculative downloads
+    never evict clips that are already stored.
+    """
+
+    def __init__(self, workers: int, max_bytes: int):
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self._executor = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+        return self._executor
+
+    def schedule(self, video_links: List[str]) -> int:
+        """Start prefetching clips that aren't stored or already on the way; returns how many were queued"""
+        queued = 0
+        for video_link in video_links:
+            with self._lock:
+                if video_link in self._pending:
+                    continue
+            if video_store.contains(video_link):
+                continue
+
+            with self._lock:
+                if video_link in self._pending:
+                    continue
+                future = self._get_executor().submit(self._prefetch, video_link)
+                self._pending[video_link] = future
+            future.add_done_callback(lambda _, link=video_link: self._done(link))
+            queued += 1
+        return queued
+
+    def _done(self, video_link: str):
+        with self._lock:
+            self._pending.pop(video_link, None)
+
+    def _prefetch(self, video_link: str) -> bool:
+        try:
+            if video_store.total_bytes() >= self.max_bytes:
+                print(f"⏭️ Video store is full, not prefetching {video_link}")
+                return False
+
+            download_url = get_download_link(video_link)
+            if not download_url:
+                print(f"⚠️ Prefetch could not resolve {video_link}")
+                return False
+
+            if not video_store.add(video_link, download_url):
+                print(f"⚠️ Prefetch download failed for {video_link}")
+                return False
+
+            # Keep the clip but drop our pin; the upload step takes its own
+            video_store.release(video_link)
+            print(f"📦 Prefetched {video_link}")
+            return True
+        except Exception as e:
+            print(f"⚠️ Prefetch failed for {video_link}: {e}")
+            return False
+
+
+prefetcher = Prefetcher(
+    workers=settings.upload_prefetch_workers,
+    max_bytes=settings.video_store_max_mb * 1024 * 1024
+)
@@ -0,0 +1,191 @@
+"""
+Rolling proxy health windows backed by the proxy_checks history table
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from config.settings import settings
+from modules.database import get_database_connection
+
+# (checked_at, ok, latency in ms or None)
+Sample = Tuple[float, bool, Optional[int]]
+
+
+def percentile(sorted_values: List[int], pct: float) -> Optional[int]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class ProxyHealthTracker:
+    """Keep the last ``window_size`` checks of every proxy in memory.
+
+    Every check is appended to the ``proxy_checks`` table and to an
+    in-process window keyed by ``host:port``. The windows are only a cache
+    of the table: one is re-read once it is older than ``max_age`` seconds,
+    so checks recorded by another process (the API runs the checks, the
+    Celery worker routes downloads) show up within that time. Latency
+    percentiles only count successful checks.
+    """
+
+    def __init__(self, window_size: int, min_samples: int, min_success_rate: float, max_age: float):
+        self.window_size = window_size
+        self.min_samples = min_samples
+        self.min_success_rate = min_success_rate
+        self.max_age = max_age
+        self._windows: Dict[str, Deque[Sample]] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, proxy_keys: Iterable[str], force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            stale = [
+                key for key in set(proxy_keys)
+                if force or key not in self._windows or now - self._loaded_at[key] > self.max_age
+            ]
+        if not stale:
+            return
+
+        loaded = {key: deque(maxlen=self.window_size) for key in stale}
+        try:
+            with get_database_connection() as conn:
+                cursor = conn.cursor()
+                placeholders = ",".join("?" * len(stale))
+                cursor.execute(f'''
+                    SELECT proxy_key, checked_at, ok, latency_ms
+                    FROM (
+                        SELECT proxy_key, checked_at, ok, latency_ms,
+                               ROW_NUMBER() OVER (PARTITION BY proxy_key ORDER BY checked_at DESC) AS rn
+                        FROM proxy_checks
+                        WHERE proxy_key IN ({placeholders})
+                    )
+                    WHERE rn <= ?
+                    ORDER BY checked_at
+                ''', (*stale, self.window_size))
+                for proxy_key, checked_at, ok, latency_ms in cursor.fetchall():
+                    loaded[proxy_key].append((checked_at, bool(ok), latency_ms))
+        except Exception as e:
+            # Keep what we have and try again after max_age rather than on every lookup
+            print(f"⚠️ Failed to load proxy check history: {e}")
+            with self._lock:
+                for key in stale:
+                    self._windows.setdefault(key, loaded[key])
+                    self._loaded_at[key] = now
+            return
+
+        with self._lock:
+            self._windows.update(loaded)
+            self._loaded_at.update(dict.fromkeys(loaded, now))
+
+    def reload(self, proxy_keys: Iterable[str]):
+        """Re-read the windows of these proxies from the table now, whatever their age"""
+        self._load(proxy_keys, force=True)
+
+    def record_many(self, checks: List[Tuple[str, bool, Optional[float]]]):
+        """Store checks given as (proxy_key, ok, latency in seconds)"""
+        if not checks:
+            return
+
+        now = time.time()
+        rows = [
+            (proxy_key, now, 1 if ok else 0, int(latency * 1000) if ok and latency is not None else None)
+            for proxy_key, ok, latency in checks
+        ]
+
+        # Fill the windows first so the new sample isn't loaded twice
+        self._load(row[0] for row in rows)
+        with self._lock:
+            for proxy_key, checked_at, ok, latency_ms in rows:
+                self._windows[proxy_key].append((checked_at, bool(ok), latency_ms))
+
+        try:
+            with get_database_connection() as conn:
+                conn.executemany('''
+                    INSERT INTO proxy_checks (proxy_key, checked_at, ok, latency_ms)
+                    VALUES (?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️ Failed to save proxy checks: {e}")
+
+    def record(self, proxy_key: str, ok: bool, latency: Optional[float] = None):
+        self.record_many([(proxy_key, ok, latency)])
+
+    def stats(self, proxy_key: str) -> Dict[str, Any]:
+        """Success rate, p50/p95 latency and current failure streak for one proxy"""
+        self._load([proxy_key])
+        with self._lock:
+            window = list(self._windows.get(proxy_key, ()))
+
+        latencies = sorted(latency for _, ok, latency in window if ok and latency is not None)
+        successes = sum(1 for _, ok, _ in window if ok)
+
+        consecutive_failures = 0
+        for _, ok, _ in reversed(window):
+            if ok:
+                break
+            consecutive_failures += 1
+
+        return {
+            'proxy': proxy_key,
+            'samples': len(window),
+            'success_rate': round(successes / len(window), 3) if window else None,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'consecutive_failures': consecutive_failures,
+            'last_check': window[-1][0] if window else None
+        }
+
+    def should_disable(self, proxy_key: str, failure_threshold: int) -> bool:
+        """A proxy is cut after a failure streak, or when enough checks show a poor success rate"""
+        stats = self.stats(proxy_key)
+        if stats['consecutive_failures'] >= failure_threshold:
+            return True
+        return stats['samples'] >= self.min_samples and stats['success_rate'] < self.min_success_rate
+
+    def rank(self, proxy_keys: Iterable[str]) -> List[str]:
+        """Order proxies best first: reliable before flaky, then by median latency.
+
+        Proxies without enough history sort between proven and poor ones so
+        they still get a chance to build one.
+        """
+        proxy_keys = list(proxy_keys)
+        self._load(proxy_keys)
+
+        def sort_key(proxy_key: str):
+            stats = self.stats(proxy_key)
+            if stats['samples'] < self.min_samples:
+                return (1, stats['consecutive_failures'], float('inf'))
+            tier = 0 if stats['success_rate'] >= self.min_success_rate else 2
+            p50 = stats['p50_ms'] if stats['p50_ms'] is not None else float('inf')
+            return (tier, p50, -stats['success_rate'])
+
+        return sorted(proxy_keys, key=sort_key)
+
+    def prune(self, retention_days: Optional[float] = None) -> int:
+        """Delete history older than the retention period"""
+        retention_days = settings.proxy_checks_retention_days if retention_days is None else retention_days
+        try:
+            with get_database_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM proxy_checks WHERE checked_at < ?',
+                               (time.time() - retention_days * 86400,))
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            print(f"⚠️ Failed to prune proxy check history: {e}")
+            return 0
+
+
+proxy_health = ProxyHealthTracker(
+    window_size=settings.proxy_health_window,
+    min_samples=settings.proxy_health_min_samples,
+    min_success_rate=settings.proxy_min_success_rate,
+    max_age=settings.proxy_health_max_age
+)
@@ -0,0 +1,136 @@
+"""
+Spread download and SnapTik traffic across the healthy account proxies
+"""
+
+import random
+import statistics
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config.settings import settings
+from modules.database import get_database_connection
+from modules.proxy_health import proxy_health
+from modules.proxy_utils import format_proxy_key
+
+DIRECT = "direct"
+
+
+class ProxyRouter:
+    """Pick an outbound route for each download or link resolution.
+
+    Candidates are the distinct active proxies configured on accounts that
+    haven't failed their last health check, plus the host's own IP when
+    ``include_direct`` is set. Routes are drawn at random weighted by the
+    inverse of their median check latency, so faster proxies carry more of
+    the traffic and no single IP hits the TikTok/SnapTik rate limit. A route
+    that fails a request is benched for ``failure_cooldown`` seconds.
+
+    Proxy checks usually run in the API process, so every refresh also
+    re-reads the routed proxies' health windows from ``proxy_checks``.
+    """
+
+    def __init__(self, enabled: bool, include_direct: bool, refresh_interval: float, failure_cooldown: float):
+        self.enabled = enabled
+        self.include_direct = include_direct
+        self.refresh_interval = refresh_interval
+        self.failure_cooldown = failure_cooldown
+        self._proxies: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at = 0.0
+        self._benched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+
+        proxies = {}
+        try:
+            with get_database_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT proxy_host, proxy_port, proxy_username, proxy_password, proxy_type
+                    FROM accounts
+                    WHERE proxy_active = 1
+                      AND proxy_host IS NOT NULL
+                      AND COALESCE(proxy_status, 'unchecked') != 'failed'
+                ''')
+                for host, port, username, password, proxy_type in cursor.fetchall():
+                    key = format_proxy_key(host, port)
+                    proxies.setdefault(key, {
+                        'key': key,
+                        'host': host,
+                        'port': port,
+                        'username': username,
+                        'password': password,
+                        'type': proxy_type or 'HTTP'
+                    })
+        except Exception as e:
+            print(f"⚠️ Failed to load proxies for routing: {e}")
+            return
+
+        proxy_health.reload(proxies)
+
+        with self._lock:
+            self._proxies = proxies
+            self._loaded_at = time.monotonic()
+
+    def candidates(self, exclude: Iterable[str] = (), require_no_auth: bool = False) -> List[Tuple[Optional[Dict[str, Any]], float]]:
+        """Usable routes with their weights; None stands for the direct route"""
+        exclude = set(exclude)
+        now = time.monotonic()
+
+        if self.enabled:
+            self._refresh()
+        with self._lock:
+            proxies = list(self._proxies.values()) if self.enabled else []
+            benched = {key for key, until in self._benched.items() if until > now}
+
+        routes = []
+        for proxy in proxies:
+            if proxy['key'] in exclude or proxy['key'] in benched:
+                continue
+            if require_no_auth and proxy['username']:
+                continue
+            if proxy_health.should_disable(proxy['key'], settings.proxy_failure_threshold):
+                continue
+            routes.append((proxy, proxy_health.stats(proxy['key'])['p50_ms']))
+
+        # Proxies without latency data (and the direct route) are weighted like a typical proxy
+        known = [p50 for _, p50 in routes if p50 is not None]
+        typical = statistics.median(known) if known else 1000
+        weighted = [(proxy, 1000 / max(p50 if p50 is not None else typical, 50)) for proxy, p50 in routes]
+
+        direct_allowed = DIRECT not in exclude and DIRECT not in benched
+        if direct_allowed and (self.include_direct or not weighted):
+            weighted.append((None, 1000 / max(typical, 50)))
+        return weighted
+
+    def choose(self, exclude: Iterable[str] = (), require_no_auth: bool = False) -> Optional[Dict[str, Any]]:
+        """Draw a proxy config for the next request, or None to go direct"""
+        routes = self.candidates(exclude, require_no_auth)
+        if not routes:
+            return None
+        proxies, weights = zip(*routes)
+        return random.choices(proxies, weights=weights)[0]
+
+    def report_failure(self, proxy: Optional[Dict[str, Any]]):
+        """Bench a route that just failed a request"""
+        if not self.enabled:
+            return  # Direct is the only route, there is nothing to route around
+        key = route_key(proxy)
+        with self._lock:
+            self._benched[key] = time.monotonic() + self.failure_cooldown
+        print(f"🚧 Routing around {key} for {self.failure_cooldown:.0f}s")
+
+
+def route_key(proxy: Optional[Dict[str, Any]]) -> str:
+    return proxy['key'] if proxy else DIRECT
+
+
+proxy_router = ProxyRouter(
+    enabled=settings.download_proxy_routing,
+    include_direct=settings.download_proxy_include_direct,
+    refresh_interval=settings.download_proxy_refresh_interval,
+    failure_cooldown=settings.download_proxy_failure_cooldown
+)
@@ -2,11 +2,20 @@
 Utility functions for proxy management
 """
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from modules.database import get_database_connection
+import httpx
 import requests
 import time
 
+# Tried in order; the first 200 means the proxy works
+PROXY_TEST_URLS = [
+    'http://httpbin.org/ip',
+    'https://httpbin.org/ip',
+    'http://icanhazip.com',
+    'https://api.ipify.org?format=json'
+]
+
 
 def get_account_proxy_config(username: str) -> Optional[Dict[str, Any]]:
     """Get proxy configuration for an account"""
@@ -40,6 +49,11 @@ def get_account_proxy_config(username: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+def format_proxy_key(host: str, port: int) -> str:
+    """Identify a proxy by host:port (shared by rate limits and health history)"""
+    return f"{host}:{port}"
+
+
 def build_proxy_url(proxy_config: Dict[str, Any]) -> str:
     """Build proxy URL from config"""
     host = proxy_config['host']
@@ -100,15 +114,7 @@ def test_proxy_connection(proxy_config: Dict[str, Any], timeout: int = 15) -> bo
         print(f"🔍 Proxy type: {proxy_config.get('type', 'HTTP')}")
         print(f"🔍 Proxy URL: {build_proxy_url(proxy_config)}")
 
-        # Try multiple test URLs
-        test_urls = [
-            'http://httpbin.org/ip',
-            'https://httpbin.org/ip',
-            'http://icanhazip.com',
-            'https://api.ipify.org?format=json'
-        ]
-
-        for test_url in test_urls:
+        for test_url in PROXY_TEST_URLS:
             try:
                 print(f"🌐 Testing with: {test_url}")
                 start_time = time.time()
@@ -150,6 +156,58 @@ def test_proxy_connection(proxy_config: Dict[str, Any], timeout: int = 15) -> bo
         return False
 
 
+async def check_proxy_async(proxy_config: Dict[str, Any], timeout: float = 5) -> Dict[str, Any]:
+    """Test a proxy without blocking the event loop.
+
+    Returns ``working``, ``response_time`` of the successful request and
+    ``error``. Stops at the first URL that answers, and gives up as soon as
+    the proxy itself can't be reached instead of trying every URL.
+    """
+    last_error = None
+    try:
+        async with httpx.AsyncClient(
+            proxy=build_proxy_url(proxy_config),
+            timeout=httpx.Timeout(timeout),
+            verify=False  # Skip SSL verification for problematic proxies
+        ) as client:
+            for test_url in PROXY_TEST_URLS:
+                start_time = time.monotonic()
+                try:
+                    response = await client.get(test_url)
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    # The proxy is unreachable, other URLs won't help
+                    return {'working': False, 'response_time': None, 'error': f"{type(e).__name__}: {e}"}
+                except httpx.HTTPError as e:
+                    last_error = f"{type(e).__name__} with {test_url}: {e}"
+                    continue
+
+                if response.status_code == 200:
+                    return {'working': True, 'response_time': time.monotonic() - start_time, 'error': None}
+                last_error = f"Status code {response.status_code} from {test_url}"
+
+    except Exception as e:
+        # Malformed proxy settings, missing SOCKS support and the like
+        last_error = f"{type(e).__name__}: {e}"
+
+    return {'working': False, 'response_time': None, 'error': last_error or "All test URLs failed"}
+
+
+def update_proxy_statuses(usernames: List[str], status: str):
+    """Update proxy status for every account behind one proxy"""
+    if not usernames:
+        return
+    try:
+        with get_database_connection() as conn:
+            conn.executemany('''
+                UPDATE accounts
+                SET proxy_status = ?, proxy_last_check = CURRENT_TIMESTAMP
+                WHERE username = ?
+            ''', [(status, username) for username in usernames])
+            conn.commit()
+    except Exception as e:
+        print(f"Error updating proxy status for {', '.join(usernames)}: {e}")
+
+
 def update_proxy_status(username: str, status: str, error_message: str = None):
     """Update proxy status for account"""
     try:
@@ -0,0 +1,180 @@
+"""
+Per-account and per-proxy token-bucket rate limits for Instagram actions
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from modules.proxy_utils import get_account_proxy_config, format_proxy_key
+from modules.redis_client import get_redis_client
+
+# Refill every bucket to "now" (Redis server time) and, if all of them hold
+# `cost` tokens and ARGV[2] is 1, take the tokens from all of them at once.
+# ARGV: cost, consume, then (capacity, refill per second) for each key.
+# Returns the wait in seconds followed by each bucket's token count, as strings
+# because Lua numbers are truncated to integers on the way back.
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local consume = tonumber(ARGV[2]) == 1
+local tokens = {}
+local wait = 0
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    tokens[i] = level
+    if level < cost then
+        wait = math.max(wait, (cost - level) / rate)
+    end
+end
+
+local result = {tostring(wait)}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    local level = tokens[i]
+    if consume and wait == 0 then
+        level = level - cost
+    end
+    redis.call('HSET', key, 'tokens', level, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+    table.insert(result, tostring(level))
+end
+return result
+"""
+
+
+class RateLimiter:
+    """Token buckets in Redis shared by every worker.
+
+    Each action (upload, login) has a bucket per account, and every action
+    also draws from one bucket per proxy so accounts sharing a proxy share
+    its budget. A request is granted only when all its buckets have a token,
+    and then takes from all of them atomically. If Redis is unreachable the
+    limiter lets requests through rather than stalling uploads, and reports
+    the nominal interval between tokens as the time to wait.
+    """
+
+    KEY_PREFIX = "ratelimit:"
+    PROXY_ACTION = "proxy"
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        # action -> (capacity, tokens per hour)
+        self.limits = limits
+        self._script = None
+
+    def _buckets(self, action: str, username: str, proxy_key: Optional[str]) -> List[Tuple[str, str, float, float]]:
+        if action not in self.limits:
+            raise ValueError(f"Unknown rate limit action '{action}'")
+
+        capacity, per_hour = self.limits[action]
+        buckets = [(action, f"{self.KEY_PREFIX}{action}:account:{username}", capacity, per_hour / 3600)]
+        if proxy_key:
+            capacity, per_hour = self.limits[self.PROXY_ACTION]
+            buckets.append((self.PROXY_ACTION, f"{self.KEY_PREFIX}proxy:{proxy_key}", capacity, per_hour / 3600))
+        return buckets
+
+    def _run(self, action: str, username: str, proxy_key: Optional[str], cost: float, consume: bool):
+        buckets = self._buckets(action, username, proxy_key)
+        if self._script is None:
+            self._script = get_redis_client().register_script(TOKEN_BUCKET_SCRIPT)
+
+        args = [cost, 1 if consume else 0]
+        for _, _, capacity, rate in buckets:
+            args.extend([capacity, rate])
+
+        result = self._script(keys=[key for _, key, _, _ in buckets], args=args)
+        tokens = {name: float(level) for (name, _, _, _), level in zip(buckets, result[1:])}
+        return float(result[0]), tokens
+
+    def acquire(self, action: str, username: str, proxy_key: Optional[str] = None, cost: float = 1) -> float:
+        """Try to take tokens; returns 0 when granted, else seconds until they would be available"""
+        try:
+            wait, _ = self._run(action, username, proxy_key, cost, consume=True)
+            return wait
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Rate limiter unavailable, allowing {action} for @{username}: {e}")
+            return 0.0
+
+    def retry_after(self, action: str, username: str, proxy_key: Optional[str] = None, cost: float = 1) -> float:
+        """Seconds until `cost` tokens are available, without taking any"""
+        try:
+            wait, _ = self._run(action, username, proxy_key, cost, consume=False)
+            return wait
+        except ValueError:
+            raise
+        except Exception as e:
+            # Without Redis fall back to the nominal spacing rather than no spacing at all
+            print(f"⚠️ Rate limiter unavailable, using nominal {action} interval: {e}")
+            return cost * 3600 / self.limits[action][1]
+
+    def wait(self, action: str, username: str, proxy_key: Optional[str] = None,
+             max_wait: Optional[float] = None) -> float:
+        """Block until a token is taken; returns 0, or the remaining wait if it exceeds max_wait"""
+        max_wait = settings.rate_limit_max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.acquire(action, username, proxy_key)
+            if wait <= 0:
+                return 0.0
+            if time.monotonic() + wait > deadline:
+                return wait
+            print(f"⏳ Rate limit for {action} on @{username}: waiting {wait:.1f}s")
+            time.sleep(wait)
+
+    def status(self, username: str, proxy_key: Optional[str] = None) -> Dict[str, Any]:
+        """Remaining budget per action for an account (and its proxy)"""
+        result = {"username": username, "proxy": proxy_key, "actions": {}}
+        for action in self.limits:
+            if action == self.PROXY_ACTION:
+                continue
+            wait, tokens = self._run(action, username, proxy_key, 1, consume=False)
+            capacity, per_hour = self.limits[action]
+            result["actions"][action] = {
+                "tokens": round(tokens[action], 3),
+                "capacity": capacity,
+                "per_hour": per_hour,
+                "retry_after": round(wait, 1)
+            }
+            if proxy_key:
+                capacity, per_hour = self.limits[self.PROXY_ACTION]
+                result["proxy_budget"] = {
+                    "tokens": round(tokens[self.PROXY_ACTION], 3),
+                    "capacity": capacity,
+                    "per_hour": per_hour
+                }
+        return result
+
+
+class RateLimitExceeded(Exception):
+    """Raised when an action can't get a token within the allowed wait"""
+
+    def __init__(self, action: str, username: str, retry_after: float):
+        super().__init__(f"Rate limit for {action} on @{username}, retry in {retry_after:.0f}s")
+        self.action = action
+        self.username = username
+        self.retry_after = retry_after
+
+
+def get_proxy_key(username: str) -> Optional[str]:
+    """Identify an account's active proxy (host:port) for the shared proxy bucket"""
+    proxy_config = get_account_proxy_config(username)
+    if proxy_config and proxy_config.get('active'):
+        return format_proxy_key(proxy_config['host'], proxy_config['port'])
+    return None
+
+
+rate_limiter = RateLimiter({
+    "upload": (settings.rate_limit_upload_burst, settings.rate_limit_upload_per_hour),
+    "login": (settings.rate_limit_login_burst, settings.rate_limit_login_per_hour),
+    RateLimiter.PROXY_ACTION: (settings.rate_limit_proxy_burst, settings.rate_limit_proxy_per_hour)
+})
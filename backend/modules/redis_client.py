@@ -0,0 +1,27 @@
+"""
+Shared Redis client for caches, flags and rate limits
+"""
+
+import threading
+
+import redis
+
+from config.settings import settings
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis_client() -> redis.Redis:
+    """Get the process-wide Redis client (thread-safe, connection pooled)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    settings.redis_url,
+                    decode_responses=True,
+                    socket_timeout=5,
+                    socket_connect_timeout=5
+                )
+    return _client
@@ -1,10 +1,19 @@
 from celery import Task
 from celery_app import app
+from config.settings import settings
 from modules.downloader import get_download_link, download_video
 from modules.uploader import upload_video_to_instagram
+from modules.rate_limiter import rate_limiter, RateLimitExceeded, get_proxy_key
 from modules.logger import telegram_notify
-from modules.database import record_publication, is_video_published
-from services.task_service import TaskService
+from modules.database import (
+    record_publication, is_video_published, published_subset, ingest_videos,
+    get_source_high_water_marks, update_source_fetch_state
+)
+from modules.fetcher import stream_videos_for_theme_from_accounts
+from modules.video_store import video_store
+from modules.prefetcher import prefetcher
+from services.task_service import TaskService, progress_writer
+from services.cancellation_service import cancellation_service
 import os
 import random
 import time
@@ -21,25 +30,29 @@ class ProgressTask(Task):
     def __init__(self):
         self.should_stop = False
 
+    @property
+    def job_id(self) -> str:
+        """Task log ID: the upload job this step belongs to, or this task's own ID"""
+        return (self.request.kwargs or {}).get("job_id") or self.request.id
+
     def update_progress(self, current_video: int, total_videos: int, current_item: str, cooldown: int = None):
         """Update task progress with detailed info"""
         message = f"Processing {current_video}/{total_videos}: {current_item}"
         if cooldown:
             message += f" (Next in {cooldown}s)"
 
-        # Update database with progress info using Celery task ID
-        asyncio.run(TaskService.update_task_progress(
-            task_id=self.request.id,  # Use Celery task ID
+        # Buffer progress info under the job's task ID; it is written in batches
+        progress_writer.record(
+            task_id=self.job_id,
             progress=0,  # No percentage
             current_item=current_item,
             message=message,
             cooldown_seconds=cooldown
-        ))
+        )
 
     def check_if_cancelled(self):
         """Check if task should be cancelled"""
-        task_info = asyncio.run(TaskService.get_task_progress(self.request.id))
-        if task_info and task_info.status == "cancelled":
+        if cancellation_service.is_cancelled(self.job_id):
             self.should_stop = True
             return True
         return False
@@ -48,10 +61,15 @@ class ProgressTask(Task):
         """Cancel the current task"""
         self.should_stop = True
         asyncio.run(TaskService.update_task_status(
-            task_id=self.request.id,
+            task_id=self.job_id,
             status="cancelled",
             message="Task cancelled by user"
         ))
+        cancellation_service.publish(self.job_id)
+
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        """Stop tracking cancellation once this step has finished"""
+        cancellation_service.unwatch((kwargs or {}).get("job_id") or task_id)
 
 
 # Keep original function for backward compatibility
@@ -69,14 +87,14 @@ def process_video(self, account, videos, telegram_token, chat_id):
 
         download_url = get_download_link(video)
         if not download_url:
-            telegram_notify(telegram_token, chat_id, f"Failed to download video from: {video}")
+            telegram_notify(telegram_token, chat_id, f"Failed to download video from: {video}", account=username)
             continue
 
         unique_hash = hashlib.md5(f"{username}_{video}".encode()).hexdigest()
         output_path = f"./videos/{unique_hash}.mp4"
         success = download_video(download_url, output_path)
         if not success:
-            telegram_notify(telegram_token, chat_id, f"Failed to download video from: {video}")
+            telegram_notify(telegram_token, chat_id, f"Failed to download video from: {video}", account=username)
             continue
 
         caption = random.choice(
@@ -86,11 +104,13 @@ def process_video(self, account, videos, telegram_token, chat_id):
         cooldown = random.randint(300, 1500)
         if upload_result:
             telegram_notify(telegram_token, chat_id,
-                            f"Successfully uploaded video from: {video} to account: {username}. Cooldown = {cooldown} s")
+                            f"Successfully uploaded video from: {video} to account: {username}. Cooldown = {cooldown} s",
+                            account=username)
             record_publication(username, video)
             os.remove(output_path)
         else:
-            telegram_notify(telegram_token, chat_id, f"Failed to upload video from: {video} to account: {username}")
+            telegram_notify(telegram_token, chat_id, f"Failed to upload video from: {video} to account: {username}",
+                            account=username)
 
         time.sleep(cooldown)
 
@@ -98,47 +118,93 @@ def process_video(self, account, videos, telegram_token, chat_id):
 # Enhanced function with detailed progress tracking and cancellation
 @app.task(bind=True, base=ProgressTask, max_retries=3)
 def process_video_with_progress(self, account, videos, telegram_token, chat_id):
-    """Enhanced video processing with detailed progress tracking and cancellation support"""
-    username, password, theme, two_fa_key = account
+    """Start an upload job with detailed progress tracking and cancellation support.
+
+    Each video is handled by its own upload_video_step task. The cooldown between
+    uploads is the countdown of the next step rather than a sleep, so no worker
+    slot is held while an account cools down. This task's Celery ID is the job ID
+    used in task_logs.
+    """
+    username = account[0]
+
+    # Drop everything this account already posted with one query up front
+    published = published_subset(username, videos)
+    videos = [video for video in videos if video not in published]
+    skipped_count = len(published)
     total_videos = len(videos)
 
+    message = f"Starting upload of {total_videos} videos to @{username}"
+    if skipped_count:
+        message += f" ({skipped_count} already posted, skipped)"
+
     # Initialize task logging with Celery task ID
     asyncio.run(TaskService.log_task(
         task_id=self.request.id,  # Use Celery task ID directly
         task_type="upload",
         status="running",
         account_username=username,
-        message=f"Starting upload of {total_videos} videos to @{username}",
+        message=message,
         total_items=total_videos,
         progress=0
     ))
 
-    # Load captions
-    captions = []
+    if not videos:
+        asyncio.run(TaskService.update_task_status(
+            task_id=self.request.id,
+            status="success",
+            message=f"Nothing to upload to @{username}: all {skipped_count} videos were already posted"
+        ))
+    else:
+        upload_video_step.delay(account, videos, telegram_token, chat_id, job_id=self.request.id)
+
+    return {
+        "job_id": self.request.id,
+        "total_videos": total_videos,
+        "skipped_videos": skipped_count,
+        "account": username
+    }
+
+
+def load_captions():
+    """Load caption templates, falling back to a default caption"""
     try:
         with open("captions.json", "r") as outfile:
-            captions = json.load(outfile)
+            return json.load(outfile)
     except Exception as e:
-        captions = ["Default caption #video #content"]
         print(f"Could not load captions: {e}")
+        return ["Default caption #video #content"]
+
+
+@app.task(bind=True, base=ProgressTask, max_retries=3)
+def upload_video_step(self, account, videos, telegram_token, chat_id, job_id,
+                      index=0, success_count=0, failed_count=0):
+    """Process videos of an upload job starting at `index` until one is uploaded.
 
-    success_count = 0
-    failed_count = 0
+    After a successful upload the next step is scheduled with the cooldown as its
+    countdown and this task returns, releasing the worker slot.
+    """
+    username, password, theme, two_fa_key = account
+    total_videos = len(videos)
+    captions = load_captions()
+    proxy_key = get_proxy_key(username)
+    next_cooldown = None
+    next_index = index
+
+    for i in range(index + 1, total_videos + 1):
+        video = videos[i - 1]
 
-    for i, video in enumerate(videos, 1):
         # Check for cancellation at the start of each video
         if self.check_if_cancelled():
             telegram_notify(telegram_token, chat_id,
-                            f"🛑 Upload task cancelled for @{username} after {i - 1}/{total_videos} videos")
+                            f"🛑 Upload task cancelled for @{username} after {i - 1}/{total_videos} videos", account=username)
             raise Ignore()
 
         current_video_name = f"Video {i}"
+        pinned = False
 
         try:
-            # Update progress - starting this video
-            self.update_progress(i, total_videos, f"Checking if {current_video_name} was already posted")
-
-            # Check if already published
+            # The job start filtered published videos; this only catches another job for the
+            # same account having posted it while this one was cooling down
             if is_video_published(username, video):
                 self.update_progress(i, total_videos, f"{current_video_name} - Already posted, skipping")
                 continue
@@ -146,41 +212,54 @@ def process_video_with_progress(self, account, videos, telegram_token, chat_id):
             # Check for cancellation before download
             if self.check_if_cancelled():
                 telegram_notify(telegram_token, chat_id,
-                                f"🛑 Upload task cancelled for @{username} during {current_video_name}")
+                                f"🛑 Upload task cancelled for @{username} during {current_video_name}", account=username)
                 raise Ignore()
 
-            # Update progress - getting download link
-            self.update_progress(i, total_videos, f"Getting download link for {current_video_name}")
+            # Get the next clips ready while this one uploads and the account cools down
+            if settings.upload_prefetch_depth > 0:
+                prefetcher.schedule(videos[i:i + settings.upload_prefetch_depth])
 
-            download_url = get_download_link(video)
-            if not download_url:
-                failed_count += 1
-                self.update_progress(i, total_videos, f"{current_video_name} - Failed to get download link")
-                telegram_notify(telegram_token, chat_id, f"❌ Failed to get download link: {video}")
-                continue
+            # Reuse the clip if another account (or the prefetcher) already downloaded it
+            output_path = video_store.open(video)
 
-            # Update progress - downloading video
-            self.update_progress(i, total_videos, f"Downloading {current_video_name}")
+            if output_path:
+                self.update_progress(i, total_videos, f"{current_video_name} - Using stored download")
+            else:
+                # Update progress - getting download link
+                self.update_progress(i, total_videos, f"Getting download link for {current_video_name}")
 
-            unique_hash = hashlib.md5(f"{username}_{video}".encode()).hexdigest()
-            output_path = f"./videos/{unique_hash}.mp4"
-            success = download_video(download_url, output_path)
+                download_url = get_download_link(video)
+                if not download_url:
+                    failed_count += 1
+                    self.update_progress(i, total_videos, f"{current_video_name} - Failed to get download link")
+                    telegram_notify(telegram_token, chat_id, f"❌ Failed to get download link: {video}",
+                                    account=username)
+                    continue
 
-            if not success:
-                failed_count += 1
-                self.update_progress(i, total_videos, f"{current_video_name} - Download failed")
-                telegram_notify(telegram_token, chat_id, f"❌ Failed to download: {video}")
-                continue
+                # Update progress - downloading video
+                self.update_progress(i, total_videos, f"Downloading {current_video_name}")
+
+                output_path = video_store.add(video, download_url)
+
+                if not output_path:
+                    # The link may be a cached one the CDN already expired; resolve once more
+                    fresh_url = get_download_link(video, use_cache=False)
+                    if fresh_url and fresh_url != download_url:
+                        output_path = video_store.add(video, fresh_url)
+
+                if not output_path:
+                    failed_count += 1
+                    self.update_progress(i, total_videos, f"{current_video_name} - Download failed")
+                    telegram_notify(telegram_token, chat_id, f"❌ Failed to download: {video}", account=username)
+                    continue
+
+            # From here on the clip is pinned in the store until this video is done
+            pinned = True
 
             # Check for cancellation before upload
             if self.check_if_cancelled():
-                # Clean up downloaded file
-                try:
-                    os.remove(output_path)
-                except:
-                    pass
                 telegram_notify(telegram_token, chat_id,
-                                f"🛑 Upload task cancelled for @{username} before uploading {current_video_name}")
+                                f"🛑 Upload task cancelled for @{username} before uploading {current_video_name}", account=username)
                 raise Ignore()
 
             # Update progress - uploading to Instagram
@@ -195,8 +274,10 @@ def process_video_with_progress(self, account, videos, telegram_token, chat_id):
             if upload_result:
                 success_count += 1
 
-                # Calculate cooldown for next video
-                cooldown = random.randint(300, 1500) if i < total_videos else 0
+                # Wait until the account's upload budget refills, plus some jitter
+                cooldown = 0
+                if i < total_videos:
+                    cooldown = int(rate_limiter.retry_after("upload", username, proxy_key)) + random.randint(5, 60)
 
                 # Update progress - upload successful
                 if cooldown > 0:
@@ -211,81 +292,165 @@ def process_video_with_progress(self, account, videos, telegram_token, chat_id):
                 # Record publication
                 record_publication(username, video)
 
-                # Clean up video file
-                try:
-                    os.remove(output_path)
-                except:
-                    pass
-
                 # Send success notification
                 telegram_notify(
                     telegram_token, chat_id,
                     f"✅ Successfully uploaded {current_video_name} to @{username}\n"
                     f"📊 Progress: {i}/{total_videos}\n"
-                    f"⏱️ Cooldown: {cooldown}s"
+                    f"⏱️ Cooldown: {cooldown}s",
+                    account=username
                 )
 
-                # Wait cooldown period with live updates and cancellation checks
                 if cooldown > 0:
-                    remaining = cooldown
-                    while remaining > 0:
-                        # Check for cancellation during cooldown
-                        if self.check_if_cancelled():
-                            telegram_notify(telegram_token, chat_id,
-                                            f"🛑 Upload task cancelled for @{username} during cooldown")
-                            raise Ignore()
-
-                        wait_time = min(10, remaining)
-                        time.sleep(wait_time)
-                        remaining -= wait_time
-
-                        if remaining > 0:
-                            self.update_progress(
-                                i, total_videos,
-                                f"{current_video_name} uploaded - Cooldown remaining: {remaining}s",
-                                remaining
-                            )
-
-                    # Cooldown completed
-                    if i < total_videos:
-                        self.update_progress(i, total_videos, f"{current_video_name} completed - Moving to next video")
+                    next_cooldown = cooldown
+                    next_index = i
+                    break
 
             else:
                 failed_count += 1
                 self.update_progress(i, total_videos, f"{current_video_name} - Upload failed")
-                telegram_notify(telegram_token, chat_id, f"❌ Failed to upload {current_video_name} to @{username}")
-
-                # Clean up failed video file
-                try:
-                    os.remove(output_path)
-                except:
-                    pass
+                telegram_notify(telegram_token, chat_id, f"❌ Failed to upload {current_video_name} to @{username}",
+                                account=username)
 
         except Ignore:
             # Task was cancelled, re-raise to stop execution
             raise
+        except RateLimitExceeded as e:
+            # No upload budget yet: retry this same video once the bucket refills
+            self.update_progress(i, total_videos, f"{current_video_name} - Rate limited, retrying",
+                                 int(e.retry_after))
+            next_cooldown = int(e.retry_after) + 1
+            next_index = i - 1
+            break
         except Exception as e:
             failed_count += 1
             error_msg = f"Error processing {current_video_name}: {str(e)}"
 
             self.update_progress(i, total_videos, f"{current_video_name} - Error occurred")
-            telegram_notify(telegram_token, chat_id, f"❌ {error_msg}")
+            telegram_notify(telegram_token, chat_id, f"❌ {error_msg}", account=username)
             continue
+        finally:
+            # Keep the clip in the shared store for other accounts, but drop this step's pin
+            if pinned:
+                video_store.release(video)
+
+    if next_cooldown is not None:
+        # Hand the rest of the job to a step that runs after the cooldown
+        upload_video_step.apply_async(
+            args=[account, videos, telegram_token, chat_id],
+            kwargs={
+                "job_id": job_id,
+                "index": next_index,
+                "success_count": success_count,
+                "failed_count": failed_count
+            },
+            countdown=next_cooldown
+        )
+        return {"job_id": job_id, "next_index": next_index, "cooldown": next_cooldown}
 
     # Task completion
     final_message = f"✅ Upload task completed for @{username}\n📊 Results: {success_count} successful, {failed_count} failed out of {total_videos} total"
 
     asyncio.run(TaskService.update_task_status(
-        task_id=self.request.id,
+        task_id=job_id,
         status="success" if success_count > 0 else "failed",
         message=final_message
     ))
 
-    telegram_notify(telegram_token, chat_id, final_message)
+    telegram_notify(telegram_token, chat_id, final_message, account=username)
 
     return {
         "success_count": success_count,
         "failed_count": failed_count,
         "total_videos": total_videos,
         "account": username
-    }
\ No newline at end of file
+    }
+
+
+@app.task(bind=True, base=ProgressTask)
+def fetch_videos_task(self, theme, source_usernames, videos_per_account=10):
+    """Fetch new TikTok videos for a theme, reporting progress per source account.
+
+    The task_logs row is created by the API before this task is queued, with this
+    task's Celery ID. Cancelling stops after the account currently being fetched;
+    videos found so far are still saved.
+    """
+    total_accounts = len(source_usernames)
+
+    async def collect():
+        results = []
+        # Only page back to the newest video each source already gave us
+        async for result in stream_videos_for_theme_from_accounts(
+            theme=theme,
+            fan_accounts=source_usernames,
+            videos_per_account=videos_per_account,
+            high_water_marks=get_source_high_water_marks(theme)
+        ):
+            results.append(result)
+            self.update_progress(
+                len(results), total_accounts,
+                f"@{result.account}: {len(result.new_videos)} new videos"
+            )
+            if self.check_if_cancelled():
+                break
+        return results
+
+    try:
+        self.update_progress(0, total_accounts, f"Fetching videos for theme {theme}")
+        results = asyncio.run(collect())
+
+        # Save new videos to database in one batch
+        inserted = ingest_videos(
+            (video.url, theme, {
+                "title": video.title,
+                "author": video.author,
+                "views": video.views,
+                "likes": video.likes,
+                "posted_at": video.created_at
+            })
+            for result in results for video in result.video_infos
+        )
+        inserted_count = len(inserted)
+
+        # Advance high-water marks only once the videos are safely stored
+        for result in results:
+            update_source_fetch_state(
+                theme, result.account, result.newest_created_at,
+                result.newest_video_id, len(result.new_videos)
+            )
+
+    except Exception as e:
+        asyncio.run(TaskService.update_task_status(
+            task_id=self.job_id,
+            status="failed",
+            message=f"Fetch failed: {str(e)}"
+        ))
+        raise
+
+    if self.check_if_cancelled():
+        # The cancel endpoint already marked the task; keep its status
+        print(f"🛑 Fetch for {theme} cancelled, saved {inserted_count} new videos")
+    else:
+        asyncio.run(TaskService.update_task_status(
+            task_id=self.job_id,
+            status="success",
+            message=f"Fetched {inserted_count} new videos for {theme}"
+        ))
+
+    return {
+        "theme": theme,
+        "videos_count": inserted_count,
+        "accounts_fetched": len(results)
+    }
+
+
+@app.task
+def schedule_uploads():
+    """Periodic scheduler pass: start upload jobs for idle accounts (if enabled)"""
+    if not settings.scheduler_enabled:
+        return {"dispatched": 0, "enabled": False}
+
+    from services.scheduler_service import upload_scheduler
+
+    result = asyncio.run(upload_scheduler.run_once())
+    return {"dispatched": result["dispatched"], "enabled": True}
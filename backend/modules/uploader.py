@@ -1,75 +1,382 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from pathlib import Path
+from typing import Dict, List, Optional
 from instagrapi import Client
 from instagrapi.exceptions import LoginRequired, ChallengeRequired, PleaseWaitFewMinutes, RecaptchaChallengeForm
 from modules.logger import telegram_notify
 from modules.proxy_utils import get_account_proxy_config, get_instagrapi_proxy_settings
-import time
-import random
+from modules.rate_limiter import rate_limiter, RateLimitExceeded, get_proxy_key
+from config.settings import settings
+from modules.database import get_database_connection
+import json
 import requests
 import os
+import tempfile
+import threading
+import time
 
-SESSION_DIR = Path("./sessions")
-SESSION_DIR.mkdir(exist_ok=True)
+SESSION_DIR = Path(settings.sessions_dir)
 
 
-def get_session_path(username: str) -> Path:
-    """Get session file path for username."""
-    return SESSION_DIR / f"{username}.session"
+class SessionStore(ABC):
+    """Where instagrapi session settings live.
 
+    Implementations answer metadata (size and last update time) for many
+    accounts at once, so health listings don't load each session.
+    """
 
-def upload_video_to_instagram(username: str, password: str, video_path: str, caption: str,
-                              token: str, chat_id: str, two_fa_key: str = None) -> bool:
-    """Upload video to Instagram with proxy support."""
+    @abstractmethod
+    def load(self, username: str) -> Optional[dict]:
+        """Return saved session settings, or None if there are none"""
+
+    @abstractmethod
+    def save(self, username: str, session_settings: dict):
+        """Atomically replace an account's session settings"""
+
+    @abstractmethod
+    def delete(self, username: str):
+        """Forget an account's session"""
+
+    @abstractmethod
+    def info_many(self, usernames: List[str]) -> Dict[str, dict]:
+        """Session metadata for many accounts from the index"""
+
+    def info(self, username: str) -> dict:
+        return self.info_many([username])[username]
+
+    def exists(self, username: str) -> bool:
+        return self.info(username)["exists"]
+
+
+class FileSessionStore(SessionStore):
+    """One ``<username>.session`` JSON file per account, written via temp file + rename.
+
+    The directory is rescanned only when its mtime changes, which happens
+    whenever some worker saves (the rename) or removes a session, and saves
+    and deletes from this process update the index directly. The index is
+    trusted as is, except where a timestamp is too recent to tell a later
+    change apart: a scan taken in the same tick as the directory's last change
+    is redone on the next call, and entries whose file changed that close to
+    when it was read are re-checked with a stat until they settle.
+    """
+
+    SUFFIX = ".session"
+    RACY_WINDOW_NS = 2_000_000_000  # Coarser than any common filesystem timestamp
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._index: Dict[str, dict] = {}
+        self._index_mtime = None
+        self._lock = threading.Lock()
+
+    def path_for(self, username: str) -> Path:
+        return self.root / f"{username}{self.SUFFIX}"
+
+    def _meta(self, stat: os.stat_result, seen_ns: int) -> dict:
+        # "racy": the file could change again without its mtime moving
+        return {
+            "size": stat.st_size,
+            "modified": stat.st_mtime,
+            "racy": seen_ns - stat.st_mtime_ns < self.RACY_WINDOW_NS
+        }
+
+    def _refresh_index(self):
+        try:
+            mtime = os.stat(self.root).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime is not None and mtime == self._index_mtime:
+                return
+            index = {}
+            scanned_ns = time.time_ns()
+            if mtime is not None:
+                with os.scandir(self.root) as entries:
+                    for entry in entries:
+                        if not entry.name.endswith(self.SUFFIX):
+                            continue
+                        try:
+                            index[entry.name[:-len(self.SUFFIX)]] = self._meta(entry.stat(), scanned_ns)
+                        except FileNotFoundError:
+                            continue
+            self._index = index
+            # A file added in the same timestamp tick as this scan wouldn't move the mtime again
+            racy = mtime is not None and scanned_ns - mtime < self.RACY_WINDOW_NS
+            self._index_mtime = None if racy else mtime
+
+    def load(self, username: str) -> Optional[dict]:
+        try:
+            with open(self.path_for(username), "r") as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return None
+
+    def save(self, username: str, session_settings: dict):
+        path = self.path_for(username)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=f".{username}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(session_settings, fp, indent=4)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        meta = self._meta(os.stat(path), time.time_ns())
+        with self._lock:
+            self._index[username] = meta
+
+    def delete(self, username: str):
+        self.path_for(username).unlink(missing_ok=True)
+        with self._lock:
+            self._index.pop(username, None)
+
+    def info_many(self, usernames: List[str]) -> Dict[str, dict]:
+        self._refresh_index()
+        with self._lock:
+            index = dict(self._index)
+        root = str(self.root)
+        result = {}
+        for username in usernames:
+            path = os.path.join(root, f"{username}{self.SUFFIX}")
+            meta = index.get(username)
+            if meta is not None and meta["racy"]:
+                # Read too soon after it was written to trust; ask the file itself
+                try:
+                    meta = self._meta(os.stat(path), time.time_ns())
+                except FileNotFoundError:
+                    meta = None
+                with self._lock:
+                    if meta is None:
+                        self._index.pop(username, None)
+                    else:
+                        self._index[username] = meta
+            result[username] = {
+                "exists": meta is not None,
+                "path": path,
+                "size": meta["size"] if meta else 0,
+                "modified": meta["modified"] if meta else None
+            }
+        return result
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions as rows of the instagram_sessions table; writes are single transactions."""
+
+    def load(self, username: str) -> Optional[dict]:
+        with get_database_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT settings FROM instagram_sessions WHERE username = ?", (username,))
+            row = cursor.fetchone()
+            return json.loads(row[0]) if row else None
+
+    def save(self, username: str, session_settings: dict):
+        data = json.dumps(session_settings)
+        with get_database_connection() as conn:
+            conn.execute('''
+                INSERT INTO instagram_sessions (username, settings, size_bytes, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(username) DO UPDATE SET
+                    settings = excluded.settings,
+                    size_bytes = excluded.size_bytes,
+                    updated_at = excluded.updated_at
+            ''', (username, data, len(data), time.time()))
+            conn.commit()
+
+    def delete(self, username: str):
+        with get_database_connection() as conn:
+            conn.execute("DELETE FROM instagram_sessions WHERE username = ?", (username,))
+            conn.commit()
+
+    def info_many(self, usernames: List[str]) -> Dict[str, dict]:
+        # One query for every account; the settings JSON itself is never read
+        with get_database_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT username, size_bytes, updated_at FROM instagram_sessions")
+            index = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        result = {}
+        for username in usernames:
+            meta = index.get(username)
+            result[username] = {
+                "exists": meta is not None,
+                "size": meta[0] if meta else 0,
+                "modified": meta[1] if meta else None
+            }
+        return result
+
+
+def create_session_store(kind: str) -> SessionStore:
+    """Build the session store selected by the SESSION_STORE setting ('file' or 'sqlite')"""
+    if kind == "sqlite":
+        return SQLiteSessionStore()
+    if kind != "file":
+        print(f"⚠️ Unknown session store '{kind}', using files")
+    return FileSessionStore(SESSION_DIR)
+
+
+session_store = create_session_store(settings.session_store)
+
+
+def create_client(username: str) -> Client:
+    """Create an instagrapi Client configured with the account's proxy (if any)."""
+    cl = Client()
+    cl.delay_range = [1, 3]
+    cl.request_timeout = 30
+
+    # Configure proxy if available
+    proxy_config = get_account_proxy_config(username)
+    if proxy_config and proxy_config.get('active'):
+        try:
+            proxy_settings = get_instagrapi_proxy_settings(proxy_config)
+            cl.set_proxy(proxy_settings['proxy'])
+            if 'proxy_port' in proxy_settings:
+                cl.proxy_port = proxy_settings['proxy_port']
+            if 'proxy_username' in proxy_settings:
+                cl.proxy_username = proxy_settings['proxy_username']
+            if 'proxy_password' in proxy_settings:
+                cl.proxy_password = proxy_settings['proxy_password']
+
+            print(f"🌐 Using proxy: {proxy_config['host']}:{proxy_config['port']}")
+        except Exception as e:
+            print(f"⚠️ Failed to set proxy for @{username}: {e}")
+            # Continue without proxy
+
+    return cl
+
+
+class ClientCache:
+    """Per-worker LRU of logged-in instagrapi clients keyed by username.
+
+    A cached client is reused as long as it was used within ``idle_ttl``
+    seconds and its proxy hasn't changed. The session is only re-checked with
+    a timeline request when its last successful call is older than
+    ``validate_after`` seconds.
+    """
+
+    def __init__(self, max_size: int, idle_ttl: float, validate_after: float):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.validate_after = validate_after
+        self._clients = OrderedDict()  # username -> [client, proxy_key, last_ok, last_used]
+        self._lock = threading.Lock()
+
+    def get(self, username: str, proxy_key: Optional[str]) -> Optional[Client]:
+        """Return a cached client that is still usable, validating it if it has been quiet"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(username)
+            if entry is None:
+                return None
+            if entry[1] != proxy_key or now - entry[3] > self.idle_ttl:
+                del self._clients[username]
+                return None
+            entry[3] = now
+            self._clients.move_to_end(username)
+            client, last_ok = entry[0], entry[2]
+
+        if now - last_ok <= self.validate_after:
+            return client
+
+        try:
+            client.get_timeline_feed()
+            self.mark_ok(username)
+            return client
+        except Exception as e:
+            print(f"⚠️ Cached session for @{username} is no longer valid: {e}")
+            self.discard(username)
+            return None
+
+    def put(self, username: str, client: Client, proxy_key: Optional[str]):
+        """Cache a client that just logged in or passed validation"""
+        now = time.monotonic()
+        with self._lock:
+            self._clients[username] = [client, proxy_key, now, now]
+            self._clients.move_to_end(username)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+
+    def mark_ok(self, username: str):
+        """Record a successful API call so the next use skips validation"""
+        with self._lock:
+            entry = self._clients.get(username)
+            if entry:
+                entry[2] = entry[3] = time.monotonic()
+
+    def discard(self, username: str):
+        with self._lock:
+            self._clients.pop(username, None)
+
+
+client_cache = ClientCache(
+    max_size=settings.instagram_client_cache_size,
+    idle_ttl=settings.instagram_client_idle_ttl,
+    validate_after=settings.instagram_client_validate_after
+)
+
+
+def get_logged_in_client(username: str, password: str, two_fa_key: str = None,
+                         proxy_key: Optional[str] = None) -> Optional[Client]:
+    """Get a logged-in client for an account: cached, from its session file, or via fresh login."""
+    cl = client_cache.get(username, proxy_key)
+    if cl:
+        print(f"♻️ Reusing logged-in client for @{username}")
+        return cl
+
+    cl = create_client(username)
     try:
-        print(f"🔄 Starting upload for @{username}")
+        saved_settings = session_store.load(username)
+    except Exception as e:
+        print(f"⚠️ Could not load session for @{username}: {e}")
+        saved_settings = None
 
-        # Initialize Instagram client
-        cl = Client()
-        cl.delay_range = [1, 3]
-        cl.request_timeout = 30
+    # Try to use existing session
+    if saved_settings:
+        try:
+            print(f"🔑 Loading existing session for @{username}")
+            cl.set_settings(saved_settings)
 
-        # Configure proxy if available
-        proxy_config = get_account_proxy_config(username)
-        if proxy_config and proxy_config.get('active'):
-            try:
-                proxy_settings = get_instagrapi_proxy_settings(proxy_config)
-                cl.set_proxy(proxy_settings['proxy'])
-                if 'proxy_port' in proxy_settings:
-                    cl.proxy_port = proxy_settings['proxy_port']
-                if 'proxy_username' in proxy_settings:
-                    cl.proxy_username = proxy_settings['proxy_username']
-                if 'proxy_password' in proxy_settings:
-                    cl.proxy_password = proxy_settings['proxy_password']
-
-                print(f"🌐 Using proxy: {proxy_config['host']}:{proxy_config['port']}")
-            except Exception as e:
-                print(f"⚠️ Failed to set proxy for @{username}: {e}")
-                # Continue without proxy
-
-        session_path = get_session_path(username)
-
-        # Try to use existing session
-        if session_path.exists():
-            try:
-                print(f"🔑 Loading existing session for @{username}")
-                cl.load_settings(session_path)
+            # Test session validity
+            cl.get_timeline_feed()
+            print(f"✅ Session valid for @{username}")
 
-                # Test session validity
-                cl.get_timeline_feed()
-                print(f"✅ Session valid for @{username}")
+        except (LoginRequired, Exception) as e:
+            print(f"⚠️ Session expired for @{username}, logging in...")
+            session_store.delete(username)  # Remove invalid session
 
-            except (LoginRequired, Exception) as e:
-                print(f"⚠️ Session expired for @{username}, logging in...")
-                session_path.unlink(missing_ok=True)  # Remove invalid session
+            # Perform fresh login
+            if not perform_login(cl, username, password, two_fa_key):
+                return None
+    else:
+        # No session exists, perform fresh login
+        print(f"🔑 No session found for @{username}, logging in...")
+        if not perform_login(cl, username, password, two_fa_key):
+            return None
 
-                # Perform fresh login
-                if not perform_login(cl, username, password, two_fa_key, session_path):
-                    return False
-        else:
-            # No session exists, perform fresh login
-            print(f"🔑 No session found for @{username}, logging in...")
-            if not perform_login(cl, username, password, two_fa_key, session_path):
-                return False
+    client_cache.put(username, cl, proxy_key)
+    return cl
+
+
+def upload_video_to_instagram(username: str, password: str, video_path: str, caption: str,
+                              token: str, chat_id: str, two_fa_key: str = None) -> bool:
+    """Upload video to Instagram with proxy support.
+
+    Raises RateLimitExceeded if the account (or its proxy) has no upload
+    budget within rate_limit_max_wait seconds.
+    """
+    proxy_key = get_proxy_key(username)
+    retry_after = rate_limiter.wait("upload", username, proxy_key)
+    if retry_after:
+        raise RateLimitExceeded("upload", username, retry_after)
+
+    try:
+        print(f"🔄 Starting upload for @{username}")
+
+        cl = get_logged_in_client(username, password, two_fa_key, proxy_key)
+        if not cl:
+            return False
 
         # Verify video file exists
         if not os.path.exists(video_path):
@@ -83,15 +390,11 @@ def upload_video_to_instagram(username: str, password: str, video_path: str, cap
 
         print(f"📱 Uploading video ({file_size} bytes) to @{username}")
 
-        # Add random delay before upload
-        delay = random.uniform(5, 15)
-        print(f"⏳ Waiting {delay:.1f} seconds before upload...")
-        time.sleep(delay)
-
         # Upload video
         media = cl.video_upload(video_path, caption)
 
         if media:
+            client_cache.mark_ok(username)
             print(f"✅ Video uploaded successfully to @{username}")
             print(f"📸 Media ID: {media.pk}")
             return True
@@ -104,28 +407,32 @@ def upload_video_to_instagram(username: str, password: str, video_path: str, cap
         print(f"❌ Error uploading video for @{username}: {e}")
 
         # Send error notification
-        telegram_notify(token, chat_id, f"❌ Upload error for @{username}: {e}")
+        telegram_notify(token, chat_id, f"❌ Upload error for @{username}: {e}", account=username)
 
         # Handle login-related errors
         if any(keyword in error_msg for keyword in ['login', 'challenge', 'checkpoint', 'session']):
+            client_cache.discard(username)
             try:
-                print(f"🧹 Removing session file for @{username}")
-                session_path = get_session_path(username)
-                session_path.unlink(missing_ok=True)
+                print(f"🧹 Removing session for @{username}")
+                session_store.delete(username)
             except Exception as cleanup_error:
-                print(f"⚠️ Error removing session file: {cleanup_error}")
+                print(f"⚠️ Error removing session: {cleanup_error}")
 
         return False
 
 
 def perform_login(cl: Client, username: str, password: str, two_fa_key: str = None,
-                  session_path: Path = None) -> bool:
-    """Perform Instagram login with 2FA support."""
+                  save_session: bool = True, check_rate_limit: bool = True) -> bool:
+    """Perform Instagram login with 2FA support.
+
+    Pass check_rate_limit=False when the caller already took a login token.
+    """
     try:
-        # Add random delay
-        delay = random.uniform(2, 5)
-        print(f"⏳ Waiting {delay:.1f} seconds before login...")
-        time.sleep(delay)
+        # Logins draw from their own per-account budget (and the proxy's)
+        retry_after = rate_limiter.wait("login", username, get_proxy_key(username)) if check_rate_limit else 0
+        if retry_after:
+            print(f"⏰ Login rate limit for @{username}, next attempt allowed in {retry_after:.0f}s")
+            return False
 
         if two_fa_key:
             print(f"🔐 Getting 2FA code for @{username}")
@@ -149,8 +456,8 @@ def perform_login(cl: Client, username: str, password: str, two_fa_key: str = No
             cl.login(username, password)
 
         # Save session if login successful
-        if session_path:
-            cl.dump_settings(session_path)
+        if save_session:
+            session_store.save(username, cl.get_settings())
             print(f"💾 Session saved for @{username}")
 
         print(f"✅ Login successful for @{username}")
@@ -165,34 +472,22 @@ def perform_login(cl: Client, username: str, password: str, two_fa_key: str = No
 
 
 def test_instagram_connection(username: str, password: str, two_fa_key: str = None) -> bool:
-    """Test Instagram connection and create session without uploading."""
+    """Test Instagram connection and create session without uploading.
+
+    Called from API requests, so it never sleeps for the login budget: raises
+    RateLimitExceeded with the time until the next login is allowed instead.
+    """
+    retry_after = rate_limiter.acquire("login", username, get_proxy_key(username))
+    if retry_after:
+        raise RateLimitExceeded("login", username, retry_after)
+
     try:
         print(f"🧪 Testing Instagram connection for @{username}")
 
-        cl = Client()
-        cl.delay_range = [1, 3]
-        cl.request_timeout = 30
-
-        # Configure proxy if available
-        proxy_config = get_account_proxy_config(username)
-        if proxy_config and proxy_config.get('active'):
-            try:
-                proxy_settings = get_instagrapi_proxy_settings(proxy_config)
-                cl.set_proxy(proxy_settings['proxy'])
-                if 'proxy_port' in proxy_settings:
-                    cl.proxy_port = proxy_settings['proxy_port']
-                if 'proxy_username' in proxy_settings:
-                    cl.proxy_username = proxy_settings['proxy_username']
-                if 'proxy_password' in proxy_settings:
-                    cl.proxy_password = proxy_settings['proxy_password']
-                print(f"🌐 Testing with proxy: {proxy_config['host']}:{proxy_config['port']}")
-            except Exception as e:
-                print(f"⚠️ Proxy setup failed, testing without proxy: {e}")
-
-        session_path = get_session_path(username)
+        cl = create_client(username)
 
         # Try login and create session
-        if perform_login(cl, username, password, two_fa_key, session_path):
+        if perform_login(cl, username, password, two_fa_key, check_rate_limit=False):
             # Test basic API calls to verify everything works
             try:
                 # Get user info
@@ -204,12 +499,16 @@ def test_instagram_connection(username: str, password: str, two_fa_key: str = No
                 timeline = cl.get_timeline_feed()
                 print(f"📱 Timeline feed accessible: {len(timeline)} items")
 
+                # Uploads reuse this fresh login instead of a client from before it
+                client_cache.discard(username)
+                client_cache.put(username, cl, get_proxy_key(username))
                 return True
             except Exception as api_error:
                 print(f"❌ API test failed for @{username}: {api_error}")
                 # Clean up session if API tests fail
+                client_cache.discard(username)
                 try:
-                    session_path.unlink(missing_ok=True)
+                    session_store.delete(username)
                 except:
                     pass
                 return False
@@ -231,10 +530,10 @@ def test_instagram_connection(username: str, password: str, two_fa_key: str = No
     except Exception as e:
         print(f"❌ Connection test failed for @{username}: {e}")
 
-        # Clean up any created session files on error
+        # Clean up any created session on error
+        client_cache.discard(username)
         try:
-            session_path = get_session_path(username)
-            session_path.unlink(missing_ok=True)
+            session_store.delete(username)
         except:
             pass
 
@@ -242,62 +541,52 @@ def test_instagram_connection(username: str, password: str, two_fa_key: str = No
 
 
 def cleanup_session(username: str):
-    """Remove session file for username."""
+    """Remove the saved session for username."""
+    client_cache.discard(username)
     try:
-        session_path = get_session_path(username)
-        if session_path.exists():
-            session_path.unlink()
+        if session_store.exists(username):
+            session_store.delete(username)
             print(f"🧹 Session cleaned up for @{username}")
     except Exception as e:
         print(f"⚠️ Error cleaning up session for @{username}: {e}")
 
 
 def verify_session_exists(username: str) -> bool:
-    """Check if session file exists for username."""
-    session_path = get_session_path(username)
-    return session_path.exists()
+    """Check if a session is saved for username."""
+    return session_store.exists(username)
 
 
 def get_session_info(username: str) -> dict:
     """Get information about existing session."""
-    session_path = get_session_path(username)
-
-    if not session_path.exists():
+    try:
+        return session_store.info(username)
+    except Exception as e:
         return {
             "exists": False,
-            "path": str(session_path),
-            "size": 0,
-            "created": None
+            "error": str(e)
         }
 
+
+def get_sessions_info(usernames: List[str]) -> Dict[str, dict]:
+    """Get session information for many accounts at once."""
     try:
-        stat = session_path.stat()
-        return {
-            "exists": True,
-            "path": str(session_path),
-            "size": stat.st_size,
-            "created": stat.st_ctime,
-            "modified": stat.st_mtime
-        }
+        return session_store.info_many(usernames)
     except Exception as e:
-        return {
-            "exists": True,
-            "path": str(session_path),
-            "error": str(e)
-        }
+        print(f"⚠️ Error reading session index: {e}")
+        return {username: {"exists": False, "error": str(e)} for username in usernames}
 
 
 def validate_session(username: str) -> bool:
     """Validate existing session by testing it."""
-    session_path = get_session_path(username)
+    saved_settings = session_store.load(username)
 
-    if not session_path.exists():
-        print(f"❌ No session file for @{username}")
+    if not saved_settings:
+        print(f"❌ No session saved for @{username}")
         return False
 
     try:
         cl = Client()
-        cl.load_settings(session_path)
+        cl.set_settings(saved_settings)
 
         # Test session validity
         cl.get_timeline_feed()
@@ -306,4 +595,4 @@ def validate_session(username: str) -> bool:
 
     except Exception as e:
         print(f"❌ Session invalid for @{username}: {e}")
-        return False
\ No newline at end of file
+        return False
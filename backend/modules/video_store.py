@@ -0,0 +1,188 @@
+"""
+Content-addressed store for downloaded TikTok clips shared by all accounts
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Optional
+
+from config.settings import settings
+from modules.database import get_database_connection
+from modules.downloader import download_video
+
+# A pin older than this is assumed to belong to a worker that died mid-upload
+STALE_PIN_SECONDS = 6 * 3600
+
+
+class VideoStore:
+    """Keep each clip on disk once, keyed by its TikTok link.
+
+    Files live at ``<videos_dir>/<sha256(link)>.mp4`` and are tracked in the
+    ``video_store`` table with a reference count of in-flight uploads. Clips
+    are kept after upload so other accounts can reuse them, and unreferenced
+    clips are evicted least-recently-used first once the store grows past
+    ``max_bytes``.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    @staticmethod
+    def link_hash(video_link: str) -> str:
+        return hashlib.sha256(video_link.encode()).hexdigest()
+
+    def path_for(self, video_link: str) -> str:
+        return os.path.join(self.root, f"{self.link_hash(video_link)}.mp4")
+
+    def _lock_for(self, video_link: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(video_link)
+            if lock is None:
+                if len(self._locks) > 1024:
+                    self._locks = {link: l for link, l in self._locks.items() if l.locked()}
+                lock = self._locks[video_link] = threading.Lock()
+            return lock
+
+    def open(self, video_link: str) -> Optional[str]:
+        """Pin and return the local path of a stored clip, or None if it isn't stored"""
+        key = self.link_hash(video_link)
+        try:
+            with get_database_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT path FROM video_store WHERE link_hash = ?", (key,))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+
+                if not os.path.exists(row[0]) or os.path.getsize(row[0]) == 0:
+                    cursor.execute("DELETE FROM video_store WHERE link_hash = ?", (key,))
+                    conn.commit()
+                    return None
+
+                cursor.execute('''
+                    UPDATE video_store
+                    SET ref_count = ref_count + 1,
+                        last_access = ?
+                    WHERE link_hash = ?
+                ''', (time.time(), key))
+                conn.commit()
+                return row[0]
+        except Exception as e:
+            print(f"⚠️ Video store lookup failed for {video_link}: {e}")
+            return None
+
+    def contains(self, video_link: str) -> bool:
+        """Whether a clip is stored, without pinning it"""
+        try:
+            with get_database_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT path FROM video_store WHERE link_hash = ?", (self.link_hash(video_link),))
+                row = cursor.fetchone()
+                return bool(row) and os.path.exists(row[0])
+        except Exception as e:
+            print(f"⚠️ Video store lookup failed for {video_link}: {e}")
+            return False
+
+    def total_bytes(self) -> int:
+        """Size of every stored clip"""
+        with get_database_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM video_store")
+            return cursor.fetchone()[0]
+
+    def add(self, video_link: str, download_url: str) -> Optional[str]:
+        """Download a clip into the store, pin it and return its path (None on failure)"""
+        with self._lock_for(video_link):
+            # Another caller in this process may have stored it while we waited
+            path = self.open(video_link)
+            if path:
+                return path
+
+            # download_video renames into place atomically and leaves a partial
+            # file under a stable name, so a retry of this task can resume it
+            path = self.path_for(video_link)
+            if not download_video(download_url, path):
+                return None
+
+            try:
+                with get_database_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        INSERT INTO video_store (link_hash, video_link, path, size_bytes, ref_count, last_access)
+                        VALUES (?, ?, ?, ?, 1, ?)
+                        ON CONFLICT(link_hash) DO UPDATE SET
+                            path = excluded.path,
+                            size_bytes = excluded.size_bytes,
+                            ref_count = video_store.ref_count + 1,
+                            last_access = excluded.last_access
+                    ''', (self.link_hash(video_link), video_link, path, os.path.getsize(path), time.time()))
+                    conn.commit()
+            except Exception as e:
+                print(f"⚠️ Failed to register {video_link} in video store: {e}")
+
+            return path
+
+    def release(self, video_link: str):
+        """Drop one reference to a clip and evict old clips if the store is over budget"""
+        try:
+            with get_database_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE video_store
+                    SET ref_count = MAX(ref_count - 1, 0),
+                        last_access = ?
+                    WHERE link_hash = ?
+                ''', (time.time(), self.link_hash(video_link)))
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️ Failed to release {video_link} from video store: {e}")
+
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least-recently-used unreferenced clips until the store fits max_bytes"""
+        freed = 0
+        try:
+            with get_database_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM video_store")
+                total = cursor.fetchone()[0]
+                if total <= self.max_bytes:
+                    return 0
+
+                cursor.execute('''
+                    SELECT link_hash, path, size_bytes
+                    FROM video_store
+                    WHERE ref_count = 0 OR last_access < ?
+                    ORDER BY last_access
+                ''', (time.time() - STALE_PIN_SECONDS,))
+
+                for link_hash, path, size_bytes in cursor.fetchall():
+                    if total - freed <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    conn.execute("DELETE FROM video_store WHERE link_hash = ?", (link_hash,))
+                    freed += size_bytes or 0
+
+                conn.commit()
+
+            if freed:
+                print(f"🧹 Evicted {freed} bytes from video store")
+        except Exception as e:
+            print(f"⚠️ Video store eviction failed: {e}")
+
+        return freed
+
+
+video_store = VideoStore(
+    root=settings.videos_dir,
+    max_bytes=settings.video_store_max_mb * 1024 * 1024
+)
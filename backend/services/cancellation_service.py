@@ -0,0 +1,133 @@
+"""
+Push-based task cancellation over Redis
+"""
+
+import threading
+import time
+from typing import Dict
+
+import redis
+
+from modules.database import get_database_connection
+from modules.redis_client import get_redis_client
+
+
+class CancellationService:
+    """Deliver task cancellations through Redis and cache them in-process.
+
+    Cancelling a task sets a ``task:cancelled:<id>`` key (so late subscribers
+    still see it) and publishes the id on a channel. Workers keep one pub/sub
+    listener per process that sets a local ``threading.Event`` for every
+    watched task, so checks are a memory read and see a cancel the moment
+    it arrives. While Redis is unreachable checks fall back to the task's
+    status in task_logs, which the cancel endpoint sets as well.
+    """
+
+    KEY_PREFIX = "task:cancelled:"
+    CHANNEL = "task_cancellations"
+    KEY_TTL = 86400  # Cancel flags only matter while the task can still run
+
+    def __init__(self):
+        self._events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._listener = None
+        self._redis_ok = True
+
+    def _get_client(self) -> redis.Redis:
+        return get_redis_client()
+
+    def publish(self, task_id: str) -> bool:
+        """Mark a task as cancelled and notify every listening worker"""
+        try:
+            client = self._get_client()
+            client.set(f"{self.KEY_PREFIX}{task_id}", 1, ex=self.KEY_TTL)
+            client.publish(self.CHANNEL, task_id)
+            return True
+        except Exception as e:
+            print(f"Failed to publish cancellation for {task_id}: {e}")
+            return False
+
+    def watch(self, task_id: str) -> threading.Event:
+        """Start tracking a task; returns the event that is set on cancel"""
+        with self._lock:
+            event = self._events.get(task_id)
+            if event is not None:
+                return event
+            event = threading.Event()
+            self._events[task_id] = event
+            self._ensure_listener()
+
+        # The cancel may have been published before we subscribed
+        if self._key_exists(task_id):
+            event.set()
+        return event
+
+    def unwatch(self, task_id: str):
+        """Stop tracking a finished task"""
+        with self._lock:
+            self._events.pop(task_id, None)
+
+    def is_cancelled(self, task_id: str) -> bool:
+        """Check the in-process cancel flag for a task (or its logged status while Redis is down)"""
+        event = self.watch(task_id)
+        if not event.is_set() and not self._redis_ok and self._status_cancelled(task_id):
+            event.set()
+        return event.is_set()
+
+    def _key_exists(self, task_id: str) -> bool:
+        try:
+            exists = bool(self._get_client().exists(f"{self.KEY_PREFIX}{task_id}"))
+            self._redis_ok = True
+            return exists
+        except Exception as e:
+            print(f"Failed to read cancellation flag for {task_id}: {e}")
+            self._redis_ok = False
+            return False
+
+    @staticmethod
+    def _status_cancelled(task_id: str) -> bool:
+        try:
+            with get_database_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT status FROM task_logs WHERE id = ?", (task_id,))
+                row = cursor.fetchone()
+                return row is not None and row[0] == "cancelled"
+        except Exception as e:
+            print(f"Failed to read task status for {task_id}: {e}")
+            return False
+
+    def _ensure_listener(self):
+        if self._listener is None or not self._listener.is_alive():
+            self._listener = threading.Thread(target=self._listen, name="cancellation-listener", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._get_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                self._redis_ok = True
+
+                # Catch up on anything published while we were (re)connecting
+                with self._lock:
+                    watched = list(self._events.items())
+                for task_id, event in watched:
+                    if self._key_exists(task_id):
+                        event.set()
+
+                while True:
+                    # Poll with a timeout so the client's socket_timeout never fires while idle
+                    message = pubsub.get_message(timeout=30)
+                    if not message:
+                        continue
+                    with self._lock:
+                        event = self._events.get(message.get("data"))
+                    if event is not None:
+                        event.set()
+            except Exception as e:
+                self._redis_ok = False
+                print(f"Cancellation listener error, reconnecting: {e}")
+                time.sleep(5)
+
+
+cancellation_service = CancellationService()
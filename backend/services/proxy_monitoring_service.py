@@ -4,9 +4,13 @@ Proxy monitoring and health check service
 
 import asyncio
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
+from config.settings import settings
 from modules.database import get_database_connection
-from modules.proxy_utils import test_proxy_connection, update_proxy_status, get_account_proxy_config
+from modules.proxy_health import proxy_health
+from modules.proxy_utils import (
+    check_proxy_async, update_proxy_status, update_proxy_statuses, get_account_proxy_config, format_proxy_key
+)
 
 
 class ProxyMonitoringService:
@@ -67,21 +71,22 @@ class ProxyMonitoringService:
                 }
 
             print(f"🔍 Checking proxy health for {username}...")
-            start_time = time.time()
+            check = await check_proxy_async(proxy_config, timeout=settings.proxy_check_timeout)
 
-            is_working = test_proxy_connection(proxy_config, timeout=15)
-            response_time = time.time() - start_time
+            proxy_key = format_proxy_key(proxy_config['host'], proxy_config['port'])
+            proxy_health.record(proxy_key, check['working'], check['response_time'])
 
-            new_status = "working" if is_working else "failed"
-            update_proxy_status(username, new_status)
+            new_status = "working" if check['working'] else "failed"
+            update_proxy_status(username, new_status, check['error'])
 
             return {
                 'username': username,
                 'status': new_status,
-                'response_time': round(response_time, 2),
+                'response_time': round(check['response_time'], 2) if check['working'] else None,
                 'proxy_host': proxy_config['host'],
                 'proxy_port': proxy_config['port'],
-                'message': 'Proxy is working' if is_working else 'Proxy connection failed'
+                'health': proxy_health.stats(proxy_key),
+                'message': 'Proxy is working' if check['working'] else f"Proxy connection failed: {check['error']}"
             }
 
         except Exception as e:
@@ -95,41 +100,107 @@ class ProxyMonitoringService:
             }
 
     @staticmethod
-    async def check_all_proxies() -> List[Dict[str, Any]]:
-        """Check health of all configured proxies"""
-        accounts = await ProxyMonitoringService.get_all_proxy_accounts()
-        results = []
-
-        print(f"🏥 Starting health check for {len(accounts)} proxy accounts...")
+    async def iter_proxy_checks(accounts: Optional[List[Dict[str, Any]]] = None,
+                                concurrency: Optional[int] = None,
+                                timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Check every configured proxy concurrently, yielding per-account results as they finish.
+
+        Accounts behind the same proxy (same type, host, port and credentials)
+        are checked once and all get that result. At most ``concurrency``
+        proxies are being tested at any moment.
+        """
+        if accounts is None:
+            accounts = await ProxyMonitoringService.get_all_proxy_accounts()
+        concurrency = concurrency or settings.proxy_check_concurrency
+        timeout = timeout or settings.proxy_check_timeout
 
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
         for account in accounts:
             if not account['proxy_active']:
-                results.append({
+                yield {
                     'username': account['username'],
                     'status': 'disabled',
                     'message': 'Proxy is disabled for this account'
-                })
+                }
                 continue
 
-            try:
-                result = await ProxyMonitoringService.check_proxy_health(account['username'])
-                results.append(result)
+            key = (account['proxy_type'].upper(), account['proxy_host'], account['proxy_port'],
+                   account['proxy_username'], account['proxy_password'])
+            groups.setdefault(key, []).append(account)
 
-                # Small delay between checks to avoid overwhelming proxies
-                await asyncio.sleep(1)
+        semaphore = asyncio.Semaphore(concurrency)
 
-            except Exception as e:
-                results.append({
-                    'username': account['username'],
-                    'status': 'error',
-                    'message': f'Check failed: {str(e)}'
-                })
+        async def check_group(key: tuple, members: List[Dict[str, Any]]):
+            proxy_type, host, port, proxy_username, proxy_password = key
+            proxy_config = {
+                'host': host,
+                'port': port,
+                'username': proxy_username,
+                'password': proxy_password,
+                'type': proxy_type
+            }
+            async with semaphore:
+                try:
+                    return members, await check_proxy_async(proxy_config, timeout=timeout)
+                except Exception as e:
+                    return members, {'working': False, 'response_time': None, 'error': str(e), 'exception': True}
+
+        tasks = [asyncio.create_task(check_group(key, members)) for key, members in groups.items()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                members, check = await next_done
+                usernames = [account['username'] for account in members]
+                proxy_key = format_proxy_key(members[0]['proxy_host'], members[0]['proxy_port'])
+
+                if check.get('exception'):
+                    status, message = 'error', f"Check failed: {check['error']}"
+                    update_proxy_statuses(usernames, 'failed')
+                else:
+                    proxy_health.record(proxy_key, check['working'], check['response_time'])
+                    if check['working']:
+                        status, message = 'working', 'Proxy is working'
+                        update_proxy_statuses(usernames, 'working')
+                    else:
+                        status, message = 'failed', f"Proxy connection failed: {check['error']}"
+                        update_proxy_statuses(usernames, 'failed')
+
+                health = proxy_health.stats(proxy_key)
+                for account in members:
+                    yield {
+                        'username': account['username'],
+                        'status': status,
+                        'response_time': round(check['response_time'], 2) if check['working'] else None,
+                        'proxy_host': account['proxy_host'],
+                        'proxy_port': account['proxy_port'],
+                        'shared_accounts': len(members),
+                        'health': health,
+                        'message': message
+                    }
+        finally:
+            # Stop outstanding checks if the consumer goes away mid-sweep
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def check_all_proxies() -> List[Dict[str, Any]]:
+        """Check health of all configured proxies"""
+        accounts = await ProxyMonitoringService.get_all_proxy_accounts()
+        start_time = time.monotonic()
+
+        print(f"🏥 Starting health check for {len(accounts)} proxy accounts...")
+
+        results = [result async for result in ProxyMonitoringService.iter_proxy_checks(accounts)]
 
         # Summary
         working = len([r for r in results if r['status'] == 'working'])
         failed = len([r for r in results if r['status'] == 'failed'])
 
-        print(f"📊 Proxy health check completed: {working} working, {failed} failed out of {len(results)} total")
+        print(f"📊 Proxy health check completed in {time.monotonic() - start_time:.1f}s: "
+              f"{working} working, {failed} failed out of {len(results)} total")
+
+        proxy_health.prune()
+        if settings.proxy_auto_disable:
+            await ProxyMonitoringService.auto_disable_failed_proxies()
 
         return results
 
@@ -153,6 +224,10 @@ class ProxyMonitoringService:
                     proxy_types[proxy_type] = 0
                 proxy_types[proxy_type] += 1
 
+            # Per-proxy latency and reliability from recent checks, best first
+            proxy_keys = {format_proxy_key(a['proxy_host'], a['proxy_port']) for a in accounts if a['proxy_active']}
+            proxies = [proxy_health.stats(key) for key in proxy_health.rank(proxy_keys)]
+
             return {
                 'total_accounts_with_proxy': total_accounts,
                 'active_proxies': active_proxies,
@@ -160,7 +235,8 @@ class ProxyMonitoringService:
                 'failed_proxies': failed_proxies,
                 'unchecked_proxies': unchecked_proxies,
                 'proxy_types': proxy_types,
-                'health_percentage': round((working_proxies / active_proxies * 100) if active_proxies > 0 else 0, 1)
+                'health_percentage': round((working_proxies / active_proxies * 100) if active_proxies > 0 else 0, 1),
+                'proxies': proxies
             }
 
         except Exception as e:
@@ -172,37 +248,44 @@ class ProxyMonitoringService:
                 'failed_proxies': 0,
                 'unchecked_proxies': 0,
                 'proxy_types': {},
-                'health_percentage': 0
+                'health_percentage': 0,
+                'proxies': []
             }
 
     @staticmethod
-    async def auto_disable_failed_proxies(failure_threshold: int = 3) -> List[str]:
-        """Automatically disable proxies that have been failing consistently"""
+    async def auto_disable_failed_proxies(failure_threshold: Optional[int] = None) -> List[str]:
+        """Disable proxies whose recent checks show a failure streak or a poor success rate"""
+        failure_threshold = failure_threshold or settings.proxy_failure_threshold
         try:
             with get_database_connection() as conn:
                 cursor = conn.cursor()
 
-                # For now, we'll just disable proxies that have been failing
-                # In a more advanced implementation, you could track failure counts
                 cursor.execute('''
-                    SELECT username
+                    SELECT username, proxy_host, proxy_port
                     FROM accounts
                     WHERE proxy_active = 1
-                      AND proxy_status = 'failed'
+                      AND proxy_host IS NOT NULL
                 ''')
 
-                failed_accounts = [row[0] for row in cursor.fetchall()]
+                by_proxy: Dict[str, List[str]] = {}
+                for username, host, port in cursor.fetchall():
+                    by_proxy.setdefault(format_proxy_key(host, port), []).append(username)
 
-                if failed_accounts:
-                    print(f"🚫 Auto-disabling {len(failed_accounts)} consistently failed proxies...")
+                failed_accounts = []
+                for proxy_key, usernames in by_proxy.items():
+                    if proxy_health.should_disable(proxy_key, failure_threshold):
+                        stats = proxy_health.stats(proxy_key)
+                        print(f"🚫 Disabling proxy {proxy_key}: {stats['consecutive_failures']} failures in a row, "
+                              f"{stats['success_rate']} success rate over {stats['samples']} checks")
+                        failed_accounts.extend(usernames)
 
-                    # Disable failed proxies
-                    cursor.execute('''
+                if failed_accounts:
+                    cursor.executemany('''
                         UPDATE accounts
-                        SET proxy_active = 0
-                        WHERE proxy_active = 1
-                          AND proxy_status = 'failed'
-                    ''')
+                        SET proxy_active = 0,
+                            proxy_status = 'failed'
+                        WHERE username = ?
+                    ''', [(username,) for username in failed_accounts])
 
                     conn.commit()
 
@@ -212,4 +295,4 @@ class ProxyMonitoringService:
 
         except Exception as e:
             print(f"Error auto-disabling failed proxies: {e}")
-            return []
\ No newline at end of file
+            return []
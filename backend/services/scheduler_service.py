@@ -0,0 +1,164 @@
+"""
+Automatic upload scheduler that keeps every active account fed from the queue
+"""
+
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Set
+
+from config.settings import settings
+from core.database_utils import get_active_accounts
+from modules.database import get_database_connection, get_upload_queue
+from services.task_service import TaskService
+
+
+class UploadScheduler:
+    """Assign queued videos to idle accounts.
+
+    Each pass looks at every active account and starts an upload job for the
+    ones that have no job running, are past their cooldown since the last
+    post and are under their daily cap. Videos come from the ranked upload
+    queue of the account's theme, skipping what the account already posted.
+    A running job whose log hasn't moved for ``stale_job_after`` seconds past
+    its next scheduled step is assumed dead (lost worker, purged queue) and
+    no longer keeps its account busy.
+    """
+
+    def __init__(self, daily_cap: int, account_cooldown: int, batch_size: int, stale_job_after: int):
+        self.daily_cap = daily_cap
+        self.account_cooldown = account_cooldown
+        self.batch_size = batch_size
+        self.stale_job_after = stale_job_after
+
+    @staticmethod
+    def get_recent_activity() -> Dict[str, Dict[str, Any]]:
+        """Posts today and seconds since the last post, per account (last 24h only)"""
+        with get_database_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT account_username,
+                       SUM(CASE WHEN created_at >= datetime('now', 'start of day') THEN 1 ELSE 0 END),
+                       (julianday('now') - julianday(MAX(created_at))) * 86400
+                FROM publicationhistory
+                WHERE created_at >= datetime('now', '-1 day')
+                GROUP BY account_username
+            ''')
+            return {
+                row[0]: {"posts_today": row[1] or 0, "seconds_since_post": row[2]}
+                for row in cursor.fetchall()
+            }
+
+    def get_busy_accounts(self) -> Set[str]:
+        """Accounts that have an upload job running which is still alive"""
+        # Task logs are stamped with local isoformat times; progress writes bump created_at
+        # and a cooling-down job has next_action_at in the future
+        cutoff = (datetime.now() - timedelta(seconds=self.stale_job_after)).isoformat()
+        with get_database_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT DISTINCT account_username
+                FROM task_logs
+                WHERE task_type = 'upload'
+                  AND status = 'running'
+                  AND account_username IS NOT NULL
+                  AND MAX(COALESCE(julianday(created_at), 0), COALESCE(julianday(next_action_at), 0)) >= julianday(?)
+            ''', (cutoff,))
+            return {row[0] for row in cursor.fetchall()}
+
+    def plan(self) -> List[Dict[str, Any]]:
+        """Decide what each active account should do on this pass without dispatching anything"""
+        activity = self.get_recent_activity()
+        busy = self.get_busy_accounts()
+        plan = []
+
+        for account in get_active_accounts():
+            username = account['username']
+            recent = activity.get(username, {})
+            posts_today = recent.get("posts_today", 0)
+            since_post = recent.get("seconds_since_post")
+            entry = {"username": username, "theme": account['theme'], "posts_today": posts_today, "videos": []}
+
+            if account['status'] == 'error':
+                entry["state"] = "error"
+            elif username in busy:
+                entry["state"] = "busy"
+            elif posts_today >= self.daily_cap:
+                entry["state"] = "daily_cap"
+            elif since_post is not None and since_post < self.account_cooldown:
+                entry["state"] = "cooldown"
+                entry["remaining_cooldown"] = int(self.account_cooldown - since_post)
+            else:
+                batch = min(self.batch_size, self.daily_cap - posts_today)
+                queue = get_upload_queue(account['theme'], k=batch, username=username)
+                entry["videos"] = [video["link"] for video in queue]
+                entry["state"] = "ready" if entry["videos"] else "no_videos"
+
+            entry["account"] = account
+            plan.append(entry)
+
+        return plan
+
+    async def dispatch(self, account: Dict[str, Any], video_links: List[str]) -> str:
+        """Start an upload job for one account and return its task ID"""
+        from modules.tasks import process_video_with_progress
+
+        task_id = str(uuid.uuid4())
+
+        # Log the job before queueing it so the next pass sees the account as busy
+        await TaskService.log_task(
+            task_id=task_id,
+            task_type="upload",
+            status="running",
+            account_username=account['username'],
+            message=f"Scheduled upload of {len(video_links)} videos",
+            total_items=len(video_links)
+        )
+
+        try:
+            process_video_with_progress.apply_async(
+                args=[
+                    [account['username'], account['password'], account['theme'], account['two_fa_key']],
+                    video_links,
+                    settings.telegram_token,
+                    settings.telegram_chat_id
+                ],
+                task_id=task_id
+            )
+        except Exception as e:
+            await TaskService.update_task_status(task_id, "failed", f"Could not queue upload job: {str(e)}")
+            raise
+        return task_id
+
+    async def run_once(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Run one scheduling pass; returns what every account was assigned"""
+        plan = self.plan()
+        dispatched = 0
+
+        for entry in plan:
+            account = entry.pop("account")
+            if entry["state"] != "ready" or dry_run:
+                continue
+
+            try:
+                entry["task_id"] = await self.dispatch(account, entry["videos"])
+                dispatched += 1
+            except Exception as e:
+                print(f"❌ Failed to schedule uploads for @{entry['username']}: {e}")
+                entry["state"] = "dispatch_failed"
+
+        if dispatched:
+            print(f"📅 Scheduler started {dispatched} upload jobs across {len(plan)} active accounts")
+
+        return {
+            "dispatched": dispatched,
+            "accounts": plan,
+            "dry_run": dry_run
+        }
+
+
+upload_scheduler = UploadScheduler(
+    daily_cap=settings.scheduler_daily_cap,
+    account_cooldown=settings.scheduler_account_cooldown,
+    batch_size=settings.scheduler_batch_size,
+    stale_job_after=settings.scheduler_stale_job_after
+)
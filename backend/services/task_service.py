@@ -1,8 +1,90 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
+import atexit
+import threading
+import time
+from config.settings import settings
 from modules.database import get_database_connection
 from api.models import TaskLog
 
+
+class ProgressWriter:
+    """In-process sink that coalesces task progress updates.
+
+    Workers record progress as often as they like; only the latest state per
+    task id is kept and all pending tasks are written in a single transaction
+    every ``flush_interval`` seconds, or immediately when a task reaches a
+    terminal state.
+    """
+
+    def __init__(self, flush_interval: float = 2.0):
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def record(self, task_id: str, progress: int, current_item: str,
+               message: Optional[str] = None, cooldown_seconds: Optional[int] = None):
+        """Queue the latest progress for a task, replacing any unflushed state"""
+        now = datetime.now()
+        next_action_at = None
+        if cooldown_seconds:
+            next_action_at = (now + timedelta(seconds=cooldown_seconds)).isoformat()
+
+        with self._lock:
+            self._pending[task_id] = (progress, current_item, message, next_action_at,
+                                      cooldown_seconds, now.isoformat(), task_id)
+            self._ensure_flusher()
+
+    def flush(self, task_id: Optional[str] = None):
+        """Write pending updates (all tasks, or just one) in a single transaction"""
+        with self._lock:
+            if task_id is None:
+                rows = list(self._pending.values())
+                self._pending.clear()
+            else:
+                row = self._pending.pop(task_id, None)
+                rows = [row] if row else []
+
+        if not rows:
+            return
+
+        try:
+            with get_database_connection() as conn:
+                cursor = conn.cursor()
+                # Only running tasks take progress, so a late flush can't clobber a final status
+                cursor.executemany('''
+                    UPDATE task_logs
+                    SET progress = ?,
+                        current_item = ?,
+                        message = ?,
+                        next_action_at = ?,
+                        cooldown_seconds = ?,
+                        created_at = ?
+                    WHERE id = ? AND status = 'running'
+                ''', rows)
+                conn.commit()
+        except Exception as e:
+            print(f"Failed to flush task progress: {e}")
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+            self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    self._flusher = None
+                    return
+
+
+progress_writer = ProgressWriter(flush_interval=settings.progress_flush_interval)
+atexit.register(progress_writer.flush)
+
 class TaskService:
     """Service for managing task logs and operations"""
 
@@ -114,11 +196,14 @@ class TaskService:
     @staticmethod
     async def update_task_status(task_id: str, status: str, message: Optional[str] = None):
         """Update task status"""
+        # Land any buffered progress first so it can't overwrite the new status message
+        progress_writer.flush(task_id)
         try:
             with get_database_connection() as conn:
                 cursor = conn.cursor()
 
-                # Clear next_action_at and cooldown when task completes or is cancelled
+                # Clear next_action_at and cooldown when task completes or is cancelled; only a
+                # running task can end, so a worker finishing late can't overwrite a cancel
                 if status in ["success", "failed", "cancelled"]:
                     cursor.execute('''
                         UPDATE task_logs
@@ -126,9 +211,8 @@ class TaskService:
                             message = ?,
                             next_action_at = NULL,
                             cooldown_seconds = NULL,
-                            created_at = ?,
-                            progress = CASE WHEN status = 'running' THEN progress ELSE 100 END
-                        WHERE id = ?
+                            created_at = ?
+                        WHERE id = ? AND status = 'running'
                     ''', (status, message, datetime.now().isoformat(), task_id))
                 else:
                     cursor.execute('''
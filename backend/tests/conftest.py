@@ -0,0 +1,57 @@
+"""
+Shared pytest setup: a throwaway SQLite database and dummy Telegram settings.
+
+The environment has to be set before core/modules are imported, since the
+settings object and the connection pool read it on first use.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DB_FILE = os.path.join(tempfile.mkdtemp(prefix="backend_tests_"), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+os.environ.setdefault("TELEGRAM_TOKEN", "test")
+os.environ.setdefault("TELEGRAM_CHAT_ID", "test")
+
+import core  # noqa: E402,F401  (core must be imported before modules.database)
+from modules.database import get_database_connection, init_database  # noqa: E402
+
+TABLES = (
+    "accounts",
+    "videos",
+    "publicationhistory",
+    "tiktok_sources",
+    "task_logs",
+    "video_store",
+    "instagram_sessions",
+    "proxy_checks",
+)
+
+
+@pytest.fixture
+def db():
+    """An initialized, empty database; yields a pooled connection for seeding rows"""
+    init_database()
+    with get_database_connection() as conn:
+        for table in TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+        yield conn
+
+
+@pytest.fixture
+def add_account(db):
+    """Insert an account row with placeholder credentials"""
+    def add(username, theme="cats", **fields):
+        row = {"username": username, "password": "secret", "theme": theme, **fields}
+        columns = ", ".join(f'"{column}"' for column in row)
+        db.execute(f"INSERT INTO accounts ({columns}) VALUES ({', '.join('?' * len(row))})",
+                   tuple(row.values()))
+        db.commit()
+    return add
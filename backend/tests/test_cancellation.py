@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+import redis
+from fastapi import HTTPException
+
+from api import tasks as tasks_api
+from celery_app import app as celery_app
+from services.cancellation_service import CancellationService
+from services.task_service import TaskService
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def log_job(task_id):
+    asyncio.run(TaskService.log_task(task_id=task_id, task_type="upload", status="running",
+                                     account_username="alice", message="Starting"))
+
+
+def status(conn, task_id):
+    return conn.execute("SELECT status FROM task_logs WHERE id = ?", (task_id,)).fetchone()[0]
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    def unreachable(self):
+        raise redis.ConnectionError("Connection refused")
+
+    monkeypatch.setattr(CancellationService, "_get_client", unreachable)
+
+
+def test_cancel_flag_is_seen_by_a_fresh_worker(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(CancellationService, "_get_client", lambda self: client)
+
+    assert CancellationService().publish("job-1")
+
+    worker = CancellationService()
+    assert worker.is_cancelled("job-1")
+    assert not worker.is_cancelled("job-2")
+
+
+def test_logged_status_is_used_while_redis_is_down(db, redis_down):
+    log_job("job-1")
+    log_job("job-2")
+    asyncio.run(TaskService.update_task_status("job-1", "cancelled", "Task cancelled by user"))
+
+    worker = CancellationService()
+    assert worker.is_cancelled("job-1")
+    assert not worker.is_cancelled("job-2")
+
+
+def test_cancel_endpoint_fails_when_not_delivered(db, redis_down):
+    log_job("job-1")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(tasks_api.cancel_task("job-1"))
+
+    assert error.value.status_code == 503
+    assert status(db, "job-1") == "running"
+
+
+def test_cancel_endpoint_marks_task(db, monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(CancellationService, "_get_client", lambda self: client)
+    revoked = []
+    monkeypatch.setattr(celery_app.control, "revoke", lambda task_id, terminate: revoked.append(task_id))
+    log_job("job-1")
+
+    result = asyncio.run(tasks_api.cancel_task("job-1"))
+
+    assert "cancellation requested" in result["message"]
+    assert status(db, "job-1") == "cancelled"
+    assert client.exists("task:cancelled:job-1")
+    assert revoked == ["job-1"]
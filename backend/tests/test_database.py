@@ -0,0 +1,132 @@
+import time
+
+import pytest
+
+from config.settings import settings
+from modules.database import (
+    PUBLISHED_SUBSET_CHUNK, get_upload_queue, ingest_videos, next_videos_for_account, published_subset
+)
+
+
+def video_rows(conn, theme):
+    cursor = conn.execute("SELECT link, title, views FROM videos WHERE theme = ? ORDER BY link", (theme,))
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def test_ingest_videos_returns_only_new_rows(db):
+    db.execute("INSERT INTO videos (link, theme, title, views) VALUES ('a', 'cats', 'old title', 5)")
+    db.commit()
+
+    inserted = ingest_videos([
+        ("a", "cats", {"title": "new title", "views": 50}),  # already stored
+        ("b", "cats", {"title": "first", "views": 10}),
+        ("b", "cats", {"title": "duplicate", "views": 99}),  # repeated in the batch
+        ("a", "dogs", None),  # same link, other theme
+        ("c", "cats", {"unknown": "ignored"}),
+    ])
+
+    assert inserted == {("b", "cats"), ("a", "dogs"), ("c", "cats")}
+    assert len(inserted) == 3
+    # Existing rows are left alone and the first copy of a batch duplicate wins
+    assert video_rows(db, "cats") == [("a", "old title", 5), ("b", "first", 10), ("c", None, 0)]
+    assert video_rows(db, "dogs") == [("a", None, 0)]
+
+
+def test_ingest_videos_again_inserts_nothing(db):
+    batch = [("a", "cats", None), ("b", "cats", None)]
+    assert ingest_videos(batch) == {("a", "cats"), ("b", "cats")}
+    assert ingest_videos(batch) == set()
+    assert ingest_videos([]) == set()
+    assert db.execute("SELECT COUNT(*) FROM videos").fetchone()[0] == 2
+
+
+def seed_queue(conn, now):
+    hour = 3600
+    rows = [
+        # link, views, posted_at
+        ("viral_old", 10000, now - 240 * hour),  # ten half-lives old
+        ("rising", 3000, now - 24 * hour),  # one half-life old
+        ("fresh", 1000, now - 60),
+        ("newest", 50, now),
+        ("undated", 5000, None),
+    ]
+    conn.executemany("INSERT INTO videos (link, theme, views, posted_at) VALUES (?, 'cats', ?, ?)", rows)
+    conn.execute("INSERT INTO videos (link, theme, views, posted_at, status) VALUES ('done', 'cats', 9000, ?, 'posted')",
+                 (now,))
+    conn.execute("INSERT INTO videos (link, theme, views, posted_at) VALUES ('other', 'dogs', 9000, ?)", (now,))
+    conn.commit()
+
+
+def test_upload_queue_trending_decays_views_by_age(db, monkeypatch):
+    monkeypatch.setattr(settings, "upload_queue_half_life_hours", 24)
+    seed_queue(db, time.time())
+
+    queue = get_upload_queue("cats", k=3, score="trending")
+
+    assert [item["link"] for item in queue] == ["rising", "fresh", "newest"]
+    assert queue[0]["score"] == pytest.approx(1500, rel=0.01)
+    assert queue[1]["score"] == pytest.approx(1000, rel=0.01)
+    # The most viewed clips lose to newer ones once decayed, undated clips score nothing
+    everything = get_upload_queue("cats", k=10, score="trending")
+    assert [item["link"] for item in everything] == ["rising", "fresh", "newest", "viral_old", "undated"]
+    assert everything[-1]["score"] == 0
+
+
+def test_upload_queue_recency_and_views(db):
+    seed_queue(db, time.time())
+
+    assert [item["link"] for item in get_upload_queue("cats", k=2, score="recency")] == ["newest", "fresh"]
+    assert [item["link"] for item in get_upload_queue("cats", k=10, score="recency")] == \
+        ["newest", "fresh", "rising", "viral_old", "undated"]
+    assert [item["link"] for item in get_upload_queue("cats", k=2, score="views")] == ["viral_old", "undated"]
+
+
+def test_upload_queue_skips_published_for_account(db, monkeypatch):
+    monkeypatch.setattr(settings, "upload_queue_half_life_hours", 24)
+    seed_queue(db, time.time())
+    db.execute("INSERT INTO publicationhistory (account_username, video_link) VALUES ('alice', 'rising')")
+    db.commit()
+
+    assert [item["link"] for item in get_upload_queue("cats", k=2, score="trending", username="alice")] == \
+        ["fresh", "newest"]
+    assert [item["link"] for item in get_upload_queue("cats", k=2, score="trending", username="bob")] == \
+        ["rising", "fresh"]
+    with pytest.raises(ValueError):
+        get_upload_queue("cats", score="random")
+
+
+def test_next_videos_for_account_oldest_first_across_sources(db, add_account):
+    add_account("alice", theme="cats")
+    rows = [
+        # link, author, created_at
+        ("a1", "source_a", "2024-01-01 10:00:00"),
+        ("b1", "source_b", "2024-01-01 11:00:00"),
+        ("a2", "source_a", "2024-01-01 12:00:00"),
+        ("c1", "source_c", "2024-01-01 12:00:00"),  # same time as a2, link breaks the tie
+        ("b2", "source_b", "2024-01-01 13:00:00"),
+        ("a3", "source_a", "2024-01-01 14:00:00"),
+    ]
+    db.executemany("INSERT INTO videos (link, theme, author, created_at) VALUES (?, 'cats', ?, ?)", rows)
+    db.execute("INSERT INTO videos (link, theme, created_at) VALUES ('d1', 'dogs', '2023-01-01 00:00:00')")
+    db.executemany("INSERT INTO publicationhistory (account_username, video_link) VALUES (?, ?)",
+                   [("alice", "b1"), ("alice", "a3"), ("bob", "a1")])
+    db.commit()
+
+    assert next_videos_for_account("alice", n=10) == ["a1", "a2", "c1", "b2"]
+    assert next_videos_for_account("alice", n=2) == ["a1", "a2"]
+    assert next_videos_for_account("nobody") == []
+
+
+def test_published_subset_spans_chunks(db):
+    links = [f"https://www.tiktok.com/@cats/video/{i}" for i in range(PUBLISHED_SUBSET_CHUNK * 2 + 7)]
+    published = {links[0], links[PUBLISHED_SUBSET_CHUNK - 1], links[PUBLISHED_SUBSET_CHUNK],
+                 links[PUBLISHED_SUBSET_CHUNK * 2], links[-1]}
+    db.executemany("INSERT INTO publicationhistory (account_username, video_link) VALUES ('alice', ?)",
+                   [(link,) for link in published])
+    db.execute("INSERT INTO publicationhistory (account_username, video_link) VALUES ('bob', ?)", (links[1],))
+    db.commit()
+
+    # Duplicates in the input don't shift the chunk boundaries or the result
+    assert published_subset("alice", links + links[:3]) == published
+    assert published_subset("bob", links) == {links[1]}
+    assert published_subset("alice", []) == set()
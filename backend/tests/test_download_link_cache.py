@@ -0,0 +1,60 @@
+import pytest
+
+from modules import downloader
+from modules.downloader import DownloadLinkCache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+VIDEO = "https://www.tiktok.com/@cats/video/1"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(downloader, "get_redis_client", lambda: client)
+    cache = DownloadLinkCache(ttl=1800, max_size=2)
+    monkeypatch.setattr(downloader, "download_link_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def resolved(monkeypatch):
+    """Links SnapTik will hand out next, in order; None means resolution fails"""
+    links = []
+    monkeypatch.setattr(downloader, "resolve_download_link", lambda url: links.pop(0))
+    return links
+
+
+def test_link_is_resolved_once_and_shared(cache, resolved):
+    resolved.append("https://cdn.example/a.mp4")
+
+    assert downloader.get_download_link(VIDEO) == "https://cdn.example/a.mp4"
+    assert downloader.get_download_link(VIDEO) == "https://cdn.example/a.mp4"
+    # Another worker has an empty local cache but shares Redis
+    assert DownloadLinkCache(ttl=1800, max_size=2).get(VIDEO) == "https://cdn.example/a.mp4"
+
+
+def test_refresh_replaces_rejected_link(cache, resolved):
+    resolved.extend(["https://cdn.example/old.mp4", "https://cdn.example/new.mp4"])
+    downloader.get_download_link(VIDEO)
+
+    assert downloader.get_download_link(VIDEO, use_cache=False) == "https://cdn.example/new.mp4"
+    assert downloader.get_download_link(VIDEO) == "https://cdn.example/new.mp4"
+
+
+def test_failed_refresh_drops_rejected_link(cache, resolved):
+    resolved.extend(["https://cdn.example/old.mp4", None, "https://cdn.example/new.mp4"])
+    downloader.get_download_link(VIDEO)
+
+    assert downloader.get_download_link(VIDEO, use_cache=False) is None
+    assert cache.get(VIDEO) is None
+    assert DownloadLinkCache(ttl=1800, max_size=2).get(VIDEO) is None
+    assert downloader.get_download_link(VIDEO) == "https://cdn.example/new.mp4"
+
+
+def test_local_cache_is_bounded(cache, resolved):
+    for i in range(3):
+        cache.set(f"{VIDEO}{i}", f"https://cdn.example/{i}.mp4")
+
+    assert list(cache._local) == [f"{VIDEO}1", f"{VIDEO}2"]
+    assert cache.get(f"{VIDEO}0") == "https://cdn.example/0.mp4"  # Still in Redis
@@ -0,0 +1,193 @@
+import pytest
+import requests
+
+from modules import downloader
+
+BODY = b"0123456789"
+
+
+class FakeResponse:
+    def __init__(self, status_code, chunks=(), headers=None, error=None):
+        self.status_code = status_code
+        self.chunks = list(chunks)
+        self.headers = {"content-type": "video/mp4", **(headers or {})}
+        self.error = error  # Raised after the chunks, like a dropped connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size):
+        yield from self.chunks
+        if self.error:
+            raise self.error
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.routes = []
+
+    def get(self, url, headers, proxies=None, **kwargs):
+        self.requests.append(dict(headers))
+        self.routes.append(proxies)
+        return self.responses.pop(0)
+
+
+class FakeRouter:
+    def __init__(self, *keys):
+        self.proxies = [{"key": key} for key in keys]
+        self.failures = []
+
+    def choose(self, exclude=()):
+        return next((proxy for proxy in self.proxies if proxy["key"] not in exclude), None)
+
+    def report_failure(self, proxy):
+        self.failures.append(proxy)
+
+
+def full(body=BODY, **headers):
+    return FakeResponse(200, [body], {"content-length": str(len(body)), "etag": '"v1"', **headers})
+
+
+def broken(sent=4):
+    return FakeResponse(200, [BODY[:sent]], {"content-length": str(len(BODY)), "etag": '"v1"'},
+                        error=requests.exceptions.ChunkedEncodingError("connection reset"))
+
+
+def rest(offset):
+    return FakeResponse(206, [BODY[offset:]], {
+        "content-range": f"bytes {offset}-{len(BODY) - 1}/{len(BODY)}",
+        "content-length": str(len(BODY) - offset)
+    })
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = FakeRouter()
+    monkeypatch.setattr(downloader, "proxy_router", router)
+    monkeypatch.setattr(downloader.settings, "download_attempts", 3)
+    return router
+
+
+def download(monkeypatch, tmp_path, *responses, kept=False):
+    session = FakeSession(*responses)
+    monkeypatch.setattr(downloader, "get_download_session", lambda: session)
+    output = tmp_path / "clips" / "video.mp4"
+    ok = downloader.download_video("https://cdn.example/video.mp4", str(output))
+    assert (tmp_path / "clips" / "video.mp4.part").exists() == kept
+    assert (tmp_path / "clips" / "video.mp4.part.meta").exists() == kept
+    return ok, output, session.requests
+
+
+def test_resume_appends_partial_content(monkeypatch, tmp_path, router):
+    ok, output, sent = download(monkeypatch, tmp_path, broken(4), rest(4))
+
+    assert ok
+    assert output.read_bytes() == BODY
+    assert sent == [{}, {"Range": "bytes=4-", "If-Range": '"v1"'}]
+    assert router.failures == [None]  # The dropped connection counts against the route
+
+
+def test_server_ignoring_range_restarts_file(monkeypatch, tmp_path, router):
+    ok, output, sent = download(monkeypatch, tmp_path, broken(4), full())
+
+    assert ok
+    assert output.read_bytes() == BODY
+    assert sent[1]["Range"] == "bytes=4-"
+
+
+def test_short_transfer_is_resumed(monkeypatch, tmp_path, router):
+    short = FakeResponse(200, [BODY[:6]], {"content-length": str(len(BODY))})
+
+    ok, output, sent = download(monkeypatch, tmp_path, short, rest(6))
+
+    assert ok
+    assert output.read_bytes() == BODY
+    assert sent == [{}, {"Range": "bytes=6-"}]
+
+
+def test_short_transfer_on_every_attempt_fails(monkeypatch, tmp_path, router):
+    # The last attempt restarted the file and got nothing, so there is nothing to keep
+    ok, output, sent = download(monkeypatch, tmp_path, broken(4), broken(0), broken(0))
+
+    assert not ok
+    assert not output.exists()
+    assert len(sent) == 3
+    assert len(router.failures) == 3
+
+
+def test_range_not_satisfiable_restarts_without_benching_route(monkeypatch, tmp_path, router):
+    ok, output, sent = download(monkeypatch, tmp_path, broken(4), FakeResponse(416), full(b"new version"))
+
+    assert ok
+    assert output.read_bytes() == b"new version"
+    assert sent == [{}, {"Range": "bytes=4-", "If-Range": '"v1"'}, {}]
+    assert router.failures == [None]  # Only the dropped connection, not the 416
+
+
+def test_range_not_satisfiable_restarts_on_the_same_route(monkeypatch, tmp_path):
+    router = FakeRouter("a:1", "b:2", "c:3")
+    monkeypatch.setattr(downloader, "proxy_router", router)
+    monkeypatch.setattr(downloader, "get_proxy_dict", lambda proxy: proxy["key"])
+    monkeypatch.setattr(downloader.settings, "download_attempts", 3)
+    session = FakeSession(broken(4), FakeResponse(416), full(b"new version"))
+    monkeypatch.setattr(downloader, "get_download_session", lambda: session)
+
+    assert downloader.download_video("https://cdn.example/video.mp4", str(tmp_path / "video.mp4"))
+    assert session.routes == ["a:1", "b:2", "b:2"]
+
+
+def test_network_failures_keep_partial_file_for_next_call(monkeypatch, tmp_path, router):
+    ok, output, _ = download(monkeypatch, tmp_path, broken(4), broken(0), broken(4), kept=True)
+    assert not ok
+    assert (tmp_path / "clips" / "video.mp4.part").read_bytes() == BODY[:4]
+
+    ok, output, sent = download(monkeypatch, tmp_path, rest(4))
+
+    assert ok
+    assert output.read_bytes() == BODY
+    assert sent == [{"Range": "bytes=4-", "If-Range": '"v1"'}]
+
+
+def test_partial_file_without_validator_is_not_kept(monkeypatch, tmp_path, router):
+    short = FakeResponse(200, [BODY[:6]], {"content-length": str(len(BODY))})
+
+    ok, _, _ = download(monkeypatch, tmp_path, short, short, short)
+
+    assert not ok
+
+
+def test_leftover_partial_file_without_validator_is_discarded(monkeypatch, tmp_path, router):
+    (tmp_path / "clips").mkdir()
+    (tmp_path / "clips" / "video.mp4.part").write_bytes(b"from somewhere else")
+
+    ok, output, sent = download(monkeypatch, tmp_path, full())
+
+    assert ok
+    assert output.read_bytes() == BODY
+    assert sent == [{}]
+
+
+def test_rejected_link_is_not_retried(monkeypatch, tmp_path, router):
+    ok, output, sent = download(monkeypatch, tmp_path, FakeResponse(403))
+
+    assert not ok
+    assert len(sent) == 1
+    assert router.failures == []
+
+
+def test_rejected_link_drops_partial_file(monkeypatch, tmp_path, router):
+    download(monkeypatch, tmp_path, broken(4), broken(4), broken(4), kept=True)
+
+    ok, _, sent = download(monkeypatch, tmp_path, FakeResponse(403))
+
+    assert not ok
+    assert sent == [{"Range": "bytes=4-", "If-Range": '"v1"'}]
@@ -0,0 +1,81 @@
+import pytest
+
+from modules.proxy_health import ProxyHealthTracker, percentile
+
+FAST = "10.0.0.1:8080"
+SLOW = "10.0.0.2:8080"
+DEAD = "10.0.0.3:8080"
+NEW = "10.0.0.4:8080"
+
+
+def tracker(max_age=60):
+    return ProxyHealthTracker(window_size=10, min_samples=3, min_success_rate=0.5, max_age=max_age)
+
+
+def record_history(health):
+    for _ in range(5):
+        health.record_many([(FAST, True, 0.1), (SLOW, True, 0.8), (DEAD, False, None)])
+    health.record(FAST, False)
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([10, 20, 30, 40], 50) == 20
+    assert percentile([10, 20, 30, 40], 95) == 40
+
+
+def test_fresh_tracker_reads_history_from_table(db):
+    record_history(tracker())
+    health = tracker()  # Another process that never ran a check
+
+    fast = health.stats(FAST)
+    assert fast["samples"] == 6
+    assert fast["success_rate"] == pytest.approx(5 / 6, abs=0.001)
+    assert fast["p50_ms"] == 100
+    assert fast["consecutive_failures"] == 1
+    assert health.stats(DEAD)["consecutive_failures"] == 5
+
+    assert not health.should_disable(FAST, failure_threshold=3)
+    assert health.should_disable(DEAD, failure_threshold=3)
+    assert health.should_disable(DEAD, failure_threshold=10)  # Success rate alone is enough
+    assert health.rank([DEAD, NEW, SLOW, FAST]) == [FAST, SLOW, NEW, DEAD]
+
+
+def test_window_keeps_only_recent_checks(db):
+    recorder = tracker()
+    for _ in range(12):
+        recorder.record(FAST, False)
+    for _ in range(8):
+        recorder.record(FAST, True, 0.2)
+
+    stats = tracker().stats(FAST)
+    assert stats["samples"] == 10
+    assert stats["success_rate"] == 0.8
+    assert stats["consecutive_failures"] == 0
+
+
+def test_cached_window_is_reloaded_after_max_age(db):
+    recorder, reader = tracker(), tracker()
+    for _ in range(3):
+        recorder.record_many([(FAST, True, 0.1), (SLOW, True, 0.3)])
+    assert reader.rank([SLOW, FAST]) == [FAST, SLOW]  # Cached from here on
+
+    for _ in range(4):
+        recorder.record(FAST, False)
+    assert reader.stats(FAST)["consecutive_failures"] == 0  # Still within max_age
+
+    reader._loaded_at[FAST] -= 61
+    assert reader.stats(FAST)["consecutive_failures"] == 4
+    assert reader.should_disable(FAST, failure_threshold=3)
+    assert reader.rank([FAST, SLOW]) == [SLOW, FAST]
+
+
+def test_prune_drops_old_checks(db):
+    health = tracker()
+    health.record(FAST, True, 0.1)
+    db.execute("UPDATE proxy_checks SET checked_at = checked_at - 30 * 86400")
+    db.commit()
+    health.record(FAST, True, 0.2)
+
+    assert health.prune(retention_days=14) == 1
+    assert tracker().stats(FAST)["samples"] == 1
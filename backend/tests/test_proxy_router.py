@@ -0,0 +1,81 @@
+import pytest
+
+from modules import proxy_router as proxy_router_module
+from modules.proxy_health import ProxyHealthTracker
+from modules.proxy_router import ProxyRouter, route_key
+
+FAST = "10.0.0.1:8080"
+SLOW = "10.0.0.2:8080"
+
+
+def tracker():
+    return ProxyHealthTracker(window_size=10, min_samples=3, min_success_rate=0.5, max_age=3600)
+
+
+@pytest.fixture
+def worker_health(monkeypatch):
+    """The worker's own tracker, which never records checks itself"""
+    health = tracker()
+    monkeypatch.setattr(proxy_router_module, "proxy_health", health)
+    return health
+
+
+@pytest.fixture
+def proxied_accounts(add_account):
+    add_account("alice", proxy_host="10.0.0.1", proxy_port=8080, proxy_active=1)
+    add_account("bob", proxy_host="10.0.0.2", proxy_port=8080, proxy_active=1)
+    add_account("carol", proxy_host="10.0.0.2", proxy_port=8080, proxy_active=1)  # Same proxy as bob
+    add_account("dave", proxy_host="10.0.0.3", proxy_port=8080, proxy_active=1, proxy_status="failed")
+    add_account("erin", proxy_host="10.0.0.4", proxy_port=8080, proxy_active=0)
+
+
+def weights(routes):
+    return {route_key(proxy): weight for proxy, weight in routes}
+
+
+def test_candidates_weight_by_latency(db, proxied_accounts, worker_health):
+    api_health = tracker()
+    for _ in range(3):
+        api_health.record_many([(FAST, True, 0.1), (SLOW, True, 0.4)])
+    router = ProxyRouter(enabled=True, include_direct=True, refresh_interval=60, failure_cooldown=300)
+
+    routes = weights(router.candidates())
+
+    assert set(routes) == {FAST, SLOW, "direct"}
+    assert routes[FAST] == pytest.approx(4 * routes[SLOW])
+    assert FAST not in weights(router.candidates(exclude=[FAST]))
+
+
+def test_refresh_picks_up_checks_from_another_process(db, proxied_accounts, worker_health):
+    api_health = tracker()
+    for _ in range(3):
+        api_health.record_many([(FAST, True, 0.1), (SLOW, True, 0.4)])
+    router = ProxyRouter(enabled=True, include_direct=False, refresh_interval=60, failure_cooldown=300)
+    assert set(weights(router.candidates())) == {FAST, SLOW}
+
+    for _ in range(3):
+        api_health.record(FAST, False)
+    assert set(weights(router.candidates())) == {FAST, SLOW}  # Refresh not due yet
+
+    router._loaded_at -= 61
+    assert set(weights(router.candidates())) == {SLOW}
+    assert worker_health.should_disable(FAST, failure_threshold=3)
+
+
+def test_failed_route_is_benched(db, proxied_accounts, worker_health):
+    router = ProxyRouter(enabled=True, include_direct=True, refresh_interval=60, failure_cooldown=300)
+    proxy = next(proxy for proxy, _ in router.candidates() if proxy and proxy["key"] == SLOW)
+
+    router.report_failure(proxy)
+    router.report_failure(None)
+
+    assert set(weights(router.candidates())) == {FAST}
+
+
+def test_disabled_routing_goes_direct(db, proxied_accounts, worker_health):
+    router = ProxyRouter(enabled=False, include_direct=False, refresh_interval=60, failure_cooldown=300)
+
+    router.report_failure(None)
+
+    assert router.choose() is None
+    assert set(weights(router.candidates())) == {"direct"}
@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+import redis
+from fastapi import HTTPException
+
+from api import accounts as accounts_api
+from modules import rate_limiter as rate_limiter_module
+from modules import tasks, uploader
+from modules.rate_limiter import RateLimiter
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # The token bucket is a Lua script
+
+LIMITS = {
+    "upload": (1, 4),  # One token, refilled every 900s
+    "login": (2, 3),
+    RateLimiter.PROXY_ACTION: (1, 40),  # One token, refilled every 90s
+}
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(rate_limiter_module, "get_redis_client", lambda: client)
+    return client
+
+
+@pytest.fixture
+def limiter(fake_redis):
+    return RateLimiter(LIMITS)
+
+
+def rewind(client, key, seconds):
+    """Pretend a bucket was last updated `seconds` earlier"""
+    client.hset(key, "ts", float(client.hget(key, "ts")) - seconds)
+
+
+def test_bucket_refills_over_time(limiter, fake_redis):
+    assert limiter.acquire("upload", "alice") == 0
+    assert limiter.acquire("upload", "alice") == pytest.approx(900, abs=1)
+
+    rewind(fake_redis, "ratelimit:upload:account:alice", 450)
+    assert limiter.retry_after("upload", "alice") == pytest.approx(450, abs=1)
+
+    rewind(fake_redis, "ratelimit:upload:account:alice", 450)
+    assert limiter.acquire("upload", "alice") == 0
+    # Refill stops at capacity no matter how long the bucket sat idle
+    rewind(fake_redis, "ratelimit:upload:account:alice", 86400)
+    assert limiter.acquire("upload", "alice") == 0
+    assert limiter.acquire("upload", "alice") > 0
+
+
+def test_denied_request_takes_from_no_bucket(limiter):
+    # alice drains the shared proxy bucket; bob still has his own upload token
+    assert limiter.acquire("upload", "alice", "10.0.0.1:8080") == 0
+    assert limiter.acquire("upload", "bob", "10.0.0.1:8080") == pytest.approx(90, abs=1)
+
+    status = limiter.status("bob", "10.0.0.1:8080")
+    assert status["actions"]["upload"]["tokens"] == pytest.approx(1, abs=0.01)
+    assert status["proxy_budget"]["tokens"] < 0.01
+
+    # Without the proxy bob's account bucket grants right away
+    assert limiter.acquire("upload", "bob") == 0
+    assert limiter.acquire("upload", "bob") > 0
+
+
+def test_retry_after_does_not_consume(limiter):
+    assert limiter.retry_after("login", "alice") == 0
+    assert limiter.retry_after("login", "alice", cost=2) == 0
+    assert limiter.retry_after("login", "alice", cost=3) == pytest.approx(1200, abs=1)
+
+    assert limiter.acquire("login", "alice") == 0
+    assert limiter.acquire("login", "alice") == 0
+    assert limiter.retry_after("login", "alice") == pytest.approx(1200, abs=1)
+
+
+def test_wait_returns_remaining_time_beyond_max_wait(limiter):
+    assert limiter.wait("upload", "alice", max_wait=0) == 0
+    assert limiter.wait("upload", "alice", max_wait=5) == pytest.approx(900, abs=1)
+
+
+def test_unknown_action_is_rejected(limiter):
+    with pytest.raises(ValueError):
+        limiter.acquire("comment", "alice")
+
+
+def test_redis_down_fails_open(monkeypatch):
+    def unreachable():
+        raise redis.ConnectionError("Connection refused")
+
+    monkeypatch.setattr(rate_limiter_module, "get_redis_client", unreachable)
+    limiter = RateLimiter(LIMITS)
+
+    assert limiter.acquire("upload", "alice") == 0
+    assert limiter.acquire("upload", "alice") == 0
+    assert limiter.wait("upload", "alice", max_wait=0) == 0
+    # Spacing falls back to the nominal interval between tokens
+    assert limiter.retry_after("upload", "alice") == 900
+    assert limiter.retry_after("login", "alice", cost=2) == 2400
+
+
+def test_upload_step_reschedules_when_rate_limited(db, fake_redis, monkeypatch):
+    limiter = rate_limiter_module.rate_limiter
+    monkeypatch.setattr(limiter, "limits", LIMITS)
+    monkeypatch.setattr(limiter, "_script", None)
+    monkeypatch.setattr(tasks.settings, "rate_limit_max_wait", 0)
+    monkeypatch.setattr(tasks.settings, "upload_prefetch_depth", 0)
+    monkeypatch.setattr(tasks, "telegram_notify", lambda *args, **kwargs: None)
+    monkeypatch.setattr(tasks.cancellation_service, "is_cancelled", lambda task_id: False)
+
+    released = []
+    monkeypatch.setattr(tasks.video_store, "open", lambda link: f"/tmp/{link}.mp4")
+    monkeypatch.setattr(tasks.video_store, "release", released.append)
+    rescheduled = []
+    monkeypatch.setattr(tasks.upload_video_step, "apply_async",
+                        lambda args, kwargs, countdown: rescheduled.append((args, kwargs, countdown)))
+
+    assert limiter.acquire("upload", "alice") == 0  # Spend the only upload token
+
+    account = ["alice", "secret", "cats", None]
+    result = tasks.upload_video_step.apply(
+        args=[account, ["v1", "v2"], "token", "chat"],
+        kwargs={"job_id": "job-1", "index": 0, "success_count": 0, "failed_count": 0}
+    ).get()
+
+    [(args, kwargs, countdown)] = rescheduled
+    assert args == [account, ["v1", "v2"], "token", "chat"]
+    # The same video is retried once the bucket has refilled
+    assert kwargs == {"job_id": "job-1", "index": 0, "success_count": 0, "failed_count": 0}
+    assert countdown == pytest.approx(901, abs=2)
+    assert result == {"job_id": "job-1", "next_index": 0, "cooldown": countdown}
+    assert released == ["v1"]
+
+
+def test_verify_endpoint_answers_429_instead_of_sleeping(db, add_account, fake_redis, monkeypatch, tmp_path):
+    limiter = rate_limiter_module.rate_limiter
+    monkeypatch.setattr(limiter, "limits", LIMITS)
+    monkeypatch.setattr(limiter, "_script", None)
+    monkeypatch.setattr(rate_limiter_module.time, "sleep", lambda seconds: pytest.fail("API request slept"))
+    logins = []
+    monkeypatch.setattr(uploader, "perform_login", lambda *args, **kwargs: logins.append(args) or False)
+    monkeypatch.setattr(uploader, "session_store", uploader.FileSessionStore(tmp_path))
+    add_account("alice")
+    uploader.session_store.save("alice", {"uuid": "1"})
+    for _ in range(2):  # Spend the login burst
+        assert limiter.acquire("login", "alice") == 0
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(accounts_api.verify_account("alice"))
+
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) == pytest.approx(1201, abs=2)
+    assert logins == []
+    assert uploader.session_store.exists("alice")  # Nothing was tried, so the session stays
+    assert db.execute("SELECT status FROM accounts WHERE username = 'alice'").fetchone()[0] == "active"
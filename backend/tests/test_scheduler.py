@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from modules import tasks
+from services.scheduler_service import UploadScheduler
+
+
+@pytest.fixture
+def scheduler():
+    return UploadScheduler(daily_cap=3, account_cooldown=1800, batch_size=2, stale_job_after=7200)
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Capture upload jobs instead of sending them to the broker"""
+    jobs = []
+    monkeypatch.setattr(tasks.process_video_with_progress, "apply_async",
+                        lambda args, task_id: jobs.append((args, task_id)))
+    return jobs
+
+
+def log_running_job(conn, task_id, username, updated, next_action_at=None):
+    conn.execute('''
+        INSERT INTO task_logs (id, task_type, status, account_username, next_action_at, created_at)
+        VALUES (?, 'upload', 'running', ?, ?, ?)
+    ''', (task_id, username, next_action_at and next_action_at.isoformat(), updated.isoformat()))
+    conn.commit()
+
+
+def publish(conn, username, *links):
+    conn.executemany("INSERT INTO publicationhistory (account_username, video_link) VALUES (?, ?)",
+                     [(username, link) for link in links])
+    conn.commit()
+
+
+def states(plan):
+    return {entry["username"]: entry["state"] for entry in plan}
+
+
+def test_plan_outcomes(db, add_account, scheduler):
+    for link, views in (("v1", 300), ("v2", 200), ("v3", 100)):
+        db.execute("INSERT INTO videos (link, theme, views) VALUES (?, 'cats', ?)", (link, views))
+    db.commit()
+    now = datetime.now()
+
+    add_account("busy")
+    log_running_job(db, "job-busy", "busy", now - timedelta(minutes=5))
+    add_account("cooling_job")  # Quiet for long, but its next step is still scheduled
+    log_running_job(db, "job-cooling", "cooling_job", now - timedelta(hours=3), now + timedelta(minutes=10))
+    add_account("stale")
+    log_running_job(db, "job-stale", "stale", now - timedelta(hours=3), now - timedelta(hours=2, minutes=30))
+    add_account("capped")
+    publish(db, "capped", "x1", "x2", "x3")
+    add_account("cooldown")
+    publish(db, "cooldown", "x1")
+    add_account("ready")
+    add_account("broken", status="error")
+    add_account("empty", theme="dogs")
+    add_account("inactive", active=0)
+
+    plan = {entry["username"]: entry for entry in scheduler.plan()}
+
+    assert states(plan.values()) == {
+        "busy": "busy",
+        "cooling_job": "busy",
+        "stale": "ready",
+        "capped": "daily_cap",
+        "cooldown": "cooldown",
+        "ready": "ready",
+        "broken": "error",
+        "empty": "no_videos",
+    }
+    assert 0 < plan["cooldown"]["remaining_cooldown"] <= 1800
+    assert plan["ready"]["videos"] == ["v1", "v2"]
+    assert plan["capped"]["videos"] == []
+
+
+def test_plan_batch_respects_remaining_cap_and_history(db, add_account):
+    for link, views in (("v1", 300), ("v2", 200), ("v3", 100), ("v4", 50)):
+        db.execute("INSERT INTO videos (link, theme, views) VALUES (?, 'cats', ?)", (link, views))
+    db.commit()
+    add_account("alice")
+    publish(db, "alice", "v1", "v2")
+
+    [entry] = UploadScheduler(daily_cap=3, account_cooldown=0, batch_size=2, stale_job_after=7200).plan()
+
+    assert entry["posts_today"] == 2
+    assert (entry["state"], entry["videos"]) == ("ready", ["v3"])
+
+
+def test_run_once_dispatches_each_account_once(db, add_account, scheduler, queued):
+    db.execute("INSERT INTO videos (link, theme, views) VALUES ('v1', 'cats', 10)")
+    db.commit()
+    add_account("alice", password="pw", **{"2FAKey": "KEY"})
+    add_account("bob")
+
+    first = asyncio.run(scheduler.run_once())
+    second = asyncio.run(scheduler.run_once())
+
+    assert first["dispatched"] == 2
+    assert second["dispatched"] == 0
+    assert states(second["accounts"]) == {"alice": "busy", "bob": "busy"}
+    assert sorted(args[0][0] for args, _ in queued) == ["alice", "bob"]
+    alice_args, alice_task = next(job for job in queued if job[0][0][0] == "alice")
+    assert alice_args[0] == ["alice", "pw", "cats", "KEY"]
+    assert alice_args[1] == ["v1"]
+    row = db.execute("SELECT status, account_username FROM task_logs WHERE id = ?", (alice_task,)).fetchone()
+    assert tuple(row) == ("running", "alice")
+
+
+def test_run_once_dry_run_dispatches_nothing(db, add_account, scheduler, queued):
+    db.execute("INSERT INTO videos (link, theme) VALUES ('v1', 'cats')")
+    db.commit()
+    add_account("alice")
+
+    result = asyncio.run(scheduler.run_once(dry_run=True))
+
+    assert result["dispatched"] == 0
+    assert states(result["accounts"]) == {"alice": "ready"}
+    assert queued == []
+    assert db.execute("SELECT COUNT(*) FROM task_logs").fetchone()[0] == 0
+
+
+def test_failed_dispatch_does_not_block_account(db, add_account, scheduler, monkeypatch):
+    db.execute("INSERT INTO videos (link, theme) VALUES ('v1', 'cats')")
+    db.commit()
+    add_account("alice")
+
+    def broker_down(args, task_id):
+        raise ConnectionError("broker unavailable")
+
+    monkeypatch.setattr(tasks.process_video_with_progress, "apply_async", broker_down)
+    result = asyncio.run(scheduler.run_once())
+
+    assert states(result["accounts"]) == {"alice": "dispatch_failed"}
+    assert db.execute("SELECT status FROM task_logs").fetchone()[0] == "failed"
+    assert scheduler.get_busy_accounts() == set()
@@ -0,0 +1,92 @@
+import json
+import os
+
+import pytest
+
+from modules.uploader import FileSessionStore, SessionStore, SQLiteSessionStore
+
+
+def write_behind_store(store, username, data):
+    """Write a session file the way another process would, keeping the directory mtime"""
+    stat = os.stat(store.root)
+    with open(store.path_for(username), "w") as fp:
+        json.dump(data, fp)
+    os.utime(store.root, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_file_store_save_load_delete(tmp_path):
+    store = FileSessionStore(tmp_path)
+    assert store.info("alice") == {"exists": False, "path": str(tmp_path / "alice.session"),
+                                   "size": 0, "modified": None}
+
+    store.save("alice", {"uuid": "1"})
+    assert store.load("alice") == {"uuid": "1"}
+    assert store.exists("alice")
+    assert store.info("alice")["size"] == os.path.getsize(tmp_path / "alice.session")
+
+    store.delete("alice")
+    assert store.load("alice") is None
+    assert not store.exists("alice")
+    assert not list(tmp_path.glob(".alice.*.tmp"))
+
+
+def test_file_store_sees_changes_that_keep_the_directory_mtime(tmp_path):
+    store = FileSessionStore(tmp_path)
+    store.save("alice", {"uuid": "1"})
+    assert store.info_many(["alice", "bob"])["bob"]["exists"] is False
+
+    # Rewritten in place: same directory entry, new size
+    write_behind_store(store, "alice", {"uuid": "1", "cookies": "x" * 500})
+    assert store.info("alice")["size"] == os.path.getsize(tmp_path / "alice.session")
+
+    # Created within the timestamp granularity of the last scan
+    write_behind_store(store, "bob", {"uuid": "2"})
+    assert store.exists("bob")
+
+    # Removed by another worker
+    stat = os.stat(tmp_path)
+    os.remove(tmp_path / "alice.session")
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert not store.exists("alice")
+
+
+def test_sqlite_store(db):
+    store = SQLiteSessionStore()
+    store.save("alice", {"uuid": "1"})
+
+    info = store.info_many(["alice", "bob"])
+    assert info["alice"]["exists"] and info["alice"]["size"] == len(json.dumps({"uuid": "1"}))
+    assert not info["bob"]["exists"]
+    assert store.load("alice") == {"uuid": "1"}
+
+    store.delete("alice")
+    assert store.load("alice") is None
+
+
+def test_file_store_trusts_settled_index_entries(tmp_path, monkeypatch):
+    writer = FileSessionStore(tmp_path)
+    for username in ("alice", "bob"):
+        writer.save(username, {"uuid": username})
+    hour_ago = os.stat(tmp_path).st_mtime_ns - 3600 * 10 ** 9
+    for path in list(tmp_path.iterdir()) + [tmp_path]:
+        os.utime(path, ns=(hour_ago, hour_ago))
+
+    store = FileSessionStore(tmp_path)
+    stats = []
+    real_stat = os.stat
+    monkeypatch.setattr(os, "stat", lambda path, *args, **kwargs: stats.append(str(path)) or real_stat(path, *args, **kwargs))
+
+    for _ in range(2):
+        info = store.info_many(["alice", "bob", "carol"])
+        assert [info[name]["exists"] for name in ("alice", "bob", "carol")] == [True, True, False]
+    # Only the directory itself is looked at, never the session files
+    assert stats == [str(tmp_path)] * 2
+
+    # A save from another worker renames into the directory, which triggers a rescan
+    writer.save("carol", {"uuid": "carol"})
+    assert store.exists("carol")
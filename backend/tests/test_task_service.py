@@ -0,0 +1,77 @@
+import asyncio
+
+from services.task_service import ProgressWriter, TaskService
+
+
+def log_job(task_id, status="running"):
+    asyncio.run(TaskService.log_task(task_id=task_id, task_type="upload", status=status,
+                                     account_username="alice", message="Starting", total_items=3))
+
+
+def row(conn, task_id):
+    return conn.execute("SELECT status, message, current_item, cooldown_seconds, next_action_at "
+                        "FROM task_logs WHERE id = ?", (task_id,)).fetchone()
+
+
+def test_progress_is_coalesced_and_written_in_one_batch(db):
+    for task_id in ("job-a", "job-b"):
+        log_job(task_id)
+    writer = ProgressWriter(flush_interval=3600)  # Only explicit flushes in this test
+    statements = []
+    db.set_trace_callback(statements.append)
+    try:
+        for i in range(1, 4):
+            writer.record("job-a", 0, f"Video {i}", f"Processing {i}/3")
+        writer.record("job-b", 0, "Video 1", "Processing 1/3", cooldown_seconds=60)
+
+        assert row(db, "job-a")["current_item"] is None  # Nothing written before the flush
+        statements.clear()
+        writer.flush()
+    finally:
+        db.set_trace_callback(None)
+
+    assert tuple(row(db, "job-a"))[:4] == ("running", "Processing 3/3", "Video 3", None)
+    job_b = row(db, "job-b")
+    assert (job_b["current_item"], job_b["cooldown_seconds"]) == ("Video 1", 60)
+    assert job_b["next_action_at"] is not None
+    # One UPDATE per task with the latest state only, then a single commit
+    updates = [sql for sql in statements if "UPDATE task_logs" in sql]
+    assert len(updates) == 2
+    assert sum(1 for sql in statements if sql.strip().upper() == "COMMIT") == 1
+
+
+def test_flush_one_task_leaves_others_pending(db):
+    for task_id in ("job-a", "job-b"):
+        log_job(task_id)
+    writer = ProgressWriter(flush_interval=3600)
+    writer.record("job-a", 0, "Video 1")
+    writer.record("job-b", 0, "Video 2")
+
+    writer.flush("job-a")
+    assert row(db, "job-a")["current_item"] == "Video 1"
+    assert row(db, "job-b")["current_item"] is None
+
+    writer.flush()
+    assert row(db, "job-b")["current_item"] == "Video 2"
+
+
+def test_late_progress_does_not_overwrite_terminal_status(db):
+    log_job("job-a")
+    writer = ProgressWriter(flush_interval=3600)
+    writer.record("job-a", 0, "Video 2", "Processing 2/3")
+
+    asyncio.run(TaskService.update_task_status("job-a", "cancelled", "Task cancelled by user"))
+    writer.flush()
+
+    status, message, *_ = row(db, "job-a")
+    assert (status, message) == ("cancelled", "Task cancelled by user")
+
+
+def test_finished_worker_does_not_overwrite_cancel(db):
+    log_job("job-a")
+
+    asyncio.run(TaskService.update_task_status("job-a", "cancelled", "Task cancelled by user"))
+    asyncio.run(TaskService.update_task_status("job-a", "success", "Upload task completed"))
+
+    status, message, *_ = row(db, "job-a")
+    assert (status, message) == ("cancelled", "Task cancelled by user")
@@ -0,0 +1,35 @@
+from modules import tasks
+
+
+def test_process_video_with_progress_skips_published(db, monkeypatch):
+    db.executemany("INSERT INTO publicationhistory (account_username, video_link) VALUES ('alice', ?)",
+                   [("v1",), ("v3",)])
+    db.commit()
+    steps = []
+    monkeypatch.setattr(tasks.upload_video_step, "delay", lambda *args, **kwargs: steps.append((args, kwargs)))
+
+    account = ["alice", "secret", "cats", None]
+    result = tasks.process_video_with_progress.apply(
+        args=[account, ["v1", "v2", "v3", "v4"], "token", "chat"], task_id="job-1"
+    ).get()
+
+    assert result["total_videos"] == 2
+    assert result["skipped_videos"] == 2
+    assert steps == [((account, ["v2", "v4"], "token", "chat"), {"job_id": "job-1"})]
+    row = db.execute("SELECT status, total_items, message FROM task_logs WHERE id = 'job-1'").fetchone()
+    assert (row["status"], row["total_items"]) == ("running", 2)
+    assert "2 already posted" in row["message"]
+
+
+def test_process_video_with_progress_all_published(db, monkeypatch):
+    db.execute("INSERT INTO publicationhistory (account_username, video_link) VALUES ('alice', 'v1')")
+    db.commit()
+    steps = []
+    monkeypatch.setattr(tasks.upload_video_step, "delay", lambda *args, **kwargs: steps.append((args, kwargs)))
+
+    tasks.process_video_with_progress.apply(
+        args=[["alice", "secret", "cats", None], ["v1"], "token", "chat"], task_id="job-2"
+    ).get()
+
+    assert steps == []
+    assert db.execute("SELECT status FROM task_logs WHERE id = 'job-2'").fetchone()[0] == "success"
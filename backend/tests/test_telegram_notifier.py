@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+
+import pytest
+
+from modules.logger import TELEGRAM_MAX_MESSAGE_LENGTH, TelegramNotifier
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.payload = payload or {}
+        self.text = str(self.payload)
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent = []
+
+    def post(self, url, data, timeout):
+        self.sent.append((url, data["chat_id"], data["text"]))
+        return self.responses.pop(0) if self.responses else FakeResponse(200, {"ok": True})
+
+
+@pytest.fixture
+def notifier(monkeypatch):
+    """A notifier driven step by step from the test instead of its own thread"""
+    notifier = TelegramNotifier(digest_interval=60, chat_interval=0, max_queue=100)
+    monkeypatch.setattr(notifier, "_ensure_thread", lambda: None)
+    notifier._session = FakeSession()
+    return notifier
+
+
+def force_flush(notifier):
+    done = threading.Event()
+    notifier._queue.put(done)
+    notifier._step()
+    return done.is_set()
+
+
+def texts(notifier):
+    return [text for _, _, text in notifier._session.sent]
+
+
+def test_account_messages_are_sent_as_one_digest(notifier):
+    for i in range(3):
+        notifier.notify("token", "chat", f"Uploaded video {i}", account="alice")
+    notifier.notify("token", "chat", "Scheduler started")
+    notifier.notify("", "chat", "No token, dropped")
+
+    notifier._step()
+    assert texts(notifier) == ["Scheduler started"]  # The digest waits for its interval
+
+    assert force_flush(notifier)
+    assert texts(notifier)[1] == "📬 @alice (3 updates)\n\nUploaded video 0\n\nUploaded video 1\n\nUploaded video 2"
+    assert notifier._session.sent[1][0].endswith("/bottoken/sendMessage")
+
+
+def test_digests_are_kept_per_account_and_chat(notifier):
+    notifier.notify("token", "chat", "only one", account="alice")
+    notifier.notify("token", "other", "for another chat", account="alice")
+    notifier.notify("token", "chat", "bob's", account="bob")
+
+    assert force_flush(notifier)
+
+    assert sorted((chat, text) for _, chat, text in notifier._session.sent) == [
+        ("chat", "only one\n\nbob's"),  # Single-message digests go out as is, packed per chat
+        ("other", "for another chat"),
+    ]
+
+
+def test_pack_joins_queued_texts_up_to_the_limit():
+    half = "x" * (TELEGRAM_MAX_MESSAGE_LENGTH // 2)
+    queued = deque(["a", "b", half, half])
+
+    assert TelegramNotifier._pack(queued) == f"a\n\nb\n\n{half}"
+    assert TelegramNotifier._pack(queued) == half
+    assert not queued
+
+
+def test_pack_splits_an_oversized_text():
+    text = "y" * (TELEGRAM_MAX_MESSAGE_LENGTH * 2 + 10)
+    queued = deque([text, "next"])
+
+    parts = []
+    while queued:
+        parts.append(TelegramNotifier._pack(queued))
+
+    assert [len(part) for part in parts] == [TELEGRAM_MAX_MESSAGE_LENGTH, TELEGRAM_MAX_MESSAGE_LENGTH, 16]
+    assert "".join(parts) == text + "\n\nnext"
+
+
+def test_rate_limited_chat_waits_for_retry_after(notifier):
+    notifier._session = FakeSession(FakeResponse(429, {"ok": False, "parameters": {"retry_after": 7}}))
+    notifier.notify("token", "chat", "first")
+
+    notifier._step()
+    chat = ("token", "chat")
+    assert texts(notifier) == ["first"]
+    assert list(notifier._outbox[chat]) == ["first"]  # Put back for a retry
+    assert 6 < notifier._next_send[chat] - notifier._last_send <= 7.1
+
+    notifier.notify("token", "chat", "second")
+    notifier._step()
+    assert texts(notifier) == ["first"]  # Paused, nothing else goes to this chat
+
+    notifier._next_send[chat] = 0  # retry_after has passed
+    assert force_flush(notifier)
+    assert texts(notifier) == ["first", "first\n\nsecond"]
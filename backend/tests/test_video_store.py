@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from modules import video_store as video_store_module
+from modules.video_store import STALE_PIN_SECONDS, VideoStore
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """Fake CDN: each download writes 10 bytes unless the URL says it fails"""
+    urls = []
+
+    def download_video(download_url, output_path):
+        urls.append(download_url)
+        if "broken" in download_url:
+            return False
+        with open(output_path, "wb") as f:
+            f.write(b"x" * 10)
+        return True
+
+    monkeypatch.setattr(video_store_module, "download_video", download_video)
+    return urls
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    return VideoStore(root=str(tmp_path), max_bytes=25)
+
+
+def refs(conn):
+    cursor = conn.execute("SELECT video_link, ref_count FROM video_store ORDER BY video_link")
+    return {link: ref_count for link, ref_count in cursor.fetchall()}
+
+
+def age(conn, video_link, seconds_ago):
+    conn.execute("UPDATE video_store SET last_access = last_access - ? WHERE video_link = ?",
+                 (seconds_ago, video_link))
+    conn.commit()
+
+
+def test_add_open_release_counts_pins(db, store, downloads):
+    path = store.add("a", "https://cdn/a")
+    assert path == store.path_for("a") and os.path.getsize(path) == 10
+    assert store.contains("a") and not store.contains("b")
+
+    # A second account reuses the stored clip without downloading it again
+    assert store.add("a", "https://cdn/a") == path
+    assert store.open("a") == path
+    assert downloads == ["https://cdn/a"]
+    assert refs(db) == {"a": 3}
+
+    for _ in range(4):  # One release too many never goes below zero
+        store.release("a")
+    assert refs(db) == {"a": 0}
+    assert os.path.exists(path)  # Kept for other accounts while under budget
+    assert store.total_bytes() == 10
+
+
+def test_failed_download_stores_nothing(db, store, downloads, tmp_path):
+    assert store.add("a", "https://cdn/broken") is None
+    assert refs(db) == {}
+    assert os.listdir(tmp_path) == []
+
+
+def test_open_forgets_missing_files(db, store, downloads):
+    path = store.add("a", "https://cdn/a")
+    store.release("a")
+    os.remove(path)
+
+    assert store.open("a") is None
+    assert refs(db) == {}
+
+
+def test_release_evicts_lru_unpinned_clips_to_budget(db, store, downloads):
+    store.max_bytes = 100
+    for link in ("a", "b", "c", "d", "e"):
+        store.add(link, f"https://cdn/{link}")
+    for link in ("a", "b", "d", "e"):
+        store.release(link)
+    age(db, "a", 300)
+    age(db, "b", 200)
+    age(db, "c", 400)  # Oldest, but still pinned by an upload
+    age(db, "d", 100)
+
+    store.max_bytes = 25
+    store.release("e")
+
+    # Least recently used unpinned clips go first, only until the store fits
+    assert refs(db) == {"c": 1, "e": 0}
+    assert store.total_bytes() == 20
+    assert not any(os.path.exists(store.path_for(link)) for link in ("a", "b", "d"))
+    assert os.path.exists(store.path_for("c")) and os.path.exists(store.path_for("e"))
+
+
+def test_stale_pins_are_evicted(db, store, downloads):
+    for link in ("a", "b", "c"):
+        store.add(link, f"https://cdn/{link}")
+    age(db, "a", STALE_PIN_SECONDS + 60)  # Its worker died without releasing it
+
+    assert store.evict() == 10
+    assert refs(db) == {"b": 1, "c": 1}
+    assert store.evict() == 0  # Live pins are never evicted, even over budget
@@ -43,10 +43,8 @@ const Videos = () => {
   const fetchMutation = useMutation({
     mutationFn: tasksApi.fetchVideos,
     onSuccess: (data) => {
-      queryClient.invalidateQueries({ queryKey: ['videos'] });
-      queryClient.invalidateQueries({ queryKey: ['stats'] });
-      queryClient.invalidateQueries({ queryKey: ['video-stats'] });
-      toast.success(`${data.message} (${data.videos_count} videos)`);
+      queryClient.invalidateQueries({ queryKey: ['tasks'] });
+      toast.success(data.message);
       setShowFetchForm(false);
     },
     onError: (error: any) => {
@@ -164,7 +164,7 @@ export const tasksApi = {
     return response.data;
   },
 
-  fetchVideos: async (request: FetchRequest): Promise<{ success: boolean; task_id: string; message: string; videos_count: number }> => {
+  fetchVideos: async (request: FetchRequest): Promise<{ success: boolean; task_id: string; message: string; total_accounts: number }> => {
     const response = await api.post('/tasks/fetch', request);
     return response.data;
   },